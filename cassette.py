@@ -0,0 +1,275 @@
+from file_manager import FileManager
+from json_codec import JsonCodec
+from requests.adapters import HTTPAdapter
+from requests.cookies import cookiejar_from_dict
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from http.client import HTTPMessage
+from types import SimpleNamespace
+import requests
+import threading
+import base64
+import io
+import time
+import os
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """Raised when replaying a request that was never recorded."""
+
+
+class Cassette:
+    """
+    Records http responses once, and replays them without the network.
+
+    Works at the transport level: while a cassette is active, every
+    request sent by any `requests` session, including `UserSession`,
+    `InstagramSession` and plain `requests.get` calls, goes through it.
+    Redirects are recorded one hop at a time, so `response.history` is
+    the same when replaying.
+
+    Before anything is saved, cookies, csrf tokens and api keys are
+    replaced with `SCRUBBED`, in the headers, the url and anywhere the
+    same values appear in the response body. Request bodies, such as
+    the login password, are never saved.
+
+    Requests are matched by method and url. When the same request was
+    recorded more than once, the recordings are replayed in order, and
+    the last one is repeated after that. Cookies set by a replayed
+    response are added to the session's cookies as well, with the value
+    `SCRUBBED`, so code that checks for a cookie such as `csrftoken`
+    behaves the same offline.
+
+    Modes:
+        RECORD: Send every request and record the responses, replacing
+            anything recorded before.
+        REPLAY: Only replay, raising `CassetteMiss` for anything that
+            wasn't recorded.
+        AUTO: Replay anything that was recorded, and send and record
+            the rest.
+
+    Examples:
+        with Cassette("cassettes/login.json"):
+            scraper = InstagramScraper()
+            UserManager.create_users(scraper, "instagram")
+
+        with Cassette("cassettes/login.json", Cassette.REPLAY, latency=0.05):
+            ...
+
+    Attributes:
+        filename (str): Path of the cassette file.
+        mode (str): `RECORD`, `REPLAY` or `AUTO`.
+        latency (float | str): Seconds to wait before returning each
+            replayed response, or `RECORDED` to wait as long as the
+            original request took.
+        interactions (list): Every recorded request and response.
+        _positions (dict): Next recording to replay for each request.
+        _lock (threading.Lock): Lock around `interactions`, so requests
+            can be sent from many threads.
+        _send (function): `HTTPAdapter.send` from before the cassette
+            was activated.
+    """
+
+    RECORD = "record"
+    REPLAY = "replay"
+    AUTO = "auto"
+    RECORDED = "recorded"
+
+    SCRUBBED = "SCRUBBED"
+    SENSITIVE_HEADERS = {"cookie", "authorization", "x-csrftoken", "x-ig-www-claim",
+                         "x-instagram-ajax", "proxy-authorization"}
+    SENSITIVE_PARAMETERS = {"apikey", "api_key", "access_token", "token", "key"}
+    # Describe the body as it was sent, not as it is stored
+    DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+    def __init__(self,
+                 filename: str = "cassettes/cassette.json",
+                 mode: str = AUTO,
+                 latency: [float, str] = 0.0,
+                 ):
+        self.filename = filename
+        self.mode = mode
+        self.latency = latency
+        self.interactions = []
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._send = None
+
+        # Recording starts from scratch, so old recordings never replay
+        if mode != self.RECORD and os.path.exists(filename):
+            with open(filename, 'rb') as file:
+                self.interactions = JsonCodec.load(file)["interactions"]
+        elif mode == self.REPLAY:
+            raise FileNotFoundError(f"Cassette '{filename}' has not been recorded.")
+
+        self._recordings = {}
+        for interaction in self.interactions:
+            self._recordings.setdefault(self._get_key(interaction["method"],
+                                                      interaction["url"]), []) \
+                .append(interaction)
+
+    def __enter__(self):
+        self._send = HTTPAdapter.send
+        cassette = self
+
+        def send(adapter, request, **kwargs):
+            return cassette._handle(adapter, request, **kwargs)
+
+        HTTPAdapter.send = send
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        HTTPAdapter.send = self._send
+        self.save()
+
+    def _scrub_url(self, url: str) -> str:
+        """Removes api keys and tokens from the query of `url`."""
+        parts = urlsplit(url)
+        query = [(key, self.SCRUBBED if key.lower() in self.SENSITIVE_PARAMETERS else value)
+                 for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+        return urlunsplit(parts._replace(query=urlencode(sorted(query))))
+
+    def _get_key(self, method: str, url: str) -> tuple:
+        return method.upper(), self._scrub_url(url)
+
+    def _handle(self, adapter, request, **kwargs) -> requests.Response:
+        """Replays or records a single request."""
+        key = self._get_key(request.method, request.url)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if recordings and self.mode != self.RECORD:
+                position = self._positions.get(key, 0)
+                self._positions[key] = position + 1
+                interaction = recordings[min(position, len(recordings) - 1)]
+            else:
+                interaction = None
+
+        if interaction is not None:
+            return self._replay(interaction, request)
+        if self.mode == self.REPLAY:
+            raise CassetteMiss(f"No recording of {request.method} {key[1]} "
+                               f"in '{self.filename}'.", request=request)
+
+        start = time.perf_counter()
+        response = self._send(adapter, request, **kwargs)
+        # Sessions only set `elapsed` after the adapter returns
+        interaction = self._record(request, response, time.perf_counter() - start)
+        with self._lock:
+            self.interactions.append(interaction)
+            self._recordings.setdefault(key, []).append(interaction)
+            # Replaying the same request in this run starts after it
+            self._positions[key] = len(self._recordings[key])
+        return response
+
+    def _record(self, request, response: requests.Response, elapsed: float) -> dict:
+        """Converts a response into a scrubbed interaction."""
+        # Values that must not end up in the cassette, wherever they are
+        secrets = set(response.cookies.values()) | set(request._cookies.values()
+                                                        if request._cookies else ())
+        for name, value in request.headers.items():
+            if name.lower() in self.SENSITIVE_HEADERS:
+                secrets.add(value)
+        for name, value in parse_qsl(urlsplit(request.url).query):
+            if name.lower() in self.SENSITIVE_PARAMETERS:
+                secrets.add(value)
+
+        body = response.content or b""
+        for secret in secrets:
+            if secret and len(secret) >= 8:
+                body = body.replace(secret.encode('utf-8'), self.SCRUBBED.encode('utf-8'))
+
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in self.DROPPED_HEADERS | {"set-cookie"}}
+        interaction = {
+            "method": request.method,
+            "url": self._scrub_url(request.url),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": headers,
+            "cookies": sorted(response.cookies.keys()),
+            "elapsed": elapsed,
+        }
+        try:
+            interaction["body"] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            interaction["body_base64"] = base64.b64encode(body).decode('ascii')
+        return interaction
+
+    def add(self,
+            method: str,
+            url: str,
+            body: [bytes, str] = b"",
+            status: int = 200,
+            headers: dict = None,
+            cookies: list = (),
+            ) -> None:
+        """
+        Adds a response by hand, such as a synthetic payload for a test.
+
+        Args:
+            method: Http method of the request, such as `GET`.
+            url: Full url of the request, including any query.
+            body: Body of the response.
+            status: Status code of the response.
+            headers: Headers of the response.
+            cookies: Names of cookies the response sets.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        interaction = {
+            "method": method.upper(),
+            "url": self._scrub_url(url),
+            "status": status,
+            "reason": requests.status_codes._codes.get(status, ("",))[0].upper(),
+            "headers": headers or {},
+            "cookies": sorted(cookies),
+            "elapsed": 0.0,
+            "body_base64": base64.b64encode(body).decode('ascii'),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+            self._recordings.setdefault(self._get_key(method, url), []).append(interaction)
+
+    def _replay(self, interaction: dict, request) -> requests.Response:
+        """Builds a response from a recorded interaction."""
+        if self.latency == self.RECORDED:
+            time.sleep(interaction["elapsed"])
+        elif self.latency:
+            time.sleep(self.latency)
+
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction["reason"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        if "body_base64" in interaction:
+            response._content = base64.b64decode(interaction["body_base64"])
+        else:
+            response._content = interaction["body"].encode('utf-8')
+        response.cookies = cookiejar_from_dict({name: self.SCRUBBED
+                                                for name in interaction["cookies"]})
+        response.raw = io.BytesIO(response._content)
+        # Sessions copy cookies from the headers of the original
+        # response into their own cookies.
+        headers = HTTPMessage()
+        for name in interaction["cookies"]:
+            headers["Set-Cookie"] = f"{name}={self.SCRUBBED}; Path=/"
+        response.raw._original_response = SimpleNamespace(msg=headers)
+        # The body is already read, so closing the response doesn't
+        # need a connection.
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+    def save(self) -> None:
+        """Writes the recorded interactions to `filename`."""
+        if self.mode == self.REPLAY:
+            return
+
+        directory = self.filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+        with self._lock, open(self.filename, 'wb') as file:
+            JsonCodec.dump({"interactions": self.interactions}, file)
@@ -0,0 +1,317 @@
+from file_manager import FileManager
+from json_codec import JsonCodec
+from response_archive import ResponseArchive
+import argparse
+import struct
+import gzip
+import glob
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CompressedArchive:
+    """
+    Reads single records out of a compressed archive file.
+
+    Records are grouped into blocks, which are compressed on their own
+    with zstd, or gzip if `zstandard` isn't installed. An index of where
+    each block starts, and which block and position each record is in,
+    is stored at the end of the file. Reading a record only reads and
+    decompresses the block it's in.
+
+    File layout:
+        Header: `MAGIC`, then `b"z"` for zstd or `b"g"` for gzip.
+        Blocks: Compressed blocks, one after the other.
+        Index: Compressed json of the block positions and records.
+        Footer: Offset and length of the index as two unsigned 64-bit
+            integers, then `MAGIC`.
+
+    Examples:
+        archive = CompressedArchive("json/archive.igz")
+        archive.read(CompressedArchive.USER, "instagram")
+        archive.keys(CompressedArchive.POST)
+
+    Attributes:
+        filename (str): Path of the archive file.
+        compression (bytes): `ZSTD` or `GZIP`.
+        _blocks (list): `[offset, length]` of each compressed block.
+        _records (dict): Each kind of record, and the
+            `[block, start, length]` of each of its keys.
+        _cache (tuple): Number and contents of the last block read, as
+            records are often read in the order they were written.
+    """
+
+    MAGIC = b"IGARC1"
+    ZSTD = b"z"
+    GZIP = b"g"
+    FOOTER = struct.Struct("<QQ")
+
+    USER = ResponseArchive.USER
+    POST = ResponseArchive.POST
+
+    def __init__(self, filename: str = "json/archive.igz"):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        header = self._file.read(len(self.MAGIC) + 1)
+        if header[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"'{filename}' is not a compressed archive.")
+        self.compression = header[len(self.MAGIC):]
+
+        self._file.seek(-(self.FOOTER.size + len(self.MAGIC)), os.SEEK_END)
+        index_offset, index_length = self.FOOTER.unpack(self._file.read(self.FOOTER.size))
+        self._file.seek(index_offset)
+        index = JsonCodec.loads(self.decompress(self._file.read(index_length),
+                                                self.compression))
+        self._blocks = index["blocks"]
+        self._records = index["records"]
+        self._cache = (None, b"")
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.values())
+
+    def __contains__(self, item: tuple):
+        kind, key = item
+        return key in self._records.get(kind, {})
+
+    @staticmethod
+    def compress(data: bytes, compression: bytes) -> bytes:
+        """Compresses `data` with `ZSTD` or `GZIP`."""
+        if compression == CompressedArchive.ZSTD:
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=9, mtime=0)
+
+    @staticmethod
+    def decompress(data: bytes, compression: bytes) -> bytes:
+        """Decompresses `data` that was compressed with `compress`."""
+        if compression == CompressedArchive.ZSTD:
+            if not zstandard:
+                raise ImportError("zstandard must be installed to read zstd archives.")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _read_block(self, block: int) -> bytes:
+        """Reads and decompresses a single block."""
+        if self._cache[0] != block:
+            offset, length = self._blocks[block]
+            self._file.seek(offset)
+            self._cache = (block, self.decompress(self._file.read(length),
+                                                  self.compression))
+        return self._cache[1]
+
+    def read(self, kind: str, key: str) -> [bytes, None]:
+        """Gets the raw json of a record, or `None` if it isn't archived."""
+        location = self._records.get(kind, {}).get(key)
+        if location is None:
+            return None
+
+        block, start, length = location
+        return self._read_block(block)[start:start + length]
+
+    def load(self, kind: str, key: str) -> [dict, None]:
+        """Gets the decoded json of a record, or `None` if it isn't archived."""
+        content = self.read(kind, key)
+        return None if content is None else JsonCodec.loads(content)
+
+    def keys(self, kind: str) -> list:
+        """Gets the key of every record of `kind`."""
+        return list(self._records.get(kind, {}))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CompressedArchiveWriter:
+    """
+    Writes records into a new compressed archive file.
+
+    See `CompressedArchive` for the layout of the file. Nothing can be
+    read from the file until `close` has written the index.
+
+    Examples:
+        with CompressedArchiveWriter("json/archive.igz") as writer:
+            writer.write(CompressedArchive.USER, "instagram", content)
+
+    Attributes:
+        filename (str): Path of the archive file.
+        block_size (int): Uncompressed bytes to put in each block.
+            Larger blocks compress better, but more has to be
+            decompressed to read a single record.
+        compression (bytes): `CompressedArchive.ZSTD` if `zstandard` is
+            installed, otherwise `CompressedArchive.GZIP`.
+        _blocks (list): `[offset, length]` of each written block.
+        _records (dict): Each kind of record, and the
+            `[block, start, length]` of each of its keys.
+        _pending (list): Records waiting to be written in the next
+            block.
+        _pending_size (int): Total bytes in `_pending`.
+    """
+
+    def __init__(self,
+                 filename: str = "json/archive.igz",
+                 block_size: int = 1024 * 1024,
+                 compression: bytes = None,
+                 ):
+        self.filename = filename
+        self.block_size = block_size
+        if compression is None:
+            compression = CompressedArchive.ZSTD if zstandard else CompressedArchive.GZIP
+        self.compression = compression
+
+        directory = filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+
+        self._blocks = []
+        self._records = {}
+        self._pending = []
+        self._pending_size = 0
+        # Written to a temporary file, so an existing archive is only
+        # replaced once the new one is complete.
+        self._file = open(f"{filename}.tmp", 'wb')
+        self._file.write(CompressedArchive.MAGIC + compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(f"{self.filename}.tmp")
+
+    def write(self, kind: str, key: str, content: bytes) -> None:
+        """Adds the raw json `content` of a record to the archive."""
+        self._records.setdefault(kind, {})[key] = [len(self._blocks),
+                                                   self._pending_size,
+                                                   len(content)]
+        self._pending.append(content)
+        self._pending_size += len(content)
+        if self._pending_size >= self.block_size:
+            self._write_block()
+
+    def _write_block(self) -> None:
+        """Compresses and writes the pending records as a block."""
+        if not self._pending:
+            return
+
+        block = CompressedArchive.compress(b"".join(self._pending), self.compression)
+        self._blocks.append([self._file.tell(), len(block)])
+        self._file.write(block)
+        self._pending = []
+        self._pending_size = 0
+
+    def close(self) -> None:
+        """Writes the last block and the index, and closes the file."""
+        self._write_block()
+        index = CompressedArchive.compress(
+            JsonCodec.dumps({"blocks": self._blocks, "records": self._records}),
+            self.compression
+        )
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(CompressedArchive.FOOTER.pack(index_offset, len(index)))
+        self._file.write(CompressedArchive.MAGIC)
+        self._file.close()
+        os.replace(f"{self.filename}.tmp", self.filename)
+
+
+def convert(output: str,
+            users_dir: str = "json/users",
+            posts_dir: str = "json/posts",
+            archive_dir: str = None,
+            block_size: int = 1024 * 1024,
+            remove: bool = False,
+            ) -> None:
+    """
+    Converts saved users and posts into a single compressed archive.
+
+    Users are stored under their username, and posts under their
+    shortcode, taken from the `[USERNAME]_post_[SHORTCODE].json`
+    filenames.
+
+    Args:
+        output: Path of the archive file to create.
+        users_dir: Directory of user json files.
+        posts_dir: Directory of post json files.
+        archive_dir: Directory of a `ResponseArchive` to convert as
+            well, if given.
+        block_size: Uncompressed bytes to put in each block.
+        remove: Set to `True` to delete the json files once the archive
+            has been written.
+    """
+    filepaths = []
+    original_size = 0
+    with CompressedArchiveWriter(output, block_size) as writer:
+        if archive_dir:
+            response_archive = ResponseArchive(archive_dir)
+            for kind in (ResponseArchive.USER, ResponseArchive.POST):
+                for key in sorted(response_archive.keys(kind)):
+                    content = response_archive.read(kind, key)
+                    original_size += len(content)
+                    writer.write(kind, key, content)
+            response_archive.close()
+
+        for kind, pattern in ((CompressedArchive.USER, f"{users_dir}/*.json"),
+                              (CompressedArchive.POST, f"{posts_dir}/*.json")):
+            # Sorted, so similar records end up in the same blocks
+            for filepath in sorted(glob.glob(pattern)):
+                key = os.path.basename(filepath)[:-len(".json")]
+                if kind == CompressedArchive.POST:
+                    key = key.rpartition("_post_")[2]
+                with open(filepath, 'rb') as file:
+                    content = file.read()
+                original_size += len(content)
+                writer.write(kind, key, content)
+                filepaths.append(filepath)
+
+    archive = CompressedArchive(output)
+    print(f"Archived {len(archive)} records into '{output}': "
+          f"{original_size / 1024:.0f}KB -> {os.path.getsize(output) / 1024:.0f}KB "
+          f"({'zstd' if archive.compression == CompressedArchive.ZSTD else 'gzip'})")
+    archive.close()
+
+    if remove:
+        for filepath in filepaths:
+            os.remove(filepath)
+        print(f"Removed {len(filepaths)} json files.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or read compressed archives "
+                                                 "of saved users and posts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="Convert json/users and json/posts into an archive."
+    )
+    convert_parser.add_argument("--output", default="json/archive.igz")
+    convert_parser.add_argument("--users", default="json/users")
+    convert_parser.add_argument("--posts", default="json/posts")
+    convert_parser.add_argument("--archive", default=None,
+                                help="ResponseArchive directory to convert as well.")
+    convert_parser.add_argument("--block-size", type=int, default=1024 * 1024)
+    convert_parser.add_argument("--remove", action="store_true",
+                                help="Delete the json files once converted.")
+
+    get_parser = subparsers.add_parser("get", help="Print a single record.")
+    get_parser.add_argument("kind", choices=[CompressedArchive.USER, CompressedArchive.POST])
+    get_parser.add_argument("key", help="Username or shortcode.")
+    get_parser.add_argument("--input", default="json/archive.igz")
+
+    arguments = parser.parse_args()
+    if arguments.command == "convert":
+        convert(arguments.output, arguments.users, arguments.posts,
+                arguments.archive, arguments.block_size, arguments.remove)
+    else:
+        compressed_archive = CompressedArchive(arguments.input)
+        record = compressed_archive.read(arguments.kind, arguments.key)
+        if record is None:
+            print(f"No {arguments.kind} '{arguments.key}' in '{arguments.input}'.")
+        else:
+            print(record.decode('utf-8'))
+        compressed_archive.close()
@@ -0,0 +1,250 @@
+from file_manager import FileManager
+from work_queue import WorkQueue
+import threading
+import sqlite3
+import time
+
+
+class CrawlFrontier(WorkQueue):
+    """
+    Persistent queue of usernames and shortcodes waiting to be crawled.
+
+    `WorkQueue` backend for workers on a single machine.
+
+    Items are stored in SQLite, so a crawl that stops part way through
+    can carry on from where it was. Each item is stored once per kind,
+    and moves through these states:
+        pending: Waiting to be claimed.
+        in-flight: Claimed by a worker, which has `lease_timeout`
+            seconds to complete or fail it before it can be claimed
+            again.
+        done: Crawled successfully.
+        failed: Failed `max_attempts` times, or could not be crawled.
+
+    Examples:
+        frontier = CrawlFrontier()
+        frontier.add(CrawlFrontier.USERNAME, ["instagram", "natgeo"])
+        for username in frontier.claim(CrawlFrontier.USERNAME):
+            ...
+            frontier.complete(CrawlFrontier.USERNAME, username)
+
+    Attributes:
+        filename (str): Path of the SQLite database file.
+        lease_timeout (int): Seconds before an in-flight item can be
+            claimed again.
+        max_attempts (int): Most times an item is claimed before it's
+            marked as failed.
+        _connection (sqlite3.Connection): Connection to the database.
+        _lock (threading.Lock): Lock around `_connection`, so the
+            frontier can be shared between threads.
+    """
+
+    def __init__(self,
+                 filename: str = "crawl/frontier.db",
+                 lease_timeout: int = 300,
+                 max_attempts: int = 3,
+                 ):
+        self.filename = filename
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+        directory = filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+
+        self._lock = threading.Lock()
+        # Transactions are started by hand, so claims can lock the
+        # database before reading from it.
+        self._connection = sqlite3.connect(filename,
+                                           timeout=30,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        # WAL lets other processes read while a worker is writing
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "kind TEXT NOT NULL, "
+            "item TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "priority INTEGER NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT, "
+            "claimed REAL, "
+            "updated REAL NOT NULL, "
+            "PRIMARY KEY (kind, item))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS items_queue "
+            "ON items (kind, state, priority DESC)"
+        )
+
+    def add(self, kind: str, items: list, priority: int = 0) -> int:
+        """
+        Adds `items` to the frontier, skipping any that are already in it.
+
+        Items that are already pending are moved up to `priority` if it
+        is higher than their current one.
+
+        Args:
+            kind: `USERNAME` or `SHORTCODE`.
+            items: Usernames or shortcodes to add.
+            priority: Items with a higher priority are claimed first.
+
+        Returns:
+            How many of `items` were new.
+        """
+        now = time.time()
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO items (kind, item, state, priority, updated) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(kind, item, self.PENDING, priority, now) for item in items]
+                )
+                added = self._connection.total_changes - before
+                self._connection.executemany(
+                    "UPDATE items SET priority = ? "
+                    "WHERE kind = ? AND item = ? AND state = ? AND priority < ?",
+                    [(priority, kind, item, self.PENDING, priority) for item in items]
+                )
+                self._connection.execute("COMMIT")
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        return added
+
+    def claim(self, kind: str, limit: int = 10) -> list:
+        """
+        Claims up to `limit` items to crawl, highest priority first.
+
+        Items left in-flight for longer than `lease_timeout` are claimed
+        again, so items held by a worker that crashed are not lost. Once
+        an item has been claimed `max_attempts` times, it is marked as
+        failed instead, so an item that keeps crashing its worker is not
+        claimed forever.
+
+        Args:
+            kind: `USERNAME` or `SHORTCODE`.
+            limit: Most items to claim.
+
+        Returns:
+            `list` of claimed items. Empty when there is nothing left.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                expiry = now - self.lease_timeout
+                self._connection.execute(
+                    "UPDATE items SET state = ?, error = COALESCE(error, ?), updated = ? "
+                    "WHERE kind = ? AND state = ? AND claimed < ? AND attempts >= ?",
+                    (self.FAILED, "Lease expired", now,
+                     kind, self.IN_FLIGHT, expiry, self.max_attempts)
+                )
+                items = [row[0] for row in self._connection.execute(
+                    "SELECT item FROM items WHERE kind = ? "
+                    "AND (state = ? OR (state = ? AND claimed < ? AND attempts < ?)) "
+                    "ORDER BY priority DESC, rowid LIMIT ?",
+                    (kind, self.PENDING, self.IN_FLIGHT, expiry, self.max_attempts, limit)
+                )]
+                self._connection.executemany(
+                    "UPDATE items SET state = ?, attempts = attempts + 1, "
+                    "claimed = ?, updated = ? WHERE kind = ? AND item = ?",
+                    [(self.IN_FLIGHT, now, now, kind, item) for item in items]
+                )
+                self._connection.execute("COMMIT")
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        return items
+
+    def heartbeat(self, kind: str, items: list) -> None:
+        """Renews the lease on in-flight `items`."""
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE items SET claimed = ? WHERE kind = ? AND item = ? AND state = ?",
+                [(now, kind, item, self.IN_FLIGHT) for item in items]
+            )
+
+    def complete(self, kind: str, item: str) -> None:
+        """Marks `item` as successfully crawled."""
+        self._set_state(kind, item, self.DONE)
+
+    def fail(self, kind: str, item: str, error: str = "", retry: bool = True) -> None:
+        """
+        Records a failed attempt at crawling `item`.
+
+        The item goes back to pending, unless it has already been tried
+        `max_attempts` times or `retry` is `False`.
+
+        Args:
+            kind: `USERNAME` or `SHORTCODE`.
+            item: Username or shortcode that failed.
+            error: Reason the item failed.
+            retry: Set to `False` when trying again will not help, such
+                as when an account does not exist.
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE items SET state = CASE WHEN ? AND attempts < ? "
+                "THEN ? ELSE ? END, error = ?, updated = ? "
+                "WHERE kind = ? AND item = ?",
+                (retry, self.max_attempts, self.PENDING, self.FAILED,
+                 error, time.time(), kind, item)
+            )
+
+    def _set_state(self, kind: str, item: str, state: str) -> None:
+        """Sets the state of a single item."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE items SET state = ?, updated = ? WHERE kind = ? AND item = ?",
+                (state, time.time(), kind, item)
+            )
+
+    def recover(self) -> int:
+        """
+        Moves every in-flight item back to pending.
+
+        Only call this when no other workers are using the frontier,
+        such as when restarting a single crawl after a crash.
+
+        Returns:
+            How many items were moved back.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "UPDATE items SET state = ?, updated = ? WHERE state = ?",
+                (self.PENDING, time.time(), self.IN_FLIGHT)
+            ).rowcount
+
+    def retry_failed(self, kind: str) -> int:
+        """Moves every failed item of `kind` back to pending."""
+        with self._lock:
+            return self._connection.execute(
+                "UPDATE items SET state = ?, attempts = 0, updated = ? "
+                "WHERE kind = ? AND state = ?",
+                (self.PENDING, time.time(), kind, self.FAILED)
+            ).rowcount
+
+    def counts(self, kind: str) -> dict:
+        """Gets how many items of `kind` are in each state."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM items WHERE kind = ? GROUP BY state",
+                (kind,)
+            ).fetchall()
+
+        counts = {self.PENDING: 0, self.IN_FLIGHT: 0, self.DONE: 0, self.FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def close(self) -> None:
+        """Closes the connection to the database."""
+        with self._lock:
+            self._connection.close()
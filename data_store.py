@@ -0,0 +1,310 @@
+from file_manager import FileManager
+import threading
+import sqlite3
+import time
+
+
+class DataStore:
+    """
+    SQLite database of scraped users, posts, comments, media and likes.
+
+    Each kind of object has its own table, so questions such as which
+    posts an account commented on are a single indexed query instead of
+    reading every saved json file. Saving an object that is already
+    stored updates its row.
+
+    Objects are buffered and written in batches of `batch_size`, each
+    batch in one transaction with `executemany`. Call `flush` or
+    `close` to write anything still buffered.
+
+    Can be passed to `UserManager` and `PostManager` as a `store`, so
+    everything they create is saved here.
+
+    Examples:
+        store = DataStore()
+        PostManager(session, store=store).get_user_posts()
+        store.close()
+        DataStore().get_commented_posts("instagram")
+
+    Attributes:
+        filename (str): Path of the SQLite database file.
+        batch_size (int): Objects to buffer before writing them.
+        _users (list): `User` objects waiting to be written.
+        _posts (list): `Post` objects waiting to be written.
+        _connection (sqlite3.Connection): Connection to the database.
+        _lock (threading.Lock): Lock around `_connection` and the
+            buffers, so the store can be shared between threads.
+    """
+
+    # Columns of each table, named after the attribute they're read from
+    USER_COLUMNS = (
+        "username", "id", "facebook_id", "name", "bio", "website",
+        "followers", "following", "category", "pronouns", "is_private",
+        "is_verified", "is_business_account", "is_professional_account",
+        "is_recent", "total_timeline_posts", "total_video_posts",
+        "profile_pic", "profile_pic_hd", "business_email",
+        "business_phone", "business_category",
+    )
+    POST_COLUMNS = (
+        "pk", "id", "short_code", "username", "name", "media_type",
+        "media_count", "likes_total", "comments_total", "views_total",
+        "duration", "created", "access_caption", "comments_disabled",
+        "likes_and_views_disabled",
+    )
+    COMMENT_COLUMNS = (
+        "pk", "username", "user_id", "text", "created", "media_type",
+        "likes_total",
+    )
+    MEDIA_COLUMNS = (
+        "pk", "media_type", "width", "height", "original_width",
+        "original_height", "url", "thumbnail_url", "duration", "codec",
+    )
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users ("
+        "username TEXT PRIMARY KEY, id TEXT, facebook_id TEXT, name TEXT, "
+        "bio TEXT, website TEXT, followers INTEGER, following INTEGER, "
+        "category TEXT, pronouns TEXT, is_private INTEGER, "
+        "is_verified INTEGER, is_business_account INTEGER, "
+        "is_professional_account INTEGER, is_recent INTEGER, "
+        "total_timeline_posts INTEGER, total_video_posts INTEGER, "
+        "profile_pic TEXT, profile_pic_hd TEXT, business_email TEXT, "
+        "business_phone TEXT, business_category TEXT, "
+        "updated REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS users_id ON users (id)",
+
+        "CREATE TABLE IF NOT EXISTS posts ("
+        "pk TEXT PRIMARY KEY, id TEXT, short_code TEXT UNIQUE, "
+        "username TEXT NOT NULL, name TEXT, media_type INTEGER, "
+        "media_count INTEGER, likes_total INTEGER, comments_total INTEGER, "
+        "views_total INTEGER, duration REAL, created INTEGER, caption TEXT, "
+        "access_caption TEXT, comments_disabled INTEGER, "
+        "likes_and_views_disabled INTEGER, updated REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS posts_username ON posts (username, created)",
+        "CREATE INDEX IF NOT EXISTS posts_created ON posts (created)",
+
+        "CREATE TABLE IF NOT EXISTS comments ("
+        "pk TEXT PRIMARY KEY, post_pk TEXT NOT NULL, username TEXT NOT NULL, "
+        "user_id TEXT, text TEXT, created INTEGER, media_type INTEGER, "
+        "likes_total INTEGER)",
+        "CREATE INDEX IF NOT EXISTS comments_post ON comments (post_pk, created)",
+        "CREATE INDEX IF NOT EXISTS comments_username ON comments (username, created)",
+
+        "CREATE TABLE IF NOT EXISTS media ("
+        "post_pk TEXT NOT NULL, position INTEGER NOT NULL, pk TEXT, "
+        "media_type INTEGER, width INTEGER, height INTEGER, "
+        "original_width INTEGER, original_height INTEGER, url TEXT, "
+        "thumbnail_url TEXT, duration REAL, codec TEXT, "
+        "PRIMARY KEY (post_pk, position))",
+        "CREATE INDEX IF NOT EXISTS media_pk ON media (pk)",
+
+        "CREATE TABLE IF NOT EXISTS likes ("
+        "post_pk TEXT NOT NULL, username TEXT NOT NULL, "
+        "PRIMARY KEY (post_pk, username)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS likes_username ON likes (username)",
+    )
+
+    def __init__(self, filename: str = "data/instagram.db", batch_size: int = 500):
+        self.filename = filename
+        self.batch_size = batch_size
+        self._users = []
+        self._posts = []
+
+        directory = filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+
+        self._lock = threading.Lock()
+        # Transactions are started by hand, so each batch is one write
+        self._connection = sqlite3.connect(filename,
+                                           timeout=30,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self._connection.execute(statement)
+
+        self._user_sql = self._create_upsert("users", self.USER_COLUMNS + ("updated",),
+                                             ("username",))
+        self._post_sql = self._create_upsert("posts",
+                                             self.POST_COLUMNS + ("caption", "updated"),
+                                             ("pk",))
+        self._comment_sql = self._create_upsert("comments",
+                                                ("post_pk",) + self.COMMENT_COLUMNS,
+                                                ("pk",))
+        self._media_sql = self._create_upsert("media",
+                                              ("post_pk", "position") + self.MEDIA_COLUMNS,
+                                              ("post_pk", "position"))
+
+    @staticmethod
+    def _create_upsert(table: str, columns: tuple, keys: tuple) -> str:
+        """Creates an insert that updates the row if `keys` already exist."""
+        return (f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                + ", ".join(f"{column} = excluded.{column}"
+                            for column in columns if column not in keys))
+
+    def add_user(self, user) -> None:
+        """Buffers a `User` to be written."""
+        with self._lock:
+            self._users.append(user)
+            full = len(self._users) >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_post(self, post) -> None:
+        """
+        Buffers a `Post` to be written, with its comments, media, likes
+        and any `User` objects attached to them.
+        """
+        if getattr(post, "pk", None) is None:
+            # Invalid posts are left without any attributes
+            return
+
+        with self._lock:
+            self._posts.append(post)
+            full = len(self._posts) >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_users(self, users: list) -> None:
+        """Writes many `User` objects at once."""
+        with self._lock:
+            self._users.extend(users)
+        self.flush()
+
+    def add_posts(self, posts: list) -> None:
+        """Writes many `Post` objects at once."""
+        with self._lock:
+            self._posts.extend(post for post in posts
+                               if getattr(post, "pk", None) is not None)
+        self.flush()
+
+    def flush(self) -> None:
+        """Writes every buffered object in a single transaction."""
+        with self._lock:
+            users, self._users = self._users, []
+            posts, self._posts = self._posts, []
+            if not users and not posts:
+                return
+
+            now = time.time()
+            user_rows = {}
+            post_rows = []
+            comment_rows = []
+            media_rows = []
+            like_rows = []
+            for post in posts:
+                post_pk = str(post.pk)
+                post_rows.append(tuple(getattr(post, column) for column in self.POST_COLUMNS)
+                                 + (post.caption.text, now))
+                for comment in post.comments.values():
+                    comment_rows.append((post_pk,) + tuple(
+                        getattr(comment, column) for column in self.COMMENT_COLUMNS
+                    ))
+                    if comment.user:
+                        users.append(comment.user)
+                for position, media in enumerate(post.media):
+                    media_rows.append((post_pk, position) + tuple(
+                        getattr(media, column) for column in self.MEDIA_COLUMNS
+                    ))
+                for username, user in post.likes.items():
+                    like_rows.append((post_pk, username))
+                    if user:
+                        users.append(user)
+
+            for user in users:
+                # Only the last copy of each account is written
+                user_rows[user.username] = tuple(
+                    getattr(user, column) for column in self.USER_COLUMNS
+                ) + (now,)
+
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(self._user_sql, user_rows.values())
+                self._connection.executemany(self._post_sql, post_rows)
+                self._connection.executemany(self._comment_sql, comment_rows)
+                self._connection.executemany(self._media_sql, media_rows)
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO likes (post_pk, username) VALUES (?, ?)",
+                    like_rows
+                )
+                self._connection.execute("COMMIT")
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql: str, parameters: tuple) -> list:
+        """Runs a read query, after writing anything buffered."""
+        self.flush()
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def get_user_posts(self, username: str) -> list:
+        """Gets the shortcode of every stored post by `username`, newest first."""
+        return [row[0] for row in self._query(
+            "SELECT short_code FROM posts WHERE username = ? ORDER BY created DESC",
+            (username,)
+        )]
+
+    def get_commented_posts(self, username: str) -> list:
+        """
+        Gets the posts `username` commented on.
+
+        Returns:
+            `list` of `(short_code, comment text)` pairs, newest comment
+            first.
+        """
+        return self._query(
+            "SELECT posts.short_code, comments.text FROM comments "
+            "JOIN posts ON posts.pk = comments.post_pk "
+            "WHERE comments.username = ? ORDER BY comments.created DESC",
+            (username,)
+        )
+
+    def get_liked_posts(self, username: str) -> list:
+        """Gets the shortcode of every stored post `username` liked."""
+        return [row[0] for row in self._query(
+            "SELECT posts.short_code FROM likes "
+            "JOIN posts ON posts.pk = likes.post_pk WHERE likes.username = ?",
+            (username,)
+        )]
+
+    def get_post_metrics(self, usernames: list = None) -> list:
+        """
+        Gets the metrics of stored posts, for `Engagement.from_store`.
+
+        Args:
+            usernames: Only get the posts of these accounts, if given.
+
+        Returns:
+            `list` of `(username, created, likes_total, comments_total,
+            views_total, media_type, followers)` rows, grouped by
+            account.
+        """
+        sql = ("SELECT posts.username, posts.created, posts.likes_total, "
+               "posts.comments_total, posts.views_total, posts.media_type, "
+               "users.followers FROM posts "
+               "LEFT JOIN users ON users.username = posts.username")
+        parameters = ()
+        if usernames is not None:
+            sql += f" WHERE posts.username IN ({', '.join('?' * len(usernames))})"
+            parameters = tuple(usernames)
+
+        return self._query(sql + " ORDER BY posts.username, posts.created", parameters)
+
+    def counts(self) -> dict:
+        """Gets how many rows are in each table."""
+        self.flush()
+        with self._lock:
+            return {table: self._connection.execute(
+                f"SELECT COUNT(*) FROM {table}"
+            ).fetchone()[0] for table in ("users", "posts", "comments", "media", "likes")}
+
+    def close(self) -> None:
+        """Writes anything buffered and closes the connection."""
+        self.flush()
+        with self._lock:
+            self._connection.close()
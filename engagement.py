@@ -0,0 +1,329 @@
+import numpy as np
+
+
+class Engagement:
+    """
+    Engagement statistics for the posts of many accounts at once.
+
+    Post metrics are held in NumPy arrays, sorted by account and then by
+    creation time, so every statistic is worked out for all accounts in
+    a few array operations instead of a loop over `Post` objects. The
+    posts of account `i` are `[offsets[i]:offsets[i + 1]]` in each array,
+    the same layout `SocialGraph` uses. Missing values, such as hidden
+    like counts or accounts without a follower count, are `nan`.
+
+    Examples:
+        engagement = Engagement.from_posts(posts, users)
+        engagement.summary()["median_engagement"]
+        engagement.rolling_mean(engagement.engagement_rate(), window=10)
+        engagement.outliers()
+
+    Attributes:
+        usernames (list): Username of each account id.
+        ids (dict): Id of each username.
+        followers (numpy.ndarray): Followers of each account.
+        offsets (numpy.ndarray): Where each account's posts start.
+        accounts (numpy.ndarray): Account id of each post.
+        created (numpy.ndarray): Timestamp each post was created.
+        likes (numpy.ndarray): Likes on each post.
+        comments (numpy.ndarray): Comments on each post.
+        views (numpy.ndarray): Views of each post. Only videos have
+            views.
+        media_types (numpy.ndarray): `Post.media_type` of each post.
+    """
+
+    def __init__(self,
+                 usernames: list,
+                 followers,
+                 accounts,
+                 created,
+                 likes,
+                 comments,
+                 views,
+                 media_types,
+                 ):
+        self.usernames = list(usernames)
+        self.ids = {username: account_id for account_id, username in enumerate(self.usernames)}
+        self.followers = np.asarray(followers, dtype=np.float64)
+
+        accounts = np.asarray(accounts, dtype=np.int32)
+        created = np.asarray(created, dtype=np.int64)
+        order = np.lexsort((created, accounts))
+        self.accounts = accounts[order]
+        self.created = created[order]
+        self.likes = np.asarray(likes, dtype=np.float64)[order]
+        self.comments = np.asarray(comments, dtype=np.float64)[order]
+        self.views = np.asarray(views, dtype=np.float64)[order]
+        self.media_types = np.asarray(media_types, dtype=np.int16)[order]
+
+        self.offsets = np.zeros(len(self.usernames) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.accounts, minlength=len(self.usernames)),
+                  out=self.offsets[1:])
+
+    def __len__(self):
+        """Total amount of posts."""
+        return len(self.accounts)
+
+    @staticmethod
+    def _to_float(value) -> float:
+        return np.nan if value is None else float(value)
+
+    @staticmethod
+    def from_posts(posts: list, users: list = ()) -> "Engagement":
+        """
+        Collects the metrics of `Post` objects.
+
+        Args:
+            posts: `Post` objects of any amount of accounts.
+            users: `User` objects to take follower counts from.
+                Accounts without one have a `nan` engagement rate.
+
+        Returns:
+            `Engagement` of every account in `posts`.
+        """
+        followers = {user.username: user.followers for user in users}
+        ids = {}
+        accounts, created, likes, comments, views, media_types = [], [], [], [], [], []
+        for post in posts:
+            if getattr(post, "pk", None) is None:
+                # Invalid posts are left without any attributes
+                continue
+            accounts.append(ids.setdefault(post.username, len(ids)))
+            created.append(post.created or 0)
+            likes.append(Engagement._to_float(post.likes_total))
+            comments.append(Engagement._to_float(post.comments_total))
+            views.append(Engagement._to_float(post.views_total))
+            media_types.append(post.media_type or 0)
+
+        return Engagement(ids,
+                          [Engagement._to_float(followers.get(username)) for username in ids],
+                          accounts, created, likes, comments, views, media_types)
+
+    @staticmethod
+    def from_store(store, usernames: list = None) -> "Engagement":
+        """
+        Collects the metrics of posts saved in a `DataStore`.
+
+        Args:
+            store: `DataStore` to read the posts from.
+            usernames: Only read the posts of these accounts, if given.
+
+        Returns:
+            `Engagement` of every account with stored posts.
+        """
+        rows = store.get_post_metrics(usernames)
+        ids = {}
+        followers = []
+        accounts = []
+        for row in rows:
+            account_id = ids.get(row[0])
+            if account_id is None:
+                account_id = ids[row[0]] = len(ids)
+                followers.append(Engagement._to_float(row[6]))
+            accounts.append(account_id)
+
+        columns = list(zip(*rows)) or [()] * 7
+        return Engagement(ids, followers, accounts,
+                          [value or 0 for value in columns[1]],
+                          [Engagement._to_float(value) for value in columns[2]],
+                          [Engagement._to_float(value) for value in columns[3]],
+                          [Engagement._to_float(value) for value in columns[4]],
+                          [value or 0 for value in columns[5]])
+
+    def engagement_rate(self) -> np.ndarray:
+        """
+        Gets the engagement rate of each post.
+
+        Returns:
+            `numpy.ndarray` of likes plus comments, divided by the
+            followers of the account.
+        """
+        followers = self.followers[self.accounts]
+        interactions = np.nan_to_num(self.likes) + np.nan_to_num(self.comments)
+        rate = np.full(len(self), np.nan)
+        np.divide(interactions, followers, out=rate, where=followers > 0)
+        rate[np.isnan(self.likes) & np.isnan(self.comments)] = np.nan
+        return rate
+
+    def percentile(self, values: np.ndarray, q: float) -> np.ndarray:
+        """
+        Gets the `q`th percentile of `values` for every account.
+
+        Uses linear interpolation, the same as `numpy.percentile`.
+        `nan` values are skipped.
+
+        Args:
+            values: Value of each post, such as from `engagement_rate`.
+            q: Percentile between 0 and 100.
+
+        Returns:
+            `numpy.ndarray` with the percentile of each account, or
+            `nan` for accounts without any values.
+        """
+        return self._group_percentile(values, self.accounts, len(self.usernames), q)
+
+    @staticmethod
+    def _group_percentile(values: np.ndarray,
+                          groups: np.ndarray,
+                          group_count: int,
+                          q: float) -> np.ndarray:
+        """Gets a percentile of `values` in each group, skipping `nan`."""
+        valid = ~np.isnan(values)
+        values = values[valid]
+        groups = groups[valid]
+        # Sorted by group, then by value
+        order = np.lexsort((values, groups))
+        values = values[order]
+        counts = np.bincount(groups, minlength=group_count)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        result = np.full(group_count, np.nan)
+        has_values = counts > 0
+        position = starts[has_values] + (counts[has_values] - 1) * q / 100
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        result[has_values] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        return result
+
+    def rolling_mean(self, values: np.ndarray, window: int = 10) -> np.ndarray:
+        """
+        Gets the mean of each post and the posts before it.
+
+        Windows never include posts from another account, so the first
+        posts of each account have smaller windows. `nan` values are
+        skipped.
+
+        Args:
+            values: Value of each post, such as from `engagement_rate`.
+            window: Most posts in each window.
+
+        Returns:
+            `numpy.ndarray` of the rolling mean at each post.
+        """
+        valid = ~np.isnan(values)
+        sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+        counts = np.concatenate(([0], np.cumsum(valid)))
+        positions = np.arange(len(values))
+        starts = np.maximum(self.offsets[self.accounts], positions - window + 1)
+
+        window_counts = counts[positions + 1] - counts[starts]
+        result = np.full(len(values), np.nan)
+        np.divide(sums[positions + 1] - sums[starts], window_counts,
+                  out=result, where=window_counts > 0)
+        return result
+
+    def outliers(self, values: np.ndarray = None, threshold: float = 3.5) -> np.ndarray:
+        """
+        Finds posts that did far better or worse than the account usually
+        does.
+
+        Uses the modified z-score, based on each account's median and
+        median absolute deviation, so a few viral posts don't hide each
+        other.
+
+        Args:
+            values: Value of each post. Defaults to `engagement_rate`.
+            threshold: Smallest modified z-score of an outlier.
+
+        Returns:
+            `numpy.ndarray` of `bool`, `True` for each outlier post.
+        """
+        if values is None:
+            values = self.engagement_rate()
+
+        medians = self.percentile(values, 50)[self.accounts]
+        deviations = np.abs(values - medians)
+        mad = self.percentile(deviations, 50)[self.accounts]
+        scores = np.zeros(len(values))
+        np.divide(0.6745 * deviations, mad, out=scores, where=mad > 0)
+        return np.abs(scores) > threshold
+
+    def posting_gaps(self) -> np.ndarray:
+        """
+        Gets the hours since the account's previous post, for each post.
+
+        Returns:
+            `numpy.ndarray` of hours, `nan` for each account's first post.
+        """
+        gaps = np.full(len(self), np.nan)
+        if len(self) > 1:
+            gaps[1:] = np.diff(self.created) / 3600
+            gaps[self.offsets[:-1][np.diff(self.offsets) > 0]] = np.nan
+        return gaps
+
+    def summary(self) -> dict:
+        """
+        Gets the main statistics of every account.
+
+        Returns:
+            `dict` of `numpy.ndarray` objects, with one value per
+            account in the same order as `usernames`:
+                posts: Amount of posts.
+                followers: Followers of the account.
+                mean_engagement: Mean engagement rate.
+                median_engagement: Median engagement rate.
+                p90_engagement: 90th percentile engagement rate.
+                mean_likes: Mean likes per post.
+                mean_comments: Mean comments per post.
+                median_gap_hours: Median hours between posts.
+                posts_per_week: Posts per week between the first and
+                    last post.
+                outliers: Amount of outlier posts.
+        """
+        account_count = len(self.usernames)
+        posts = np.diff(self.offsets)
+        rates = self.engagement_rate()
+
+        def mean(values):
+            valid = ~np.isnan(values)
+            totals = np.bincount(self.accounts, np.where(valid, values, 0.0), account_count)
+            counts = np.bincount(self.accounts, valid, account_count)
+            result = np.full(account_count, np.nan)
+            np.divide(totals, counts, out=result, where=counts > 0)
+            return result
+
+        has_posts = posts > 0
+        span = np.zeros(account_count)
+        span[has_posts] = (self.created[self.offsets[1:][has_posts] - 1]
+                           - self.created[self.offsets[:-1][has_posts]]) / (7 * 24 * 3600)
+        posts_per_week = np.full(account_count, np.nan)
+        np.divide(posts - 1, span, out=posts_per_week, where=span > 0)
+
+        return {
+            "usernames": self.usernames,
+            "posts": posts,
+            "followers": self.followers,
+            "mean_engagement": mean(rates),
+            "median_engagement": self.percentile(rates, 50),
+            "p90_engagement": self.percentile(rates, 90),
+            "mean_likes": mean(self.likes),
+            "mean_comments": mean(self.comments),
+            "median_gap_hours": self.percentile(self.posting_gaps(), 50),
+            "posts_per_week": posts_per_week,
+            "outliers": np.bincount(self.accounts, self.outliers(rates),
+                                    account_count).astype(np.int64),
+        }
+
+    def account(self, username: str) -> dict:
+        """
+        Gets the per post statistics of a single account.
+
+        Returns:
+            `dict` of `numpy.ndarray` objects with the `created`,
+            `likes`, `comments`, `engagement` and `rolling_engagement`
+            of each of its posts, oldest first. Empty if the account
+            has no posts.
+        """
+        account_id = self.ids.get(username)
+        if account_id is None:
+            return {}
+
+        start, end = self.offsets[account_id], self.offsets[account_id + 1]
+        rates = self.engagement_rate()
+        return {
+            "created": self.created[start:end],
+            "likes": self.likes[start:end],
+            "comments": self.comments[start:end],
+            "engagement": rates[start:end],
+            "rolling_engagement": self.rolling_mean(rates)[start:end],
+        }
@@ -0,0 +1,130 @@
+from collections import Counter
+import re
+
+
+class EntityExtractor:
+    """
+    Pulls hashtags, mentions, urls and emoji out of captions and comments.
+
+    Every kind of entity is matched by a single precompiled pattern, so
+    each text is scanned once. Texts that can't contain any entity are
+    skipped without being scanned at all. Hashtags and mentions are
+    lowercased, so `#Travel` and `#travel` are counted together.
+
+    Examples:
+        extractor = EntityExtractor()
+        extractor.extract("Off to Rome with @alice! #travel ✈️")
+        per_post, per_account = extractor.count_posts(posts)
+        per_account["alice"][EntityExtractor.HASHTAGS].most_common(10)
+    """
+
+    HASHTAGS = "hashtags"
+    MENTIONS = "mentions"
+    URLS = "urls"
+    EMOJI = "emoji"
+    KINDS = (HASHTAGS, MENTIONS, URLS, EMOJI)
+
+    # Pictographs, symbols, dingbats and flag letters
+    _EMOJI_CHARACTER = (r"[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF"
+                        r"\u2190-\u21FF\u2300-\u23FF\u3030\u303D\u3297\u3299]")
+    # Urls come first, so a `#` inside a url isn't read as a hashtag
+    PATTERN = re.compile(
+        r"(?P<urls>\bhttps?://[^\s<>\"]+[^\s<>\".,!?)\]]|\bwww\.[^\s<>\"]+[^\s<>\".,!?)\]])"
+        r"|(?<![\w#&])#(?P<hashtags>\w+)"
+        r"|(?<![\w@])@(?P<mentions>[A-Za-z0-9_](?:[A-Za-z0-9_.]{0,28}[A-Za-z0-9_])?)"
+        # Flags are a pair of regional indicator letters. Skin tones,
+        # variation selectors and zero width joiners keep sequences such
+        # as family emoji together.
+        rf"|(?P<emoji>[\U0001F1E6-\U0001F1FF]{{2}}"
+        rf"|{_EMOJI_CHARACTER}[\U0001F3FB-\U0001F3FF\uFE0F]?"
+        rf"(?:\u200D{_EMOJI_CHARACTER}[\U0001F3FB-\U0001F3FF\uFE0F]?)*)"
+    )
+    # Ascii text can only have an entity if it has one of these
+    _ASCII_MARKERS = re.compile(r"[#@]|https?://|www\.")
+
+    def __init__(self):
+        pass
+
+    def _matches(self, text: str):
+        """Yields the `(kind, value)` of each entity in `text`."""
+        if not text or (text.isascii() and not self._ASCII_MARKERS.search(text)):
+            return
+
+        for match in self.PATTERN.finditer(text):
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == self.HASHTAGS or kind == self.MENTIONS:
+                value = value.lower()
+            yield kind, value
+
+    def extract(self, text: str) -> dict:
+        """
+        Gets every entity in `text`.
+
+        Returns:
+            `dict` of each kind in `KINDS`, and a `list` of the entities
+            of that kind, in the order they appear.
+        """
+        entities = {kind: [] for kind in self.KINDS}
+        for kind, value in self._matches(text):
+            entities[kind].append(value)
+        return entities
+
+    def count(self, texts, counts: dict = None) -> dict:
+        """
+        Counts the entities in many texts.
+
+        Args:
+            texts: Iterable of texts.
+            counts: Counts to add to, such as from an earlier call.
+
+        Returns:
+            `dict` of each kind in `KINDS`, and a `Counter` of the
+            entities of that kind.
+        """
+        if counts is None:
+            counts = {kind: Counter() for kind in self.KINDS}
+        for text in texts:
+            for kind, value in self._matches(text):
+                counts[kind][value] += 1
+        return counts
+
+    @staticmethod
+    def iter_texts(post):
+        """
+        Yields the `(username, text)` of a `Post` caption and each of its
+        comments.
+        """
+        caption = getattr(post, "caption", None)
+        if caption and caption.text:
+            yield caption.username, caption.text
+        for comment in getattr(post, "comments", {}).values():
+            yield comment.username, comment.text
+
+    def count_posts(self, posts: list) -> tuple:
+        """
+        Counts the entities in the captions and comments of `Post` objects.
+
+        Args:
+            posts: `Post` objects to count.
+
+        Returns:
+            `tuple` of two `dict` objects, with the counts (as returned
+            by `count`) of each post shortcode, and of each account that
+            wrote a caption or comment.
+        """
+        per_post = {}
+        per_account = {}
+        for post in posts:
+            post_counts = per_post.setdefault(post.short_code,
+                                              {kind: Counter() for kind in self.KINDS})
+            for username, text in self.iter_texts(post):
+                account_counts = per_account.get(username)
+                if account_counts is None:
+                    account_counts = per_account[username] = {kind: Counter()
+                                                              for kind in self.KINDS}
+                for kind, value in self._matches(text):
+                    post_counts[kind][value] += 1
+                    account_counts[kind][value] += 1
+
+        return per_post, per_account
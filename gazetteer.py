@@ -0,0 +1,245 @@
+from file_manager import FileManager
+import argparse
+import requests
+import bisect
+import json
+import os
+
+
+class NameIndex:
+    """
+    Case-insensitive index of names, stored as sorted arrays.
+
+    Names are casefolded and kept in a sorted `list`, with their values
+    in a second `list` at the same positions. Exact and prefix lookups
+    are binary searches, so they stay fast no matter how many names are
+    in the index.
+
+    Attributes:
+        names (list): Original names, in the same order as `_keys`.
+        values (list): Values for each name, in the same order as
+            `_keys`.
+        _keys (list): Sorted, casefolded names.
+    """
+
+    def __init__(self, records: list = None):
+        records = sorted(records or [], key=lambda record: record[0].casefold())
+        self.names = [name for name, _ in records]
+        self.values = [value for _, value in records]
+        self._keys = [name.casefold() for name in self.names]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, name: str, default: any = None) -> any:
+        """Gets the value for `name`, ignoring case and extra spaces."""
+        key = " ".join(name.split()).casefold()
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return self.values[index]
+
+        return default
+
+    def search_prefix(self, prefix: str, limit: int = 0) -> list:
+        """
+        Gets all names that start with `prefix`, ignoring case.
+
+        Args:
+            prefix: Start of the names to look for.
+            limit: Most names to return. `0` returns all of them.
+
+        Returns:
+            `list` of the original names that start with `prefix`, in
+            alphabetical order.
+        """
+        key = " ".join(prefix.split()).casefold()
+        start = bisect.bisect_left(self._keys, key)
+        # Every key starting with `key` sorts before this one
+        end = bisect.bisect_left(self._keys, key + "\U0010ffff", lo=start)
+        if limit:
+            end = min(end, start + limit)
+
+        return self.names[start:end]
+
+    def to_list(self) -> list:
+        """Returns the index as a `list` of `[name, value]` pairs."""
+        return [[name, value] for name, value in zip(self.names, self.values)]
+
+
+class Gazetteer:
+    """
+    Offline copy of the countriesnow reference data.
+
+    Call `refresh` once to download everything countriesnow offers in
+    bulk. After that, the lookup methods answer from the local file
+    without any requests. Lookups ignore case, and every index supports
+    prefix searches.
+
+    Cities in a state have no bulk endpoint, so they are only imported
+    when `refresh` is called with `state_cities` set to `True`.
+
+    Refresh from the command line with:
+        python gazetteer.py refresh [--state-cities]
+
+    Attributes:
+        filename (str): Path of the file the index is stored in.
+        countries (NameIndex): Cities and codes for each country.
+        states (NameIndex): States and codes for each country.
+        country_population (NameIndex): Population counts per country.
+        city_population (NameIndex): Population counts per city.
+        state_cities (NameIndex): Cities for each `country|state` pair.
+        _countriesnow (dict): Api endpoints specific to countriesnow.
+    """
+
+    SECTIONS = ("countries", "states", "country_population",
+                "city_population", "state_cities")
+
+    def __init__(self, filename: str = "gazetteer/gazetteer.json"):
+        self.filename = filename
+        with open("urls.json", encoding='utf-8') as file:
+            self._countriesnow = json.load(file)['geolocation']['countriesnow']
+
+        for section in self.SECTIONS:
+            setattr(self, section, NameIndex())
+
+        self.load()
+
+    def __bool__(self):
+        """Whether any data has been imported yet."""
+        return any(len(getattr(self, section)) for section in self.SECTIONS)
+
+    def load(self) -> bool:
+        """Loads the index from `filename`, if it exists."""
+        try:
+            with open(self.filename, encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return False
+
+        for section in self.SECTIONS:
+            setattr(self, section, NameIndex(data.get(section)))
+
+        return True
+
+    def save(self) -> None:
+        """Saves the index to `filename`, replacing the old file whole."""
+        directory = self.filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+
+        data = {section: getattr(self, section).to_list()
+                for section in self.SECTIONS}
+        # Write to a temporary file first, so a failed write never leaves
+        # a half written index behind.
+        temporary_filename = f"{self.filename}.tmp"
+        with open(temporary_filename, 'w', encoding='utf-8') as file:
+            json.dump(data, file, separators=(',', ':'))
+
+        os.replace(temporary_filename, self.filename)
+
+    def refresh(self, state_cities: bool = False) -> None:
+        """
+        Downloads all countriesnow reference data and saves it.
+
+        Args:
+            state_cities: Set to `True` to also download the cities in
+                every state. This sends one request per state, so it is
+                much slower than the rest of the refresh.
+        """
+        base = self._countriesnow['base']
+        print("Retrieving cities in every country...")
+        countries = self._get_data(base.rstrip('/'))
+        print("Retrieving states in every country...")
+        states = self._get_data(base + self._countriesnow['states-in-country'])
+        print("Retrieving population of every country...")
+        country_population = self._get_data(base + self._countriesnow['pop-in-country'])
+        print("Retrieving population of every city...")
+        city_population = self._get_data(base + self._countriesnow['pop-in-city'])
+
+        self.countries = NameIndex([[country['country'], country]
+                                    for country in countries])
+        self.states = NameIndex([[country['name'], country]
+                                 for country in states])
+        self.country_population = NameIndex([[country['country'], country]
+                                             for country in country_population])
+        # Keep the first record of any city name, which is what the
+        # single city endpoint returns.
+        cities = {}
+        for city in city_population:
+            cities.setdefault(city['city'].casefold(), [city['city'], city])
+        self.city_population = NameIndex(list(cities.values()))
+
+        if state_cities:
+            self.state_cities = NameIndex(self._get_state_cities(states))
+
+        self.save()
+        print(f"Gazetteer saved to: {os.path.realpath(self.filename)}")
+
+    def _get_state_cities(self, states: list) -> list:
+        """Gets `[country|state, cities]` pairs for every state."""
+        url = self._countriesnow['base'] + self._countriesnow['cities-in-state']
+        records = []
+        for country in states:
+            print(f"Retrieving cities in the states of: {country['name']}")
+            for state in country['states']:
+                response = requests.post(url, data={"country": country['name'],
+                                                    "state": state['name']})
+                data = response.json()
+                if not data['error']:
+                    records.append([f"{country['name']}|{state['name']}",
+                                    data['data']])
+
+        return records
+
+    @staticmethod
+    def _get_data(url: str) -> list:
+        """Gets the `data` of a countriesnow bulk endpoint."""
+        response = requests.get(url, timeout=60)
+        data = response.json()
+        if data['error']:
+            print(data['msg'])
+            return []
+
+        return data['data']
+
+    def get_cities_in_country(self, country: str) -> [list, None]:
+        """Gets all cities in `country`, or `None` if it's not found."""
+        record = self.countries.get(country)
+        return record['cities'] if record else None
+
+    def get_states_in_country(self, country: str) -> [dict, None]:
+        """Gets all states in `country`, or `None` if it's not found."""
+        return self.states.get(country)
+
+    def get_cities_in_state(self, country: str, state: str) -> [list, None]:
+        """Gets all cities in `state`, or `None` if it's not found."""
+        return self.state_cities.get(f"{country}|{state}")
+
+    def get_country_population(self, country: str) -> [dict, None]:
+        """Gets population data for `country`, or `None` if not found."""
+        return self.country_population.get(country)
+
+    def get_city_population(self, city: str) -> [dict, None]:
+        """Gets population data for `city`, or `None` if not found."""
+        return self.city_population.get(city)
+
+    def search_countries(self, prefix: str, limit: int = 0) -> list:
+        """Gets the names of all countries starting with `prefix`."""
+        return self.countries.search_prefix(prefix, limit)
+
+    def search_cities(self, prefix: str, limit: int = 0) -> list:
+        """Gets the names of all cities starting with `prefix`."""
+        return self.city_population.search_prefix(prefix, limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Manage the offline copy of the countriesnow data."
+    )
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--state-cities", action="store_true",
+                        help="Also download the cities in every state. Slow.")
+    arguments = parser.parse_args()
+
+    if arguments.command == "refresh":
+        Gazetteer().refresh(state_cities=arguments.state_cities)
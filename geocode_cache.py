@@ -0,0 +1,183 @@
+from file_manager import FileManager
+from geohash import Geohash
+import threading
+import sqlite3
+import json
+import time
+import re
+
+
+class GeocodeCache:
+    """
+    SQLite cache for geoapify location lookups.
+
+    Address searches are keyed by their normalised text, so
+    "123 Address St,  Maine" and "123 address st, maine" share an entry.
+    Reverse searches are keyed by the geohash of their coordinates, so
+    any coordinates inside the same cell share an entry.
+
+    Entries older than `ttl` are treated as missing. Once there are more
+    than `max_entries` entries, the least recently used ones are
+    removed.
+
+    Attributes:
+        filename (str): Path of the SQLite database file.
+        ttl (int): Seconds an entry is valid for.
+        max_entries (int): Most entries to keep in the cache.
+        precision (int): Geohash precision used to bucket coordinates.
+            See `Geohash` for the cell sizes.
+        _connection (sqlite3.Connection): Connection to the database.
+        _lock (threading.Lock): Lock around `_connection`, so the cache
+            can be shared between threads.
+    """
+
+    WHITESPACE = re.compile(r'\s+')
+    # Punctuation that does not change the meaning of an address
+    PUNCTUATION = re.compile(r'[.,;#]')
+    # Parameters that do not change the result of a search
+    IGNORED_PARAMETERS = {"apiKey"}
+
+    def __init__(self,
+                 filename: str = "cache/geocode_cache.db",
+                 ttl: int = 60 * 60 * 24 * 30,
+                 max_entries: int = 100000,
+                 precision: int = 7,
+                 ):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.precision = precision
+
+        directory = filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS locations ("
+                "key TEXT PRIMARY KEY, "
+                "properties TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "accessed REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS locations_accessed "
+                "ON locations (accessed)"
+            )
+
+    def create_key(self, url: str, parameters: dict) -> str:
+        """
+        Creates a cache key for a geoapify search.
+
+        Args:
+            url: Geoapify endpoint being searched.
+            parameters: Query parameters being sent to `url`.
+
+        Returns:
+            Key that is the same for any search that should return the
+            same location.
+        """
+        key_parts = {}
+        for name, value in parameters.items():
+            if name in self.IGNORED_PARAMETERS or value in ("", None):
+                continue
+
+            if name in ("lat", "lon"):
+                # Replaced by the geohash below
+                continue
+
+            key_parts[name] = self.normalise_text(str(value))
+
+        if "lat" in parameters and "lon" in parameters:
+            key_parts["geohash"] = Geohash.encode(parameters["lat"],
+                                                  parameters["lon"],
+                                                  self.precision)
+
+        return f"{url}?{json.dumps(key_parts, sort_keys=True)}"
+
+    @staticmethod
+    def normalise_text(text: str) -> str:
+        """Casefolds `text` and strips extra punctuation and spaces."""
+        text = GeocodeCache.PUNCTUATION.sub(" ", text.casefold())
+        return GeocodeCache.WHITESPACE.sub(" ", text).strip()
+
+    def get(self, key: str) -> [dict, None]:
+        """
+        Gets the cached location properties for `key`.
+
+        Args:
+            key: Key created by `create_key`.
+
+        Returns:
+            Geoapify properties `dict` for the location, or `None` if
+            `key` is not cached or has expired.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT properties, created FROM locations WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            properties, created = row
+            if now - created > self.ttl:
+                # Entry is too old to be trusted anymore
+                self._connection.execute(
+                    "DELETE FROM locations WHERE key = ?", (key,)
+                )
+                return None
+
+            self._connection.execute(
+                "UPDATE locations SET accessed = ? WHERE key = ?", (now, key)
+            )
+
+        return json.loads(properties)
+
+    def set(self, key: str, properties: dict) -> None:
+        """
+        Caches the location `properties` under `key`.
+
+        Removes the least recently used entries if the cache has grown
+        past `max_entries`.
+
+        Args:
+            key: Key created by `create_key`.
+            properties: Geoapify properties `dict` for the location.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?)",
+                (key, json.dumps(properties), now, now)
+            )
+            total = self._connection.execute(
+                "SELECT COUNT(*) FROM locations"
+            ).fetchone()[0]
+            if total > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM locations WHERE key IN ("
+                    "SELECT key FROM locations ORDER BY accessed LIMIT ?)",
+                    (total - self.max_entries,)
+                )
+
+    def remove_expired(self) -> int:
+        """Removes all expired entries and returns how many there were."""
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM locations WHERE created < ?",
+                (time.time() - self.ttl,)
+            ).rowcount
+
+    def clear(self) -> None:
+        """Removes all entries from the cache."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM locations")
+
+    def close(self) -> None:
+        """Closes the connection to the database."""
+        with self._lock:
+            self._connection.close()
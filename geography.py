@@ -1,6 +1,11 @@
 from dotenv import load_dotenv
 from user_input import UserInput
+from geocode_cache import GeocodeCache
+from gazetteer import Gazetteer
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import time
+import math
 import os
 import json
 
@@ -33,6 +38,24 @@ class Location:
                f"Latitude: {self.latitude}\n" \
                f"Longitude: {self.longitude}\n"
 
+    @staticmethod
+    def haversine(latitude_1: float,
+                  longitude_1: float,
+                  latitude_2: float,
+                  longitude_2: float,
+                  ) -> float:
+        """Returns the distance in meters between two coordinates."""
+        earth_radius = 6371008.8
+        latitude_1, longitude_1, latitude_2, longitude_2 = map(
+            math.radians,
+            (float(latitude_1), float(longitude_1),
+             float(latitude_2), float(longitude_2))
+        )
+        a = math.sin((latitude_2 - latitude_1) / 2) ** 2 \
+            + math.cos(latitude_1) * math.cos(latitude_2) \
+            * math.sin((longitude_2 - longitude_1) / 2) ** 2
+        return 2 * earth_radius * math.asin(math.sqrt(a))
+
 
 class Geography:
     """
@@ -44,10 +67,15 @@ class Geography:
         _countriesnow (dict): Api endpoints specific to countriesnow
         _api_key (str): Geoapify api key.
         _headers (dict): Required headers for all _geoapify api endpoints.
-        _parameters (dict): Parameters to send in `GET` request.
+        _parameters (dict): Parameters shared by every `GET` request.
+            Never changed after `__init__`, each search copies it.
+        cache (GeocodeCache): Cache of previous geoapify searches, or
+            `None` if caching is disabled.
+        gazetteer (Gazetteer): Offline copy of the countriesnow data,
+            checked before sending any countriesnow request.
     """
 
-    def __init__(self):
+    def __init__(self, use_cache: bool = True):
         load_dotenv()
         with open("urls.json", encoding='utf-8') as file:
             self._URLS = json.load(file)['geolocation']
@@ -63,6 +91,10 @@ class Geography:
         self._parameters = {
             "apiKey": self._api_key,
         }
+        # Geoapify charges per search, so reuse previous results
+        self.cache = GeocodeCache() if use_cache else None
+        # Empty until `Gazetteer.refresh` has been run once
+        self.gazetteer = Gazetteer()
 
     def geocode_search(self,
                        text: str = "",
@@ -104,14 +136,41 @@ class Geography:
         """
         # Set base url to use for all outcomes
         url = self._geoapify['base'] + self._geoapify['geocode']
-        # Get the rest of the keyword args from the site.
-        self._parameters.update(**kwargs)
+        parameters = self._create_geocode_parameters(text=text,
+                                                     name=name,
+                                                     house_number=house_number,
+                                                     street=street,
+                                                     post_code=post_code,
+                                                     city=city,
+                                                     state=state,
+                                                     country=country,
+                                                     **kwargs)
+        if not parameters:
+            # All parameters are empty
+            return False
+
+        return self._get_location_info(url, parameters)
+
+    def _create_geocode_parameters(self,
+                                   text: str = "",
+                                   name: str = "",
+                                   house_number: str = "",
+                                   street: str = "",
+                                   post_code: str = "",
+                                   city: str = "",
+                                   state: str = "",
+                                   country: str = "",
+                                   **kwargs
+                                   ) -> [dict, None]:
+        """Creates the parameters for a single `geocode_search`."""
+        # Copy the shared parameters, so searches never leak into each other.
+        parameters = {**self._parameters, **kwargs}
 
         if text:
             # Full address is being used, such as 123 house st, madison, CA 12345
-            self._parameters["text"] = text
+            parameters["text"] = text
         elif name:
-            self._parameters.update({
+            parameters.update({
                 "name": name,
                 "housenumber": house_number,
                 "street": street,
@@ -121,10 +180,9 @@ class Geography:
                 "country": country,
             })
         else:
-            # All _parameters are empty
-            return False
+            return None
 
-        return self._get_location_info(url)
+        return parameters
 
     def reverse_geocode_search(self,
                                latitude: str,
@@ -154,13 +212,99 @@ class Geography:
         """
         url = self._geoapify['base'] + self._geoapify['reverse-geocode']
         parameters = {
+            **self._parameters,
             "lat": latitude,
             "lon": longitude,
             "limit": limit,
             **kwargs
         }
-        self._parameters.update(parameters)
-        return self._get_location_info(url)
+        return self._get_location_info(url, parameters)
+
+    def geocode_many(self,
+                     addresses: list,
+                     max_workers: int = 8,
+                     batch: bool = False,
+                     **kwargs
+                     ) -> list:
+        """
+        Runs `geocode_search` on many addresses at once.
+
+        Identical addresses are only searched once. Cached addresses are
+        never searched again.
+
+        Examples:
+            geocode_many(["123 address st, Maine, CA 12345",
+                          {"name": "Home", "city": "Madison"}])
+
+        Args:
+            addresses: `list` where each address is either a simple
+                address search `str`, or a `dict` of the structured
+                address arguments of `geocode_search`.
+            max_workers: Most searches to run at the same time.
+            batch: Set to `True` to send all uncached addresses as one
+                geoapify batch job instead. Batch jobs are cheaper, but
+                take longer to finish.
+            **kwargs: Additional keyword arguments to include in every
+                search. Please refer to _geoapify documentation to get
+                the full list.
+
+        Returns:
+            `list` of `Location` objects in the same order as
+            `addresses`, with `False` for any address that was not
+            found.
+        """
+        url = self._geoapify['base'] + self._geoapify['geocode']
+        parameters_list = []
+        for address in addresses:
+            if isinstance(address, dict):
+                parameters_list.append(
+                    self._create_geocode_parameters(**address, **kwargs)
+                )
+            else:
+                parameters_list.append(
+                    self._create_geocode_parameters(text=address, **kwargs)
+                )
+
+        return self._get_many_location_info(url, parameters_list, max_workers, batch)
+
+    def reverse_geocode_many(self,
+                             coordinates: list,
+                             max_workers: int = 8,
+                             batch: bool = False,
+                             **kwargs
+                             ) -> list:
+        """
+        Runs `reverse_geocode_search` on many coordinates at once.
+
+        Identical coordinates are only searched once. Cached coordinates
+        are never searched again.
+
+        Examples:
+            reverse_geocode_many([(10.0, 10.0), (20.0, 20.0)])
+
+        Args:
+            coordinates: `list` of `(latitude, longitude)` pairs.
+            max_workers: Most searches to run at the same time.
+            batch: Set to `True` to send all uncached coordinates as one
+                geoapify batch job instead. Batch jobs are cheaper, but
+                take longer to finish.
+            **kwargs: Additional keyword arguments to include in every
+                search. Please refer to _geoapify documentation for
+                reverse geocode to get the full list.
+
+        Returns:
+            `list` of `Location` objects in the same order as
+            `coordinates`, with `False` for any that were not found.
+        """
+        url = self._geoapify['base'] + self._geoapify['reverse-geocode']
+        kwargs.setdefault("limit", "1")
+        parameters_list = [{**self._parameters,
+                            "lat": latitude,
+                            "lon": longitude,
+                            **kwargs}
+                           for latitude, longitude in coordinates]
+
+        return self._get_many_location_info(url, parameters_list, max_workers, batch)
 
     def ip_search(self, ip: str = "") -> [requests.models.Response, bool]:
         """
@@ -179,11 +323,12 @@ class Geography:
             `ip` or user's IP is located.
         """
         url = self._geoapify['base'] + self._geoapify['ip-info']
+        parameters = {**self._parameters}
         if ip:
-            self._parameters['ip'] = ip
+            parameters['ip'] = ip
 
         # Get data and check it's good
-        response = requests.get(url, params=self._parameters, headers=self._headers)
+        response = requests.get(url, params=parameters, headers=self._headers)
 
         if response.status_code == 200:
             data = response.json()
@@ -193,6 +338,10 @@ class Geography:
 
     def get_city_population(self, city: str) -> dict:
         """Gets the population data for a single city."""
+        population = self.gazetteer.get_city_population(city)
+        if population is not None:
+            return population
+
         url = self._countriesnow['base'] + self._countriesnow['pop-in-city']
         data = {
             "city": city.title()
@@ -201,6 +350,10 @@ class Geography:
 
     def get_country_population(self, country: str) -> dict:
         """Gets the population data for a single country."""
+        population = self.gazetteer.get_country_population(country)
+        if population is not None:
+            return population
+
         url = self._countriesnow['base'] + self._countriesnow['pop-in-country']
         return self._get_country_data(url, country)
 
@@ -275,16 +428,28 @@ class Geography:
 
     def get_cities_in_state(self, country: str, state: str) -> dict:
         """Gets all cities in `state`. Must provide `country` as well."""
+        cities = self.gazetteer.get_cities_in_state(country, state)
+        if cities is not None:
+            return cities
+
         url = self._countriesnow['base'] + self._countriesnow['cities-in-state']
         return self._get_state_data(url, country, state)
 
     def get_cities_in_country(self, country: str) -> dict:
         """Gets all cities in `country`."""
+        cities = self.gazetteer.get_cities_in_country(country)
+        if cities is not None:
+            return cities
+
         url = self._countriesnow['base'] + self._countriesnow['cities-in-country']
         return self._get_country_data(url, country)
 
     def get_states_in_country(self, country: str) -> dict:
         """Gets all states in `country`."""
+        states = self.gazetteer.get_states_in_country(country)
+        if states is not None:
+            return states
+
         url = self._countriesnow['base'] + self._countriesnow['states-in-country']
         return self._get_country_data(url, country)
 
@@ -319,20 +484,170 @@ class Geography:
         else:
             return new_data['data']
 
-    def _get_location_info(self, url) -> [Location, bool]:
-        """Gets geoapify location info for `url` endpoint."""
+    def _get_location_info(self, url, parameters) -> [Location, bool]:
+        """
+        Gets geoapify location info for `url` endpoint.
+
+        Checks `cache` before sending the request, and caches the
+        result of any successful request.
+        """
+        location = self._get_cached_location(url, parameters)
+        if location:
+            return location
+
         # Get data and check it's good
-        response = requests.get(url, params=self._parameters, headers=self._headers)
+        response = requests.get(url, params=parameters, headers=self._headers)
 
         if response.status_code == 200:
             data = response.json()
             location = Location(data)
+            if self.cache:
+                self.cache.set(self.cache.create_key(url, parameters),
+                               data['features'][0]['properties'])
             return location
         else:
             print("Failed to find the given location.")
             print(f"Error: {response.json()['message']}")
             return False
 
+    def _get_cached_location(self, url, parameters) -> [Location, None]:
+        """Gets the cached location for a search, if there is one."""
+        if not self.cache:
+            return None
+
+        properties = self.cache.get(self.cache.create_key(url, parameters))
+        if not properties:
+            return None
+
+        if "lat" in parameters and "lon" in parameters:
+            # The cached location may have been found from other
+            # coordinates in the same geohash cell.
+            properties['distance'] = Location.haversine(
+                parameters['lat'], parameters['lon'],
+                properties['lat'], properties['lon'],
+            )
+        return Location({"features": [{"properties": properties}]})
+
+    def _get_many_location_info(self,
+                                url: str,
+                                parameters_list: list,
+                                max_workers: int,
+                                batch: bool,
+                                ) -> list:
+        """
+        Gets geoapify location info for every search in `parameters_list`.
+
+        Duplicate searches are only sent once, and results are returned
+        in the same order as `parameters_list`. `None` parameters are
+        returned as `False` without a search.
+        """
+        # Map each unique search to its parameters, in first seen order
+        unique_searches = {}
+        keys = []
+        for parameters in parameters_list:
+            key = json.dumps(parameters, sort_keys=True, default=str) \
+                if parameters else None
+            if key and key not in unique_searches:
+                unique_searches[key] = parameters
+            keys.append(key)
+
+        results = {None: False}
+        if batch:
+            missing = {}
+            for key, parameters in unique_searches.items():
+                location = self._get_cached_location(url, parameters)
+                if location:
+                    results[key] = location
+                else:
+                    missing[key] = parameters
+
+            if missing:
+                results.update(zip(missing,
+                                   self._get_batch_location_info(url, list(missing.values()))))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                locations = executor.map(lambda parameters: self._get_location_info(url, parameters),
+                                         unique_searches.values())
+                results.update(zip(unique_searches, locations))
+
+        return [results[key] for key in keys]
+
+    def _get_batch_location_info(self,
+                                 url: str,
+                                 parameters_list: list,
+                                 timeout: int = 600,
+                                 ) -> list:
+        """
+        Gets geoapify location info for many searches with one batch job.
+
+        Geoapify batch jobs run in the background, so the job is checked
+        every few seconds until it finishes or `timeout` seconds pass.
+        Parameters shared by every search are sent once in the url.
+
+        Returns:
+            `list` of `Location` objects in the same order as
+            `parameters_list`, with `False` for any not found.
+        """
+        # Parameters with the same value in every search apply to the job
+        shared = {name: value for name, value in parameters_list[0].items()
+                  if all(parameters.get(name) == value
+                         for parameters in parameters_list)
+                  and name not in ("text", "lat", "lon")}
+        inputs = []
+        for parameters in parameters_list:
+            search = {name: value for name, value in parameters.items()
+                      if name not in shared and value != ""}
+            # Simple address searches are sent as plain strings
+            inputs.append(search["text"] if list(search) == ["text"] else search)
+
+        batch_url = url.replace(self._geoapify['base'],
+                                self._geoapify['base'] + self._geoapify['batch'])
+        response = requests.post(batch_url, params=shared, json=inputs,
+                                 headers=self._headers)
+        if response.status_code not in (200, 202):
+            print("Failed to create the batch job.")
+            print(f"Error: {response.json().get('message')}")
+            return [False] * len(parameters_list)
+
+        job_url = response.json()['url']
+        start = time.time()
+        while True:
+            response = requests.get(job_url, params={"apiKey": self._api_key},
+                                    headers=self._headers)
+            # 202 means the job is still running
+            if response.status_code != 202:
+                break
+
+            if time.time() - start > timeout:
+                print(f"Batch job did not finish within {timeout} seconds.")
+                print(f"Check it later at: {job_url}")
+                return [False] * len(parameters_list)
+
+            time.sleep(3)
+
+        if response.status_code != 200:
+            print("Batch job failed.")
+            print(f"Error: {response.json().get('message')}")
+            return [False] * len(parameters_list)
+
+        locations = []
+        for parameters, properties in zip(parameters_list, response.json()):
+            if properties.get('lat') is None or properties.get('lon') is None:
+                # Nothing was found for this search
+                locations.append(False)
+                continue
+
+            if "lat" in parameters and "lon" in parameters:
+                properties['distance'] = Location.haversine(
+                    parameters['lat'], parameters['lon'],
+                    properties['lat'], properties['lon'],
+                )
+            if self.cache:
+                self.cache.set(self.cache.create_key(url, parameters), properties)
+            locations.append(Location({"features": [{"properties": properties}]}))
+
+        return locations
+
     def get_united_states(self) -> list:
         """Returns all States and their codes as `tuple`s in a `list`."""
         united_states = []
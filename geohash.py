@@ -0,0 +1,69 @@
+class Geohash:
+    """
+    Encodes latitude and longitude values into geohash strings.
+
+    A geohash is a short string where each extra character narrows the
+    area it covers. Two coordinates that round to the same geohash are
+    close to each other, which makes them useful as keys. Approximate
+    cell sizes at the equator for each precision:
+        5 = 4.9km x 4.9km
+        6 = 1.2km x 0.6km
+        7 = 153m x 153m
+        8 = 38m x 19m
+
+    Attributes:
+        BASE_32 (str): Characters used in a geohash, in order.
+    """
+
+    BASE_32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def encode(latitude: float, longitude: float, precision: int = 7) -> str:
+        """
+        Gets the geohash of `latitude` and `longitude`.
+
+        Examples:
+            encode(57.64911, 10.40744, 6) -> "u4pruy"
+
+        Args:
+            latitude: Latitude to encode.
+            longitude: Longitude to encode.
+            precision: Amount of characters in the geohash.
+
+        Returns:
+            Geohash string that is `precision` characters long.
+        """
+        latitude_range = [-90.0, 90.0]
+        longitude_range = [-180.0, 180.0]
+        geohash = []
+        bits = 0
+        bit_count = 0
+        # Bits alternate between longitude and latitude, starting with
+        # longitude.
+        use_longitude = True
+        while len(geohash) < precision:
+            if use_longitude:
+                value, value_range = float(longitude), longitude_range
+            else:
+                value, value_range = float(latitude), latitude_range
+
+            middle = (value_range[0] + value_range[1]) / 2
+            if value >= middle:
+                bits = (bits << 1) | 1
+                value_range[0] = middle
+            else:
+                bits <<= 1
+                value_range[1] = middle
+
+            use_longitude = not use_longitude
+            bit_count += 1
+            if bit_count == 5:
+                # Every 5 bits make up a single character
+                geohash.append(Geohash.BASE_32[bits])
+                bits = 0
+                bit_count = 0
+
+        return "".join(geohash)
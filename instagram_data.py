@@ -2,10 +2,18 @@ import requests
 from bs4 import BeautifulSoup
 from file_manager import FileManager
 from instagram_scraper import InstagramScraper
+from work_queue import WorkQueue
+from json_codec import JsonCodec
+from response_archive import ResponseArchive
+from data_store import DataStore
+from user_registry import UserRegistry
 import re
 import json
 import os
-from datetime import datetime
+import time
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 
 class InstagramPage:
@@ -26,6 +34,10 @@ class User:
                 https://i.instagram.com/api/v1/users/web_profile_info/
             Api params:
                 username (str): username of instagram account to search.
+        raw (bytes): Body of the response `json_data` was parsed from.
+            If given, it's saved as it is instead of encoding
+            `json_data` again.
+        save (bool): Whether to save the json data to `json/users`.
 
     Attributes:
         username (str): Username of instagram account.
@@ -72,11 +84,16 @@ class User:
             instagram account.
     """
 
-    def __init__(self, username: str, json_data: dict):
+    def __init__(self,
+                 username: str,
+                 json_data: dict,
+                 raw: bytes = None,
+                 save: bool = True):
         self.username = username
 
         # Save json_data to a file for logging. Must be after username assignment.
-        self.save(json_data)
+        if save:
+            self.save(json_data, raw)
         # Create base index path to get the rest of the data from
         base = json_data["data"]["user"]
 
@@ -126,12 +143,15 @@ class User:
                f"Website: {self.website}\n" \
                f"Bio: {self.bio}"
 
-    def save(self, json_data):
+    def save(self, json_data, raw: bytes = None):
         FileManager.create_dir("json/users")
 
-        # Save json data to a file.
-        with open(f"json/users/{self.username}.json", 'w', encoding='utf-8') as file:
-            json.dump(json_data, file)
+        # Save json data to a file. Raw response bytes are already json.
+        with open(f"json/users/{self.username}.json", 'wb') as file:
+            if raw is None:
+                JsonCodec.dump(json_data, file)
+            else:
+                file.write(raw)
 
 
 class Post:
@@ -148,6 +168,10 @@ class Post:
             endpoint. There are no _parameters.
             Api endpoint:
                 https://i.instagram.com/api/v1/media/`MEDIA_ID`/info
+        raw (bytes): Body of the response `json_data` was parsed from.
+            If given, it's saved as it is instead of encoding
+            `json_data` again.
+        save (bool): Whether to save the json data to `json/posts`.
 
     Attributes:
         access_caption (str): The accessibility caption associated with
@@ -185,7 +209,7 @@ class Post:
             single media video posts.
     """
 
-    def __init__(self, json_data):
+    def __init__(self, json_data, raw: bytes = None, save: bool = True):
         # Create base index path to get the rest of the data from
         try:
             base = json_data["items"][0]
@@ -204,7 +228,8 @@ class Post:
         self.name = base["user"]["full_name"]
 
         # Save json_data to a file for logging
-        self.save(json_data)
+        if save:
+            self.save(json_data, raw)
 
         # Post media info - Important as some attributes will or won't be
         # available depending on the type.
@@ -294,11 +319,9 @@ class Post:
         # Will not appear if comments are disabled
         self.comments_total = base.get("comment_count")
 
-        # Check that the post has user likes, and if so save them to the
-        # instance of the Post object using a list comprehension.
-        self.likes = base.get("likers", {})
-        if self.likes:
-            self.likes = {user["username"]: None for user in self.likes}
+        # Save the users that liked the post, if any, using a dict
+        # comprehension. Always a dict, even when `likers` is empty.
+        self.likes = {user["username"]: None for user in base.get("likers") or []}
 
         # Comments
         self.comments_disabled = base.get("comments_disabled")
@@ -352,7 +375,7 @@ class Post:
                f"Post Total Comments: {self.comments_total}\n" \
                f"Post Created on: {self.created_formatted}"
 
-    def save(self, json_data):
+    def save(self, json_data, raw: bytes = None):
         # Create json folder, if it doesn't already exist.
         try:
             os.mkdir(os.path.abspath("json"))
@@ -367,9 +390,12 @@ class Post:
 
         FileManager.create_dir("json/posts")
         # Save the json file
-        with open(f"json/posts/{self.username}_post_{self.short_code}.json", 'w',
-                  encoding='utf-8') as file:
-            json.dump(json_data, file)
+        with open(f"json/posts/{self.username}_post_{self.short_code}.json",
+                  'wb') as file:
+            if raw is None:
+                JsonCodec.dump(json_data, file)
+            else:
+                file.write(raw)
 
 
 class Comment:
@@ -476,7 +502,7 @@ class Media:
             default to `0`.
         codec (str): Codec of the video. Does not apply to a photo.
         dash_manifest (str): Information specific to a video. Does not
-            apply to a photo.
+            apply to a photo. Use `get_representations` to parse it.
         has_audio (bool): Whether a video has audio or not. Does not
             apply to a photo.
     """
@@ -508,6 +534,8 @@ class Media:
         self.codec = codec
         self.dash_manifest = dash_manifest
         self.has_audio = has_audio
+        # Parsed from `dash_manifest` on first use
+        self._representations = None
 
         # Type specific changes:
         if self.media_type == 1:
@@ -535,6 +563,172 @@ class Media:
                    f"Audio: {self.has_audio}\n" \
                    f"Codec: {self.codec}"
 
+    def get_representations(self) -> list:
+        """
+        Parses `dash_manifest` into a list of `Representation` objects.
+
+        The manifest is only parsed once, and the result is cached on
+        the instance for any later calls. Photos and videos without a
+        manifest will return an empty list.
+
+        Returns:
+            `list` of `Representation` objects for every video and audio
+            track found in `dash_manifest`, in manifest order.
+        """
+        if self._representations is not None:
+            return self._representations
+
+        self._representations = []
+        if not self.dash_manifest:
+            return self._representations
+
+        try:
+            root = ElementTree.fromstring(self.dash_manifest)
+        except ElementTree.ParseError as error:
+            print(f"Invalid dash manifest for media {self.id}.")
+            print(f"Error: {error}")
+            return self._representations
+
+        # Pull the namespace off the root tag, so tags can be matched
+        # regardless of which MPD schema version instagram used.
+        namespace = root.tag[:root.tag.index('}') + 1] \
+            if root.tag.startswith('{') else ""
+
+        for adaptation_set in root.iter(f"{namespace}AdaptationSet"):
+            # Attributes on the AdaptationSet apply to every
+            # Representation inside it, unless they are overridden.
+            set_attributes = adaptation_set.attrib
+            for representation in adaptation_set.iter(f"{namespace}Representation"):
+                attributes = {**set_attributes, **representation.attrib}
+                self._representations.append(Representation(
+                    id=attributes.get('id', ""),
+                    content_type=Representation.get_content_type(attributes),
+                    bandwidth=int(attributes.get('bandwidth', 0)),
+                    codec=attributes.get('codecs', ""),
+                    width=int(attributes.get('width', 0)),
+                    height=int(attributes.get('height', 0)),
+                    segment_urls=Representation.get_segment_urls(
+                        representation, namespace
+                    ),
+                ))
+
+        return self._representations
+
+    def get_cheapest_representation(self,
+                                    content_type: str = "video",
+                                    min_width: int = 0,
+                                    min_height: int = 0,
+                                    max_bandwidth: int = 0,
+                                    ):
+        """
+        Gets the lowest bandwidth representation that meets the limits.
+
+        Examples:
+            get_cheapest_representation("video", min_height=360)
+            get_cheapest_representation("audio")
+
+        Args:
+            content_type: `video` or `audio`.
+            min_width: Smallest width allowed. Does not apply to audio.
+            min_height: Smallest height allowed. Does not apply to
+                audio.
+            max_bandwidth: Largest bandwidth allowed in bits per second.
+                `0` means there is no limit.
+
+        Returns:
+            The `Representation` with the lowest bandwidth that meets
+            all the given limits, or `None` if none of them do.
+        """
+        cheapest = None
+        for representation in self.get_representations():
+            if representation.content_type != content_type:
+                continue
+
+            if content_type == "video" \
+                    and (representation.width < min_width
+                         or representation.height < min_height):
+                # Too small for what was asked for
+                continue
+
+            if max_bandwidth and representation.bandwidth > max_bandwidth:
+                continue
+
+            if cheapest is None or representation.bandwidth < cheapest.bandwidth:
+                cheapest = representation
+
+        return cheapest
+
+
+class Representation:
+    """
+    Class to contain info about a single track in a DASH manifest.
+
+    Attributes:
+        id (str): Id of the representation inside the manifest.
+        content_type (str): `video` or `audio`.
+        bandwidth (int): Average bitrate of the track in bits per
+            second.
+        codec (str): Codec string of the track, such as `avc1.4d401e`.
+        width (int): Width of the video. `0` for audio.
+        height (int): Height of the video. `0` for audio.
+        segment_urls (list): Urls leading to the track's media. Usually
+            a single url, as instagram stores the whole track in one
+            file.
+    """
+
+    def __init__(self,
+                 id: str,
+                 content_type: str,
+                 bandwidth: int,
+                 codec: str = "",
+                 width: int = 0,
+                 height: int = 0,
+                 segment_urls: list = None,
+                 ):
+        self.id = id
+        self.content_type = content_type
+        self.bandwidth = bandwidth
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.segment_urls = segment_urls or []
+
+    def __str__(self):
+        return f"ID: {self.id}\n" \
+               f"Content Type: {self.content_type}\n" \
+               f"Bandwidth: {self.bandwidth}\n" \
+               f"Codec: {self.codec}\n" \
+               f"Dimensions: {self.width}x{self.height}\n" \
+               f"URLs: {self.segment_urls}"
+
+    @staticmethod
+    def get_content_type(attributes: dict) -> str:
+        """Gets `video` or `audio` from a Representation's attributes."""
+        content_type = attributes.get('contentType')
+        if content_type:
+            return content_type
+
+        # Older manifests only provide a mimeType, such as `video/mp4`
+        return attributes.get('mimeType', "").split('/')[0]
+
+    @staticmethod
+    def get_segment_urls(representation: ElementTree.Element,
+                         namespace: str) -> list:
+        """Gets all media urls found in a Representation element."""
+        urls = []
+        base_url = representation.findtext(f"{namespace}BaseURL", "").strip()
+        if base_url:
+            urls.append(base_url)
+
+        # Segmented tracks list each segment after the BaseURL
+        for segment in representation.iter(f"{namespace}SegmentURL"):
+            media = segment.get('media')
+            if media:
+                urls.append(base_url + media if base_url and "://" not in media
+                            else media)
+
+        return urls
+
 
 class Hashtag:
 
@@ -557,7 +751,15 @@ class UserManager:
         pass
 
     @staticmethod
-    def create_users(session: requests.Session, user: "", *args, **kwargs) -> list:
+    def create_users(session: requests.Session,
+                     user: "",
+                     *args,
+                     frontier: WorkQueue = None,
+                     batch_size: int = 10,
+                     archive: ResponseArchive = None,
+                     store: DataStore = None,
+                     registry: UserRegistry = None,
+                     **kwargs) -> list:
         """
         Searches up usernames given by the user, on Instagram.
 
@@ -565,11 +767,24 @@ class UserManager:
         object for each. All users will be appended to `users`
         attribute in a list.
 
+        If `frontier` is given, the usernames are added to it and then
+        claimed from it in batches, so a crawl that stops part way can
+        be continued by running this again with the same frontier.
+        Usernames left over from an earlier run are crawled as well.
+
         Args:
             session: Requests `Session` or similar object.
             user: Single username to search up, rather than getting
                 input.
             *args: Any additional arguments to apply to the session GET.
+            frontier: `WorkQueue`, such as `CrawlFrontier`, to track the
+                usernames in.
+            batch_size: Usernames to claim from `frontier` at a time.
+            archive: `ResponseArchive` to store each response in,
+                instead of saving each user to `json/users`.
+            store: `DataStore` to save each `User` to.
+            registry: `UserRegistry` to share `User` objects through.
+                Usernames already in it aren't searched up again.
             **kwargs: Any additional arguments to apply to the session
                 GET.
         """
@@ -578,6 +793,10 @@ class UserManager:
         if not user:
             # List of usernames to research
             usernames = []
+            if frontier:
+                pending = frontier.counts(WorkQueue.USERNAME)[WorkQueue.PENDING]
+                if pending:
+                    print(f"{pending} usernames from a previous search will be resumed.")
             print("Please input usernames to pull.")
             print("Type 'e' when you are finished entering usernames.")
             while True:
@@ -594,54 +813,378 @@ class UserManager:
             # Single user is to be searched up
             usernames = [user]
 
-        for user in usernames:
-            # Pull each username in the above list
-            params = {
-                "username": user,
-            }
+        if not frontier:
+            for user in usernames:
+                # Pull each username in the above list
+                new_user = UserManager.create_user(session, user, *args,
+                                                   archive=archive, store=store,
+                                                   registry=registry, **kwargs)
+                if new_user:
+                    list_of_users.append(new_user)
+
+            print("Account search complete.")
+            return list_of_users
+
+        frontier.add(WorkQueue.USERNAME, usernames)
+        list_of_users = UserManager.process_queue(session, frontier, batch_size,
+                                                  *args, archive=archive, store=store,
+                                                  registry=registry, **kwargs)
+        print("Account search complete.")
 
-            # Get username info
-            response = session.get(UserManager.URLS["user-profile"],
-                                   params=params, *args, **kwargs)
-            # If the user is found
-            if response.status_code == 200:
-                data = response.json()
+        return list_of_users
 
-                # Create User
-                new_user = User(username=user, json_data=data)
-                list_of_users.append(new_user)
+    @staticmethod
+    def process_queue(session: requests.Session,
+                      queue: WorkQueue,
+                      batch_size: int = 10,
+                      *args,
+                      archive: ResponseArchive = None,
+                      store: DataStore = None,
+                      registry: UserRegistry = None,
+                      **kwargs) -> list:
+        """
+        Searches up usernames claimed from `queue` until it's empty.
 
-                print(f"'{user} has been found!")
-            else:
-                # If the username does not exist
-                print(f"Username '{user}` not found!")
+        Can be run by workers on several machines sharing one queue,
+        such as a `RedisWorkQueue`. Each username is reported back to
+        `queue` as done or failed, and the rest of the batch has its
+        lease renewed after each one.
 
-        print("Account search complete.")
+        Args:
+            session: Requests `Session` or similar object.
+            queue: `WorkQueue` to claim usernames from.
+            batch_size: Usernames to claim at a time.
+            *args: Any additional arguments to apply to the session GET.
+            archive: `ResponseArchive` to store each response in,
+                instead of saving each user to `json/users`.
+            store: `DataStore` to save each `User` to.
+            registry: `UserRegistry` to share `User` objects through.
+                Usernames already in it aren't searched up again.
+            **kwargs: Any additional arguments to apply to the session
+                GET.
+
+        Returns:
+            `list` of `User` objects that were found.
+        """
+        list_of_users = []
+        while True:
+            claimed_usernames = queue.claim(WorkQueue.USERNAME, batch_size)
+            if not claimed_usernames:
+                break
+
+            for position, user in enumerate(claimed_usernames):
+                try:
+                    new_user = UserManager.create_user(session, user, *args,
+                                                       archive=archive, store=store,
+                                                       registry=registry, **kwargs)
+                except requests.exceptions.RequestException as error:
+                    # Try again later, as the account may still exist
+                    queue.fail(WorkQueue.USERNAME, user, str(error))
+                except Exception as error:
+                    # Responses that could not be parsed. Reported so the
+                    # rest of the batch isn't left waiting for its lease.
+                    queue.fail(WorkQueue.USERNAME, user, f"{type(error).__name__}: {error}")
+                else:
+                    if new_user:
+                        list_of_users.append(new_user)
+                        queue.complete(WorkQueue.USERNAME, user)
+                    else:
+                        queue.fail(WorkQueue.USERNAME, user, "not found", retry=False)
+
+                queue.heartbeat(WorkQueue.USERNAME, claimed_usernames[position + 1:])
 
         return list_of_users
 
+    @staticmethod
+    def create_user(session: requests.Session,
+                    username: str,
+                    *args,
+                    archive: ResponseArchive = None,
+                    store: DataStore = None,
+                    registry: UserRegistry = None,
+                    save: bool = True,
+                    **kwargs) -> [User, None]:
+        """
+        Searches up a single username on Instagram.
+
+        Args:
+            session: Requests `Session` or similar object.
+            username: Username to search up.
+            *args: Any additional arguments to apply to the session GET.
+            archive: `ResponseArchive` to store the response in,
+                instead of saving the user to `json/users`.
+            store: `DataStore` to save the `User` to.
+            registry: `UserRegistry` to share `User` objects through.
+                If `username` is already in it, the registered `User` is
+                returned without searching it up again.
+            save: Set to `False` to not save the user to `json/users`,
+                such as when load testing.
+            **kwargs: Any additional arguments to apply to the session
+                GET.
+
+        Returns:
+            `User` for `username`, or `None` if it was not found.
+        """
+        if registry is not None and username in registry:
+            return registry.get_by_username(username)
+
+        params = {
+            "username": username,
+        }
+
+        # Get username info
+        response = session.get(UserManager.URLS["user-profile"],
+                               params=params, *args, **kwargs)
+        # If the user is found
+        if response.status_code == 200:
+            # Parse the same bytes that are archived, so they're never
+            # encoded again.
+            content = response.content
+            if archive is not None:
+                archive.write(ResponseArchive.USER, username, content)
+            data = JsonCodec.loads(content)
+
+            # Create User
+            new_user = User(username=username, json_data=data, raw=content,
+                            save=save and archive is None)
+            if registry is not None:
+                new_user = registry.add(new_user)
+            if store is not None:
+                store.add_user(new_user)
+
+            print(f"'{username} has been found!")
+            return new_user
+        else:
+            # If the username does not exist
+            print(f"Username '{username}` not found!")
+            return None
+
+    @staticmethod
+    def iter_followers(session: requests.Session,
+                       user: User,
+                       *args,
+                       **kwargs):
+        """
+        Pages through every follower of `user`, saving them as it goes.
+
+        See `iter_friendships` for the arguments.
+
+        Yields:
+            `dict` with the `id`, `username` and `full_name` of each
+            follower.
+        """
+        yield from UserManager.iter_friendships(session, user, "followers",
+                                                *args, **kwargs)
+
+    @staticmethod
+    def iter_following(session: requests.Session,
+                       user: User,
+                       *args,
+                       **kwargs):
+        """
+        Pages through every account `user` follows, saving them as it goes.
+
+        See `iter_friendships` for the arguments.
+
+        Yields:
+            `dict` with the `id`, `username` and `full_name` of each
+            account.
+        """
+        yield from UserManager.iter_friendships(session, user, "following",
+                                                *args, **kwargs)
+
+    @staticmethod
+    def _get_retry_after(response: requests.Response) -> int:
+        """
+        Gets the seconds to wait from the `Retry-After` header of
+        `response`, which is either a number of seconds or an http date.
+
+        Returns:
+            Seconds to wait, or `0` if the header is missing or invalid.
+        """
+        retry_after = response.headers.get("Retry-After", "").strip()
+        if retry_after.isdigit():
+            return int(retry_after)
+
+        try:
+            retry_date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError, IndexError):
+            return 0
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=timezone.utc)
+        return max(0, round((retry_date - datetime.now(timezone.utc)).total_seconds()))
+
+    @staticmethod
+    def iter_friendships(session: requests.Session,
+                         user: User,
+                         relationship: str,
+                         count: int = 100,
+                         resume: bool = True,
+                         max_retries: int = 5,
+                         ):
+        """
+        Pages through the followers or following of `user`.
+
+        Each page is appended to `json/friendships/[USERNAME]_[RELATIONSHIP].jsonl`
+        as one json record per line, so the full list never needs to be
+        held in memory. After each page, the cursor for the next page
+        and the size of the file are saved next to it. When resuming,
+        the file is cut back to that size before carrying on, so no
+        record is written twice even if the crawl stopped mid page.
+
+        Requests go through `session.get`, so they wait for the
+        session's `request_interval`. Rate limit and server error
+        responses are retried with an increasing wait. Any other error,
+        such as for a private or deleted account, stops straight away.
+
+        Args:
+            session: Requests `Session` or similar object.
+            user: `User` to get the followers or following of.
+            relationship: `followers` or `following`.
+            count: Accounts to request per page.
+            resume: Set to `False` to start over, instead of carrying on
+                from the last saved cursor.
+            max_retries: Most times to retry a page that was rate
+                limited or hit a server error.
+
+        Yields:
+            `dict` with the `id`, `username` and `full_name` of each
+            account retrieved in this run.
+        """
+        FileManager.create_dir("json/friendships")
+        filepath = f"json/friendships/{user.username}_{relationship}.jsonl"
+        cursor_filepath = f"{filepath}.cursor"
+        url = f"{UserManager.URLS['friendships']}{user.id}/" \
+              f"{UserManager.URLS[f'{relationship}-end']}"
+
+        cursor = {"next_max_id": None, "offset": 0, "complete": False}
+        if resume:
+            try:
+                with open(cursor_filepath, encoding='utf-8') as file:
+                    cursor = json.load(file)
+            except FileNotFoundError:
+                pass
+
+        if cursor["complete"]:
+            print(f"All {relationship} of '{user.username}' were already saved to:")
+            print(os.path.realpath(filepath))
+            return
+
+        with open(filepath, 'a+b') as file:
+            # Drop anything written after the last saved cursor
+            file.truncate(cursor["offset"])
+            file.seek(cursor["offset"])
+
+            retries = 0
+            while True:
+                params = {"count": count}
+                if cursor["next_max_id"]:
+                    params["max_id"] = cursor["next_max_id"]
+
+                response = session.get(url, params=params)
+                if response.status_code != 200:
+                    # Only rate limits and server errors can pass with time.
+                    # Anything else, such as a private or deleted account,
+                    # fails straight away.
+                    retryable = response.status_code == 429 or response.status_code >= 500
+                    if not retryable:
+                        print(f"Failed to retrieve {relationship} of '{user.username}'.")
+                        print(f"Error: {response.status_code} {response.text[:200]}")
+                        return
+
+                    retries += 1
+                    if retries > max_retries:
+                        print(f"Failed to retrieve {relationship} of '{user.username}'. "
+                              f"Run again to resume.")
+                        print(f"Error: {response.status_code} {response.text[:200]}")
+                        return
+
+                    # Back off longer every time, or as long as asked to
+                    wait = UserManager._get_retry_after(response) or 2 ** retries * 5
+                    print(f"Request failed with status {response.status_code}, "
+                          f"retrying in {wait} seconds...")
+                    time.sleep(wait)
+                    continue
+
+                retries = 0
+                data = JsonCodec.loads(response.content)
+                accounts = [{
+                    "id": account.get('pk'),
+                    "username": account.get('username'),
+                    "full_name": account.get('full_name'),
+                } for account in data.get('users', [])]
+                file.write(b"".join(JsonCodec.dumps(account) + b"\n"
+                                    for account in accounts))
+                file.flush()
+
+                cursor = {
+                    "next_max_id": data.get('next_max_id'),
+                    "offset": file.tell(),
+                    "complete": not data.get('next_max_id'),
+                }
+                # Replace the cursor file whole, so it's never half written
+                with open(f"{cursor_filepath}.tmp", 'w', encoding='utf-8') as cursor_file:
+                    json.dump(cursor, cursor_file)
+                os.replace(f"{cursor_filepath}.tmp", cursor_filepath)
+
+                yield from accounts
+
+                if cursor["complete"]:
+                    print(f"All {relationship} of '{user.username}' saved to:")
+                    print(os.path.realpath(filepath))
+                    return
+
 
 class PostManager:
     with open("urls.json", encoding='utf-8') as f:
         URLS = json.load(f)["instagram"]
 
-    def __init__(self, session):
+    def __init__(self,
+                 session,
+                 archive: ResponseArchive = None,
+                 store: DataStore = None,
+                 registry: UserRegistry = None):
         self.session = session
+        # When set, post and user responses are stored here instead of
+        # json/posts and json/users.
+        self.archive = archive
+        # When set, each post is saved here with its comments, likes and
+        # the users attached to them.
+        self.store = store
+        # Shares one User, and one copy of each username, between every
+        # post retrieved.
+        self.registry = registry if registry is not None else UserRegistry()
         self.posts = []
 
-    def get_user_posts(self, *args, **kwargs) -> None:
+    def get_user_posts(self,
+                       *args,
+                       frontier: WorkQueue = None,
+                       batch_size: int = 10,
+                       **kwargs) -> None:
         """
         Retrieves the json data for multiple user inputted posts.
 
         Converts all users that commented and liked the post into `User`
         objects.
 
+        If `frontier` is given, the shortcodes are added to it and then
+        claimed from it in batches, so a crawl that stops part way can
+        be continued by running this again with the same frontier.
+        Shortcodes left over from an earlier run are crawled as well.
+
         Args:
             *args: Additional arguments to pass to the `GET` request
                 of instance `session`.
+            frontier: `WorkQueue`, such as `CrawlFrontier`, to track the
+                shortcodes in.
+            batch_size: Shortcodes to claim from `frontier` at a time.
             **kwargs: Additional arguments to pass to the `GET` request
                 of instance `session`.
         """
+        if frontier:
+            pending = frontier.counts(WorkQueue.SHORTCODE)[WorkQueue.PENDING]
+            if pending:
+                print(f"{pending} posts from a previous search will be resumed.")
         print(f"Input instagram post url codes, or full URLs "
               f"(format: {PostManager.URLS['user-post']}[URL_CODE]/)")
         print("When you're finished inputting Posts to get, type 'e'")
@@ -654,60 +1197,145 @@ class PostManager:
             if user_post == "e":
                 break
 
-            posts_to_get.append(user_post)
-
-        for user_post in posts_to_get:
             # Only take the last part of the url, the actual post code.
             url_code = re.search('/*([a-zA-Z0-9-_]+)/*$', user_post)
             if url_code:
                 # A match was found, so get the match
-                url_code = url_code.group(1)
-                params = {
-                    "can_support_threading": "true",
-                    "permalink_enabled": "false",
-                }
-                converted_post = Post(self.get_post_data(url_code,
-                                                         *args,
-                                                         params=params,
-                                                         **kwargs))
-                # Convert all usernames found in post's likes into User
-                # objects.
-                if converted_post.likes:
-                    # Create a User object for all existing likes.
-                    # Index to 0 as a list is returned by create_users.
-                    for user in converted_post.likes:
-                        converted_post.likes[user] = UserManager.create_users(
-                            user=user,
-                            session=self.session,
-                        )[0]
-
-                if converted_post.comments:
-                    # There's comments on the post
-                    for comment in converted_post.comments:
-                        if comment.username in converted_post.likes:
-                            # There already exists a user object for this username
-                            comment.user = converted_post.likes[comment.username]
-                        else:
-                            # Create a new User for this comment
-                            comment.user = UserManager.create_users(
-                                user=comment.username,
-                                session=self.session,
-                            )[0]
-
-                posts.append(converted_post)
-
-        self.posts = posts
+                posts_to_get.append(url_code.group(1))
+
+        if not frontier:
+            for url_code in posts_to_get:
+                posts.append(self.get_user_post(url_code, *args, **kwargs))
+
+            self.posts = posts
+            return
+
+        frontier.add(WorkQueue.SHORTCODE, posts_to_get)
+        self.posts = self.process_queue(frontier, batch_size, *args, **kwargs)
+
+    def process_queue(self,
+                      queue: WorkQueue,
+                      batch_size: int = 10,
+                      *args,
+                      **kwargs) -> list:
+        """
+        Retrieves posts claimed from `queue` until it's empty.
+
+        Can be run by workers on several machines sharing one queue,
+        such as a `RedisWorkQueue`. Each shortcode is reported back to
+        `queue` as done or failed, and the rest of the batch has its
+        lease renewed after each one.
+
+        Args:
+            queue: `WorkQueue` to claim shortcodes from.
+            batch_size: Shortcodes to claim at a time.
+            *args: Additional arguments to pass to the `GET` request
+                of instance `session`.
+            **kwargs: Additional arguments to pass to the `GET` request
+                of instance `session`.
+
+        Returns:
+            `list` of `Post` objects that were retrieved.
+        """
+        posts = []
+        while True:
+            claimed_codes = queue.claim(WorkQueue.SHORTCODE, batch_size)
+            if not claimed_codes:
+                break
+
+            for position, url_code in enumerate(claimed_codes):
+                try:
+                    posts.append(self.get_user_post(url_code, *args, **kwargs))
+                except requests.exceptions.RequestException as error:
+                    queue.fail(WorkQueue.SHORTCODE, url_code, str(error))
+                except Exception as error:
+                    # Responses that could not be parsed
+                    queue.fail(WorkQueue.SHORTCODE, url_code, f"{type(error).__name__}: {error}")
+                else:
+                    queue.complete(WorkQueue.SHORTCODE, url_code)
+
+                queue.heartbeat(WorkQueue.SHORTCODE, claimed_codes[position + 1:])
+
+        return posts
+
+    def get_user_post(self, url_code: str, *args, **kwargs) -> Post:
+        """
+        Retrieves a single post, and the users that liked or commented.
+
+        Args:
+            url_code: Shortcode of the post.
+            *args: Additional arguments to pass to the `GET` request
+                of instance `session`.
+            **kwargs: Additional arguments to pass to the `GET` request
+                of instance `session`.
+
+        Returns:
+            `Post` with `User` objects for its likes and comments.
+        """
+        params = {
+            "can_support_threading": "true",
+            "permalink_enabled": "false",
+        }
+        content = self.get_post_content(url_code, *args, params=params, **kwargs)
+        if self.archive is not None:
+            self.archive.write(ResponseArchive.POST, url_code, content)
+        converted_post = Post(JsonCodec.loads(content), raw=content,
+                              save=self.archive is None)
+        self.registry.intern_post(converted_post)
+        # Convert all usernames found in post's likes into User
+        # objects.
+        if converted_post.likes:
+            # Create a User object for all existing likes.
+            # Index to 0 as a list is returned by create_users.
+            for user in converted_post.likes:
+                converted_post.likes[user] = UserManager.create_users(
+                    user=user,
+                    session=self.session,
+                    archive=self.archive,
+                    registry=self.registry,
+                )[0]
+
+        if converted_post.comments:
+            # There's comments on the post
+            for comment in converted_post.comments.values():
+                if comment.username in converted_post.likes:
+                    # There already exists a user object for this username
+                    comment.user = converted_post.likes[comment.username]
+                else:
+                    # Create a new User for this comment
+                    comment.user = UserManager.create_users(
+                        user=comment.username,
+                        session=self.session,
+                        archive=self.archive,
+                        registry=self.registry,
+                    )[0]
+
+        if self.store is not None:
+            self.store.add_post(converted_post)
+
+        return converted_post
 
     def get_post_data(self, short_code: str, *args, **kwargs) -> dict:
         """
         Gets the `json` data from an instagram post.
 
+        See `get_post_content` for the arguments.
+
+        Returns:
+            `dict` containing all information about the instagram post.
+        """
+        return JsonCodec.loads(self.get_post_content(short_code, *args, **kwargs))
+
+    def get_post_content(self, short_code: str, *args, **kwargs) -> bytes:
+        """
+        Gets the raw `json` body of the api response for an instagram post.
+
         Will accept any instagram post url code, which is normally
         random letters and numbers:
             https://www.instagram.com/p/[URL_CODE]/
 
         Examples:
-            get_post_data(url_code="CCeGDPkDWJ4/")
+            get_post_content(short_code="CCeGDPkDWJ4/")
 
         Args:
             short_code: Unique shortcode for the instagram post, usually
@@ -717,7 +1345,8 @@ class PostManager:
                 GET.
 
         Returns:
-            `dict` containing all information about the instagram post.
+            `bytes` of json containing all information about the
+            instagram post.
         """
         # Get the html of the post page to ge the media_id
         response = self.session.get(f"{self.URLS['user-post']}{short_code}", *args, **kwargs)
@@ -725,11 +1354,12 @@ class PostManager:
         media_id = self.extract_id_from_post(response.text)
 
         # Return info about the post
-        return self.session.get(f"{self.URLS['user-post-api']}"
-                                f"{media_id}/"
-                                f"{self.URLS['user-post-api-end']}",
-                                *args,
-                                **kwargs).json()
+        response = self.session.get(f"{self.URLS['user-post-api']}"
+                                    f"{media_id}/"
+                                    f"{self.URLS['user-post-api-end']}",
+                                    *args,
+                                    **kwargs)
+        return response.content
 
     @staticmethod
     def extract_id_from_post(post_html: str) -> str:
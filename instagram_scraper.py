@@ -3,7 +3,9 @@ from file_manager import FileManager
 from spoof import Proxies
 from bs4 import BeautifulSoup
 from user_input import UserInput
+from json_codec import JsonCodec
 import requests
+import time
 import json
 
 
@@ -42,7 +44,7 @@ class InstagramScraper(InstagramSession):
             with open(f"json/{tag}.json", 'w', encoding='utf-8') as f:
                 f.write(json_data)
 
-        return json.loads(json_data)
+        return JsonCodec.loads(json_data)
 
     def get(self,
             url: str,
@@ -61,7 +63,9 @@ class InstagramScraper(InstagramSession):
         applied to the request.
 
         If the proxy is bad, then a timeout error will be raised. Try
-        to use a newer or more elite proxy if this happens.
+        to use a newer or more elite proxy if this happens. Every
+        result is recorded in the proxy's `ProxyHealth`, so proxies that
+        keep failing stop being picked for a while.
 
         Args:
             url: Url to send the GET to.
@@ -79,12 +83,15 @@ class InstagramScraper(InstagramSession):
             if choice == "random":
                 # If user wants a random one
                 proxy = self.proxy.get_proxies(single=True)
+                if proxy is None:
+                    # Never send the request without the proxy that was asked for
+                    raise requests.exceptions.ProxyError("No healthy proxies are available.")
                 print("Your generated proxy:")
                 print(proxy)
                 # Set up proxies dict to apply to session request.
                 proxies = {
                     "https": proxy.proxy,
-                    "http": proxy,
+                    "http": proxy.proxy,
                 }
             else:
 
@@ -111,15 +118,30 @@ class InstagramScraper(InstagramSession):
         else:
 
             proxies = {}
+            return super().get(url, proxies=proxies, *args, **kwargs)
+
+        start = time.monotonic()
+        try:
+            response = super().get(url, proxies=proxies, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            # Timeouts and connection errors mean the proxy is bad
+            proxy.health.record_failure()
+            raise
+
+        if response.status_code == requests.codes.too_many_requests \
+                or response.status_code >= 500:
+            # The proxy works, but is being blocked or is overloaded
+            proxy.health.record_failure()
+        else:
+            proxy.health.record_success(time.monotonic() - start)
 
-        return super().get(url, proxies=proxies, *args, **kwargs)
+        return response
 
     def get_user_proxy(self):
         """Get a proxy that meets user defined standards and return it."""
         proxy_extract_settings = self.proxy.get_usr_proxy_settings()
-        proxy = Proxies.extract_by_type(self.proxy.get_proxies(),
-                                        proxy_extract_settings,
-                                        single=True)
+        proxy = self.proxy.get_proxies_by_type(proxy_extract_settings,
+                                               single=True)
 
         return proxy
 
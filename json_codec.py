@@ -0,0 +1,143 @@
+import argparse
+import glob
+import json
+import time
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec:
+    """
+    Encodes and decodes json with the fastest library installed.
+
+    Uses orjson if it's installed, then ujson, and falls back to the
+    standard `json` library otherwise. Json is always encoded to utf-8
+    `bytes`, so it can be written straight to a binary file.
+
+    Examples:
+        data = JsonCodec.loads(response.content)
+        with open("file.json", 'wb') as file:
+            JsonCodec.dump(data, file)
+
+    Attributes:
+        BACKEND (str): Name of the library being used.
+    """
+
+    if orjson:
+        BACKEND = "orjson"
+    elif ujson:
+        BACKEND = "ujson"
+    else:
+        BACKEND = "json"
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def loads(data: [bytes, str]) -> any:
+        """Decodes json `data`."""
+        if orjson:
+            return orjson.loads(data)
+        elif ujson:
+            return ujson.loads(data)
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(data: any) -> bytes:
+        """Encodes `data` as utf-8 json `bytes`."""
+        try:
+            if orjson:
+                return orjson.dumps(data)
+            elif ujson:
+                return ujson.dumps(data, ensure_ascii=False).encode('utf-8')
+        except (TypeError, OverflowError):
+            # Such as integers too large or dict keys that aren't strings,
+            # which the standard library can still handle.
+            pass
+
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    @staticmethod
+    def load(file) -> any:
+        """Decodes the json in a file opened in binary mode."""
+        return JsonCodec.loads(file.read())
+
+    @staticmethod
+    def dump(data: any, file) -> None:
+        """Encodes `data` into a file opened in binary mode."""
+        file.write(JsonCodec.dumps(data))
+
+    @staticmethod
+    def benchmark(filepaths: list, repeat: int = 20) -> dict:
+        """
+        Times decoding and encoding of `filepaths` with each library.
+
+        Args:
+            filepaths: Json files to time.
+            repeat: Times to decode and encode each file.
+
+        Returns:
+            `dict` of each installed library and its decode and encode
+            time in seconds.
+        """
+        payloads = []
+        for filepath in filepaths:
+            with open(filepath, 'rb') as file:
+                payloads.append(file.read())
+
+        backends = {"json": (json.loads, json.dumps)}
+        if ujson:
+            backends["ujson"] = (ujson.loads, ujson.dumps)
+        if orjson:
+            backends["orjson"] = (orjson.loads, orjson.dumps)
+
+        results = {}
+        for name, (loads, dumps) in backends.items():
+            start = time.perf_counter()
+            decoded = [loads(payload) for _ in range(repeat) for payload in payloads]
+            decode_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for data in decoded:
+                dumps(data)
+            encode_time = time.perf_counter() - start
+
+            results[name] = {"decode": decode_time, "encode": encode_time}
+
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time each installed json library on saved json files."
+    )
+    parser.add_argument("filepaths", nargs="*",
+                        help="Json files to time. Defaults to everything in "
+                             "json/users and json/posts.")
+    parser.add_argument("--repeat", type=int, default=20)
+    arguments = parser.parse_args()
+
+    filepaths = arguments.filepaths or (glob.glob("json/users/*.json")
+                                        + glob.glob("json/posts/*.json"))
+    if not filepaths:
+        print("No json files found. Save some users or posts first.")
+    else:
+        total_size = sum(os.path.getsize(filepath) for filepath in filepaths)
+        print(f"{len(filepaths)} files, {total_size / 1024:.0f}KB, "
+              f"{arguments.repeat} times each. Using: {JsonCodec.BACKEND}")
+        baseline = None
+        for name, times in JsonCodec.benchmark(filepaths, arguments.repeat).items():
+            total = times["decode"] + times["encode"]
+            baseline = baseline or total
+            print(f"{name:>8}: decode {times['decode']:.3f}s | "
+                  f"encode {times['encode']:.3f}s | "
+                  f"{baseline / total:.1f}x json")
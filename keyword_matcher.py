@@ -0,0 +1,267 @@
+from json_codec import JsonCodec
+import argparse
+import glob
+import sys
+import re
+
+
+class KeywordMatch:
+    """
+    Single watched term found in a caption or comment.
+
+    Attributes:
+        term (str): Term from the watchlist that was found.
+        start (int): Position in the text the match starts at.
+        end (int): Position in the text the match ends at.
+        short_code (str): Shortcode of the post the text is on.
+        comment_pk (str): Unique id of the comment, or `None` if the
+            text is the caption.
+        username (str): Username of the account that wrote the text.
+    """
+
+    def __init__(self,
+                 term: str,
+                 start: int,
+                 end: int,
+                 short_code: str = None,
+                 comment_pk: str = None,
+                 username: str = None,
+                 ):
+        self.term = term
+        self.start = start
+        self.end = end
+        self.short_code = short_code
+        self.comment_pk = comment_pk
+        self.username = username
+
+    def __str__(self):
+        return f"'{self.term}' in {self.short_code} " \
+               f"({'caption' if self.comment_pk is None else f'comment {self.comment_pk}'}) " \
+               f"by @{self.username}"
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class KeywordMatcher:
+    """
+    Finds every term of a large watchlist in a single pass over a text.
+
+    Terms are built once into an Aho-Corasick automaton: a trie of the
+    terms, where each node also links to the longest suffix of itself
+    that is another node. Texts are scanned one character at a time,
+    so the time taken depends on the length of the text and not on the
+    amount of terms.
+
+    Matching ignores case and how much whitespace is between words, and
+    a term only matches as a whole word, so `apple` is found in "Apple's
+    new phone" but not in "pineapple", and `air max` is found in
+    "Air   Max".
+    Overlapping terms are all reported, such as both `apple` and
+    `apple watch` in "my apple watch".
+
+    Examples:
+        matcher = KeywordMatcher(["nike", "air max", "adidas"])
+        matcher.find("Loving my new Air Max!")
+        for match in matcher.scan_posts(posts):
+            print(match)
+
+    Attributes:
+        terms (list): Terms being watched, as they were given.
+        _transitions (list): Child nodes of each node, by character.
+        _fail (list): Node each node falls back to when there is no
+            child for the next character.
+        _outputs (list): Terms that end at each node, as
+            `(term index, length)` pairs, including the terms of the
+            nodes it falls back to.
+    """
+
+    # Whitespace that isn't a single space
+    _WHITESPACE = re.compile(r"\s{2,}|[^\S ]")
+
+    def __init__(self, terms: list):
+        self.terms = []
+        self._transitions = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+
+        for term in terms:
+            normalised = self._normalise(" ".join(term.split()))
+            if not normalised:
+                continue
+
+            node = 0
+            for character in normalised:
+                child = self._transitions[node].get(character)
+                if child is None:
+                    child = len(self._transitions)
+                    self._transitions[node][character] = child
+                    self._transitions.append({})
+                    self._fail.append(0)
+                    self._outputs.append(())
+                node = child
+            self._outputs[node] += ((len(self.terms), len(normalised)),)
+            self.terms.append(term)
+
+        # Breadth first, so each node's fall back is linked before its
+        # children need it.
+        queue = list(self._transitions[0].values())
+        for node in queue:
+            for character, child in self._transitions[node].items():
+                fail = self._fail[node]
+                while fail and character not in self._transitions[fail]:
+                    fail = self._fail[fail]
+                fallback = self._transitions[fail].get(character, 0)
+                self._fail[child] = fallback if fallback != child else 0
+                self._outputs[child] += self._outputs[self._fail[child]]
+                queue.append(child)
+
+    def __len__(self):
+        return len(self.terms)
+
+    @staticmethod
+    def _normalise(text: str) -> str:
+        """Lowercases `text`, keeping every character in place."""
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters lowercase into two, such as "İ"
+            lowered = "".join(character.lower() if len(character.lower()) == 1
+                              else character for character in text)
+        return lowered
+
+    def _collapse(self, text: str) -> tuple:
+        """
+        Turns each run of whitespace in `text` into a single space, the
+        same as the terms.
+
+        Returns:
+            `tuple` of the collapsed text, and the position in `text` of
+            each of its characters, or `None` if nothing was collapsed.
+        """
+        if not self._WHITESPACE.search(text):
+            return text, None
+
+        characters = []
+        positions = []
+        for position, character in enumerate(text):
+            if character.isspace():
+                if characters and characters[-1] == " ":
+                    continue
+                character = " "
+            characters.append(character)
+            positions.append(position)
+        return "".join(characters), positions
+
+    @staticmethod
+    def _is_word(character: str) -> bool:
+        return character.isalnum() or character == "_"
+
+    def find(self, text: str) -> list:
+        """
+        Finds every watched term in `text`.
+
+        Returns:
+            `list` of `(term, start, end)` tuples, in the order they end
+            in `text`.
+        """
+        if not text:
+            return []
+
+        transitions = self._transitions
+        fail = self._fail
+        outputs = self._outputs
+        is_word = self._is_word
+        normalised, positions = self._collapse(self._normalise(text))
+        matches = []
+        node = 0
+        for position, character in enumerate(normalised):
+            while node and character not in transitions[node]:
+                node = fail[node]
+            node = transitions[node].get(character, 0)
+            if not outputs[node]:
+                continue
+
+            end = position + 1
+            for term_index, length in outputs[node]:
+                start = end - length
+                # Whole words only, where the term starts or ends with a
+                # word character.
+                if start > 0 and is_word(normalised[start]) and is_word(normalised[start - 1]):
+                    continue
+                if end < len(normalised) and is_word(character) and is_word(normalised[end]):
+                    continue
+                if positions is None:
+                    matches.append((self.terms[term_index], start, end))
+                else:
+                    matches.append((self.terms[term_index], positions[start],
+                                    positions[end - 1] + 1))
+
+        return matches
+
+    def scan_post(self, post):
+        """
+        Finds the watched terms in a `Post` caption and comments.
+
+        Yields:
+            `KeywordMatch` for each term found.
+        """
+        caption = getattr(post, "caption", None)
+        if caption and caption.text:
+            for term, start, end in self.find(caption.text):
+                yield KeywordMatch(term, start, end, post.short_code, None, caption.username)
+
+        for comment in getattr(post, "comments", {}).values():
+            for term, start, end in self.find(comment.text):
+                yield KeywordMatch(term, start, end, post.short_code,
+                                   comment.pk, comment.username)
+
+    def scan_posts(self, posts):
+        """Yields a `KeywordMatch` for each term found in many `Post` objects."""
+        for post in posts:
+            yield from self.scan_post(post)
+
+    def scan_post_json(self, json_data: dict):
+        """
+        Finds the watched terms in a saved post, without creating a `Post`.
+
+        Args:
+            json_data: Json data of a post, as saved to `json/posts`.
+
+        Yields:
+            `KeywordMatch` for each term found.
+        """
+        try:
+            base = json_data["items"][0]
+        except (KeyError, IndexError):
+            return
+
+        short_code = base.get('code')
+        caption = base.get('caption')
+        if caption and caption.get('text'):
+            for term, start, end in self.find(caption['text']):
+                yield KeywordMatch(term, start, end, short_code, None,
+                                   base["user"]["username"])
+
+        for comment in base.get('comments') or []:
+            for term, start, end in self.find(comment.get('text')):
+                yield KeywordMatch(term, start, end, short_code,
+                                   comment.get('pk'), comment['user']['username'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print every watched term found in saved posts, as json lines."
+    )
+    parser.add_argument("terms", help="File with one term or phrase per line.")
+    parser.add_argument("posts", nargs="*",
+                        help="Post json files. Defaults to everything in json/posts.")
+    arguments = parser.parse_args()
+
+    with open(arguments.terms, encoding='utf-8') as file:
+        matcher = KeywordMatcher(file.read().splitlines())
+
+    filepaths = arguments.posts or sorted(glob.glob("json/posts/*.json"))
+    for filepath in filepaths:
+        with open(filepath, 'rb') as file:
+            for match in matcher.scan_post_json(JsonCodec.load(file)):
+                sys.stdout.buffer.write(JsonCodec.dumps(match.to_dict()) + b"\n")
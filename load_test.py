@@ -0,0 +1,303 @@
+from sessions import InstagramSession
+from instagram_data import UserManager, PostManager
+from mock_instagram import MockInstagramServer, MockInstagramAdapter
+from json_codec import JsonCodec
+from collections import Counter
+import numpy as np
+import contextlib
+import subprocess
+import argparse
+import threading
+import requests
+import time
+import os
+import io
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+class LoadTest:
+    """
+    Drives profile lookups and post fetches at a target concurrency or
+    rate, and measures how the scraper keeps up.
+
+    Each worker thread runs operations back to back until `duration`
+    is up. With a `rate`, operations are instead started on a fixed
+    schedule shared by every worker, and latency is measured from when
+    each was scheduled to start, so time spent waiting behind slow
+    operations is counted too.
+
+    Operations:
+        PROFILES: `UserManager.create_user` for a username.
+        POSTS: `PostManager.get_post_data` for a shortcode, which is the
+            post page and the media info.
+        MIXED: Alternates between the two.
+
+    Examples:
+        test = LoadTest(session, LoadTest.PROFILES, concurrency=50, duration=30)
+        result = test.run()
+        LoadTest.save(result, "load_tests/profiles.json")
+
+    Attributes:
+        session (InstagramSession): Session every worker shares.
+        operation (str): `PROFILES`, `POSTS` or `MIXED`.
+        concurrency (int): Amount of worker threads.
+        duration (float): Seconds to run for.
+        rate (float): Operations to start per second, or `None` to run
+            each worker as fast as it can.
+        accounts (int): Amount of different usernames and shortcodes to
+            cycle through.
+        _statuses (threading.local): Status codes of the responses to
+            the operation running on each thread.
+    """
+
+    PROFILES = "profiles"
+    POSTS = "posts"
+    MIXED = "mixed"
+
+    def __init__(self,
+                 session: InstagramSession,
+                 operation: str = PROFILES,
+                 concurrency: int = 10,
+                 duration: float = 30.0,
+                 rate: float = None,
+                 accounts: int = 1000,
+                 ):
+        self.session = session
+        self.operation = operation
+        self.concurrency = concurrency
+        self.duration = duration
+        self.rate = rate
+        self.accounts = accounts
+        self._post_manager = PostManager(session)
+        self._statuses = threading.local()
+        session.hooks["response"].append(self._record_status)
+
+    def _record_status(self, response, *args, **kwargs):
+        """Response hook that keeps the status codes of the current operation."""
+        statuses = getattr(self._statuses, "codes", None)
+        if statuses is not None:
+            statuses.append(response.status_code)
+
+    def _run_operation(self, position: int) -> None:
+        """Runs the `position`th operation."""
+        operation = self.operation
+        if operation == self.MIXED:
+            operation = self.PROFILES if position % 2 else self.POSTS
+
+        if operation == self.PROFILES:
+            # Not saved, so disk writes aren't measured and no files are left
+            UserManager.create_user(self.session, f"user_{position % self.accounts}",
+                                    save=False)
+        else:
+            self._post_manager.get_post_data(f"Load{position % self.accounts:07d}")
+
+    def _worker(self, start: float, counter, results: list, lock: threading.Lock) -> None:
+        """Runs operations until the end of the test."""
+        end = start + self.duration
+        while True:
+            with lock:
+                position = next(counter)
+            scheduled = None
+            if self.rate:
+                scheduled = start + position / self.rate
+                if scheduled >= end:
+                    return
+                wait = scheduled - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            elif time.perf_counter() >= end:
+                return
+
+            self._statuses.codes = []
+            began = time.perf_counter()
+            error = None
+            try:
+                self._run_operation(position)
+            except requests.exceptions.RequestException as exception:
+                error = type(exception).__name__
+            except (KeyError, IndexError, TypeError, ValueError) as exception:
+                # Responses that could not be parsed
+                error = f"parse:{type(exception).__name__}"
+            finished = time.perf_counter()
+
+            failed = [code for code in self._statuses.codes if code >= 400]
+            if error is None and failed:
+                error = f"http:{failed[0]}"
+            results.append((finished - (scheduled or began), error, len(self._statuses.codes)))
+
+    @staticmethod
+    def _get_usage() -> dict:
+        """Gets the cpu seconds used and the memory of this process."""
+        if resource is None:
+            return {"cpu": time.process_time(), "max_rss_mb": None, "rss_mb": None}
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        rss = None
+        try:
+            with open("/proc/self/statm") as file:
+                rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        except (OSError, ValueError):
+            pass
+        # ru_maxrss is in kilobytes on Linux
+        return {"cpu": usage.ru_utime + usage.ru_stime,
+                "max_rss_mb": usage.ru_maxrss / 1024, "rss_mb": rss}
+
+    def run(self) -> dict:
+        """
+        Runs the load test.
+
+        Returns:
+            `dict` of the settings and results, including throughput,
+            latency percentiles in milliseconds, errors by type, cpu
+            time and memory.
+        """
+        results = []
+        lock = threading.Lock()
+        counter = iter(range(10 ** 12))
+        started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        before = self._get_usage()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(start, counter, results, lock))
+                   for _ in range(self.concurrency)]
+        # Profile lookups print every account found
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+        after = self._get_usage()
+
+        latencies = np.array([latency for latency, error, _ in results]) * 1000
+        errors = Counter(error for _, error, _ in results if error)
+        successful = len(results) - sum(errors.values())
+        percentiles = ([float(value) for value in np.percentile(latencies, [50, 95, 99])]
+                       if len(latencies) else [None] * 3)
+        cpu = after["cpu"] - before["cpu"]
+        return {
+            "operation": self.operation,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "duration": self.duration,
+            "commit": self._get_commit(),
+            "started": started,
+            "elapsed": elapsed,
+            "operations": len(results),
+            "requests": sum(requests_sent for _, _, requests_sent in results),
+            "successful": successful,
+            "throughput": successful / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "mean": float(latencies.mean()) if len(latencies) else None,
+                "p50": percentiles[0],
+                "p95": percentiles[1],
+                "p99": percentiles[2],
+                "max": float(latencies.max()) if len(latencies) else None,
+            },
+            "errors": dict(errors),
+            "error_rate": sum(errors.values()) / len(results) if results else 0.0,
+            "cpu_seconds": cpu,
+            "cpu_percent": cpu / elapsed * 100 if elapsed else 0.0,
+            "max_rss_mb": after["max_rss_mb"],
+            "rss_mb": after["rss_mb"],
+        }
+
+    @staticmethod
+    def _get_commit() -> [str, None]:
+        """Gets the current git commit, so results can be compared across commits."""
+        try:
+            return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                  capture_output=True, text=True, timeout=5,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))
+                                  ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    @staticmethod
+    def save(result: dict, filename: str) -> None:
+        """Writes a result from `run` to `filename` as json."""
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, 'wb') as file:
+            JsonCodec.dump(result, file)
+
+    @staticmethod
+    def print_result(result: dict) -> None:
+        latency = result["latency_ms"]
+        print(f"{result['operation']} | concurrency {result['concurrency']} | "
+              f"rate {result['rate'] or 'max'} | {result['elapsed']:.1f}s")
+        print(f"Operations: {result['operations']} ({result['requests']} requests), "
+              f"{result['successful']} successful")
+        print(f"Throughput: {result['throughput']:.1f} operations/s")
+        if latency["p50"] is not None:
+            print(f"Latency: p50 {latency['p50']:.1f}ms | p95 {latency['p95']:.1f}ms | "
+                  f"p99 {latency['p99']:.1f}ms | max {latency['max']:.1f}ms")
+        print(f"Errors: {result['errors'] or 'none'} ({result['error_rate']:.1%})")
+        print(f"CPU: {result['cpu_seconds']:.1f}s ({result['cpu_percent']:.0f}%) | "
+              f"RSS: {result['rss_mb'] or 0:.0f}MB (max {result['max_rss_mb'] or 0:.0f}MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test profile lookups and post fetches against a mock instagram."
+    )
+    parser.add_argument("operation", choices=[LoadTest.PROFILES, LoadTest.POSTS, LoadTest.MIXED])
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Operations to start per second. Runs as fast as "
+                             "possible if not given.")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--accounts", type=int, default=1000,
+                        help="Different usernames and shortcodes to cycle through.")
+    parser.add_argument("--url", default=None,
+                        help="Mock server to test. Defaults to INSTAGRAM_MOCK_URL.")
+    parser.add_argument("--start-mock", action="store_true",
+                        help="Start a mock server in this process instead.")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Average latency of the started mock server.")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--login", action="store_true", help="Log in before starting.")
+    parser.add_argument("--output", default=None,
+                        help="Json file to write the result to. Defaults to "
+                             "load_tests/[OPERATION]_[TIME].json")
+    arguments = parser.parse_args()
+
+    output = arguments.output or (f"load_tests/{arguments.operation}_"
+                                  f"{time.strftime('%Y%m%d_%H%M%S')}.json")
+    # Checked before the run, so a result is never lost after it
+    try:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    except OSError as error:
+        parser.error(f"Can't write the result to '{output}': {error}")
+
+    server = None
+    mock_url = arguments.url
+    if arguments.start_mock:
+        server = MockInstagramServer(("localhost", 0), arguments.latency,
+                                     arguments.error_rate, arguments.rate_limit_rate)
+        server.start()
+        mock_url = server.url
+    mock_url = mock_url or os.getenv('INSTAGRAM_MOCK_URL')
+    if not mock_url:
+        # Never load test the real site
+        parser.error("Give a --url, set INSTAGRAM_MOCK_URL or use --start-mock.")
+
+    session = InstagramSession(mock_url=mock_url)
+    # Allow a connection per worker, instead of the default pool
+    MockInstagramAdapter.mount(session, mock_url, pool_maxsize=arguments.concurrency)
+    if arguments.login:
+        session.login(fresh=True)
+
+    load_test = LoadTest(session, arguments.operation, arguments.concurrency,
+                         arguments.duration, arguments.rate, arguments.accounts)
+    load_result = load_test.run()
+    if server:
+        server.shutdown()
+
+    LoadTest.print_result(load_result)
+    LoadTest.save(load_result, output)
+    print(f"Result saved to: {os.path.realpath(output)}")
@@ -0,0 +1,365 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, urlunsplit, parse_qs
+from requests.adapters import HTTPAdapter
+from collections import Counter
+from json_codec import JsonCodec
+import argparse
+import threading
+import random
+import time
+import zlib
+import re
+
+
+class MockInstagramServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the instagram endpoints in `urls.json`, for load
+    testing without sending anything to instagram.
+
+    Every account, post and tag gets a synthetic payload in the same
+    shape as the real api, generated from its name, so the same name
+    always gets the same data. Each response can be slowed down, and a
+    share of them can fail with a 500 or be rate limited with a 429,
+    the same as the real site under load.
+
+    Point an `InstagramSession` at the server by passing its `url` as
+    `mock_url`, or by setting `INSTAGRAM_MOCK_URL` in the `.env` file.
+
+    Examples:
+        server = MockInstagramServer(("localhost", 8765), latency=0.05,
+                                     rate_limit_rate=0.02)
+        server.start()
+        session = InstagramSession(mock_url=server.url)
+        ...
+        server.shutdown()
+
+    Attributes:
+        latency (float): Average seconds to wait before each response.
+            Each wait is between half and one and a half times this.
+        error_rate (float): Share of responses that are a 500 error.
+        rate_limit_rate (float): Share of responses that are a 429.
+        seed (int): Seed mixed into every generated payload.
+        stats (Counter): Responses sent with each status code.
+        stats_lock (threading.Lock): Lock around `stats`.
+        media_codes (dict): Shortcode of each media id handed out in a
+            post page, so its info has the same shortcode.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self,
+                 address: tuple = ("localhost", 8765),
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 seed: int = 0,
+                 ):
+        super().__init__(address, MockInstagramHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.media_codes = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> threading.Thread:
+        """Serves requests from a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def get_random(self, key: str) -> random.Random:
+        """Gets a random generator that's always the same for `key`."""
+        return random.Random(zlib.crc32(key.encode('utf-8')) ^ self.seed)
+
+    def create_user(self, username: str) -> dict:
+        """Generates the profile of `username`, as `web_profile_info` returns it."""
+        generator = self.get_random(f"user:{username}")
+        user_id = str(generator.randrange(10 ** 9, 10 ** 11))
+        is_business = generator.random() < 0.2
+        return {"data": {"user": {
+            "id": user_id,
+            "fbid": str(generator.randrange(10 ** 15, 10 ** 16)),
+            "username": username,
+            "full_name": username.replace("_", " ").title(),
+            "biography": f"Hi, I'm {username}. #{generator.choice(MockInstagramHandler.WORDS)} "
+                         f"@{generator.choice(MockInstagramHandler.WORDS)}",
+            "biography_with_entities": {"entities": []},
+            "external_url": f"https://example.com/{username}" if generator.random() < 0.5 else None,
+            "edge_followed_by": {"count": int(generator.paretovariate(1.2) * 200)},
+            "edge_follow": {"count": generator.randrange(0, 2000)},
+            "category_name": "Creator" if generator.random() < 0.3 else None,
+            "pronouns": [],
+            "is_private": generator.random() < 0.1,
+            "is_verified": generator.random() < 0.05,
+            "is_business_account": is_business,
+            "is_professional_account": is_business or generator.random() < 0.2,
+            "is_joined_recently": generator.random() < 0.05,
+            "edge_owner_to_timeline_media": {"count": generator.randrange(0, 3000)},
+            "edge_felix_video_timeline": {"count": generator.randrange(0, 100)},
+            "profile_pic_url": f"https://example.com/{username}/profile.jpg",
+            "profile_pic_url_hd": f"https://example.com/{username}/profile_hd.jpg",
+            "business_address_json": None,
+            "business_email": f"{username}@example.com" if is_business else None,
+            "business_phone_number": None,
+            "business_category_name": None,
+            "connected_fb_page": None,
+        }}, "status": "ok"}
+
+    def create_post(self, media_id: str) -> dict:
+        """Generates the info of a post, as the media `info` endpoint returns it."""
+        generator = self.get_random(f"post:{media_id}")
+        short_code = self.media_codes.get(media_id, f"C{media_id[-10:]}")
+        username = f"user_{generator.randrange(1000)}"
+        created = int(time.time()) - generator.randrange(0, 365 * 24 * 3600)
+        image = {"width": 1080, "height": 1350,
+                 "url": f"https://example.com/p/{short_code}.jpg"}
+
+        def sentence(words: int) -> str:
+            return " ".join(generator.choice(MockInstagramHandler.WORDS) for _ in range(words))
+
+        comments = [{
+            "pk": str(generator.randrange(10 ** 17, 10 ** 18)),
+            "user_id": generator.randrange(10 ** 9, 10 ** 11),
+            "user": {"username": f"user_{generator.randrange(1000)}", "full_name": ""},
+            "text": sentence(generator.randrange(2, 15)),
+            "created_at": created + generator.randrange(0, 86400),
+            "type": 0,
+            "comment_like_count": generator.randrange(0, 50),
+        } for _ in range(generator.randrange(0, 12))]
+
+        return {"items": [{
+            "pk": media_id,
+            "id": f"{media_id}_{generator.randrange(10 ** 9, 10 ** 11)}",
+            "code": short_code,
+            "user": {"username": username, "full_name": username.title()},
+            "media_type": 1,
+            "image_versions2": {"candidates": [image]},
+            "original_width": 1080,
+            "original_height": 1350,
+            "taken_at": created,
+            "like_count": int(generator.paretovariate(1.1) * 20),
+            "comment_count": len(comments),
+            "likers": [{"username": f"user_{generator.randrange(1000)}"}
+                       for _ in range(generator.randrange(0, 8))],
+            "comments_disabled": False,
+            "comments": comments,
+            "caption": {"text": sentence(generator.randrange(3, 30)),
+                        "created_at_utc": created},
+            "like_and_view_counts_disabled": False,
+            "comment_likes_enabled": True,
+        }], "num_results": 1, "status": "ok"}
+
+    def create_friendships(self, user_id: str, relationship: str,
+                           count: int, max_id: int) -> dict:
+        """Generates a page of followers or following."""
+        generator = self.get_random(f"{relationship}:{user_id}")
+        total = generator.randrange(0, 5000)
+        end = min(max_id + count, total)
+        return {
+            "users": [{"pk": str(zlib.crc32(f"{user_id}:{position}".encode())),
+                       "username": f"user_{position}",
+                       "full_name": f"User {position}"}
+                      for position in range(max_id, end)],
+            "next_max_id": str(end) if end < total else None,
+            "status": "ok",
+        }
+
+
+class MockInstagramHandler(BaseHTTPRequestHandler):
+    """Answers a single request to a `MockInstagramServer`."""
+
+    # Keeps connections open, the same as the real site
+    protocol_version = "HTTP/1.1"
+    WORDS = ("love", "summer", "travel", "food", "photo", "instagood", "nature",
+             "friends", "happy", "style", "art", "sunset", "coffee", "fitness",
+             "weekend", "beach", "music", "tbt", "repost", "city")
+    POST_PAGE = re.compile(r"^/p/([\w-]+)/?$")
+    MEDIA_INFO = re.compile(r"^/api/v1/media/(\d+)/info/?$")
+    FRIENDSHIPS = re.compile(r"^/api/v1/friendships/(\w+)/(followers|following)/?$")
+
+    def log_message(self, format, *args):
+        # Printing every request would slow down load tests
+        pass
+
+    def _send(self,
+              status: int,
+              body: [bytes, dict],
+              content_type: str = "application/json",
+              headers: dict = None,
+              ) -> None:
+        """Sends a response, and counts it in the server stats."""
+        if isinstance(body, dict):
+            body = JsonCodec.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            if isinstance(value, list):
+                for item in value:
+                    self.send_header(name, item)
+            else:
+                self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.stats_lock:
+            self.server.stats[status] += 1
+
+    def _send_html(self, html: str, headers: dict = None) -> None:
+        self._send(200, html.encode('utf-8'), "text/html; charset=utf-8", headers)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _simulate_load(self) -> bool:
+        """
+        Waits for the latency, and sends an error or rate limit response
+        if one was drawn.
+
+        Returns:
+            `True` if a response was already sent.
+        """
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+
+        draw = random.random()
+        if draw < server.rate_limit_rate:
+            self._send(429, {"message": "Please wait a few minutes before you try again.",
+                             "status": "fail"}, headers={"Retry-After": "1"})
+            return True
+        if draw < server.rate_limit_rate + server.error_rate:
+            self._send(500, {"message": "Internal server error", "status": "fail"})
+            return True
+        return False
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if self._simulate_load():
+            return
+
+        if path in ("/", "/accounts/login/"):
+            csrf_token = f"{random.getrandbits(128):032x}"
+            self._send_html("<html><head><title>Instagram</title></head><body></body></html>",
+                            {"Set-Cookie": f"csrftoken={csrf_token}; Path=/"})
+        elif path == "/accounts/edit/":
+            if "sessionid=" in (self.headers.get("Cookie") or ""):
+                self._send_html("<html><body>Edit profile</body></html>")
+            else:
+                self._send(302, b"", "text/html", {"Location": "/accounts/login/"})
+        elif path == "/api/v1/users/web_profile_info/":
+            username = query.get("username")
+            if not username or username.startswith("missing"):
+                self._send(404, {"message": "User not found", "status": "fail"})
+            else:
+                self._send(200, self.server.create_user(username))
+        elif path == "/api/v1/tags/web_info/":
+            tag = query.get("tag_name", "")
+            generator = self.server.get_random(f"tag:{tag}")
+            self._send(200, {"data": {"name": tag, "id": str(zlib.crc32(tag.encode())),
+                                      "media_count": generator.randrange(0, 10 ** 8)},
+                             "status": "ok"})
+        elif self.POST_PAGE.match(path):
+            short_code = self.POST_PAGE.match(path).group(1)
+            media_id = str(zlib.crc32(short_code.encode()) * 1000 + 7)
+            self.server.media_codes[media_id] = short_code
+            self._send_html(f'<html><head><script type="application/json">'
+                            f'{{"media_id":"{media_id}"}}</script></head></html>')
+        elif self.MEDIA_INFO.match(path):
+            self._send(200, self.server.create_post(self.MEDIA_INFO.match(path).group(1)))
+        elif self.FRIENDSHIPS.match(path):
+            user_id, relationship = self.FRIENDSHIPS.match(path).groups()
+            self._send(200, self.server.create_friendships(
+                user_id, relationship, int(query.get("count", 100)),
+                int(query.get("max_id", 0))
+            ))
+        else:
+            self._send(404, {"message": "Page not found", "status": "fail"})
+
+    def do_POST(self):
+        self._read_body()
+        if self._simulate_load():
+            return
+
+        if urlsplit(self.path).path == "/accounts/login/ajax/":
+            csrf_token = f"{random.getrandbits(128):032x}"
+            session_id = f"{random.getrandbits(128):032x}"
+            self._send(200, {"user": True, "userId": "1", "authenticated": True,
+                             "oneTapPrompt": False, "status": "ok"},
+                       headers={"Set-Cookie": [f"csrftoken={csrf_token}; Path=/",
+                                               f"sessionid={session_id}; Path=/"]})
+        else:
+            self._send(404, {"message": "Page not found", "status": "fail"})
+
+
+class MockInstagramAdapter(HTTPAdapter):
+    """
+    Sends requests for instagram to a `MockInstagramServer` instead.
+
+    Only the scheme and host are swapped, so the path and query reach
+    the mock unchanged. Responses keep the instagram url, so cookies and
+    redirects work the same as they do against the real site.
+
+    Attributes:
+        mock_url (str): Base url of the mock server.
+    """
+
+    def __init__(self, mock_url: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mock_url = urlsplit(mock_url)
+
+    def send(self, request, *args, **kwargs):
+        original_url = request.url
+        request = request.copy()
+        request.url = urlunsplit(urlsplit(original_url)._replace(scheme=self.mock_url.scheme,
+                                                                 netloc=self.mock_url.netloc))
+        response = super().send(request, *args, **kwargs)
+        response.url = original_url
+        return response
+
+    @staticmethod
+    def mount(session, mock_url: str, pool_maxsize: int = 100) -> None:
+        """Sends every instagram request of `session` to `mock_url`."""
+        adapter = MockInstagramAdapter(mock_url, pool_maxsize=pool_maxsize)
+        for prefix in ("https://www.instagram.com/", "https://i.instagram.com/",
+                       "https://instagram.com/"):
+            session.mount(prefix, adapter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a local stand-in for the instagram endpoints in urls.json."
+    )
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Average seconds to wait before each response.")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of responses that are a 500 error.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Share of responses that are a 429.")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+        server = MockInstagramServer((arguments.host, arguments.port), arguments.latency,
+                                     arguments.error_rate, arguments.rate_limit_rate,
+                                     arguments.seed)
+        print(f"Serving on {server.url}. Set INSTAGRAM_MOCK_URL={server.url} "
+              f"to use it. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+            print(f"Responses sent: {dict(server.stats)}")
@@ -0,0 +1,136 @@
+from file_manager import FileManager
+import threading
+import os
+
+
+class ResponseArchive:
+    """
+    Append-only archive of raw response bodies.
+
+    Response bytes are appended to segment files exactly as they were
+    received, so nothing needs to be encoded again to store them. The
+    same bytes are then parsed, so each response is decoded once and
+    never encoded again.
+
+    Each record is written to the end of the current segment, followed
+    by a newline, and a line with its kind, key, segment, offset and
+    length is added to `index.tsv`. Writing the same key again replaces
+    the old record in the index. Segments are started when the current
+    one reaches `segment_size` bytes.
+
+    Examples:
+        archive = ResponseArchive()
+        content = archive.write(ResponseArchive.USER, "instagram", response.content)
+        data = JsonCodec.loads(content)
+        archive.read(ResponseArchive.USER, "instagram")
+
+    Attributes:
+        directory (str): Directory the segments and index are saved in.
+        segment_size (int): Bytes to write to a segment before starting
+            a new one.
+        _index (dict): `(kind, key)` of each record, and the
+            `(segment, offset, length)` it is stored at.
+        _segment (int): Number of the segment being written to.
+        _file (io.BufferedWriter): Segment being written to.
+        _index_file (io.TextIOWrapper): Index being written to.
+        _lock (threading.Lock): Lock around writes, so the archive can
+            be shared between threads.
+    """
+
+    USER = "user"
+    POST = "post"
+
+    def __init__(self,
+                 directory: str = "json/archive",
+                 segment_size: int = 256 * 1024 * 1024,
+                 ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._index = {}
+        self._segment = 0
+        self._lock = threading.Lock()
+        FileManager.create_dir(directory)
+
+        index_path = os.path.join(directory, "index.tsv")
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as file:
+                for line in file:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 5:
+                        # Left part written by a crash
+                        continue
+                    kind, key, segment, offset, length = fields
+                    self._index[(kind, key)] = (int(segment), int(offset), int(length))
+                    self._segment = max(self._segment, int(segment))
+
+        self._file = open(self._get_segment_path(self._segment), 'ab')
+        self._index_file = open(index_path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, item: tuple):
+        return item in self._index
+
+    def _get_segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment_{segment:05d}.jsonl")
+
+    def write(self, kind: str, key: str, content: bytes) -> bytes:
+        """
+        Appends a response body to the archive.
+
+        Args:
+            kind: `USER` or `POST`.
+            key: Username or shortcode the response is for.
+            content: Raw body of the response, such as
+                `response.content`.
+
+        Returns:
+            `content`, so it can be parsed straight after.
+        """
+        with self._lock:
+            offset = self._file.tell()
+            if offset and offset + len(content) > self.segment_size:
+                self._file.close()
+                self._segment += 1
+                self._file = open(self._get_segment_path(self._segment), 'ab')
+                offset = self._file.tell()
+
+            self._file.write(content)
+            self._file.write(b"\n")
+            # Records are on disk before the index points to them
+            self._file.flush()
+            self._index_file.write(f"{kind}\t{key}\t{self._segment}\t{offset}\t{len(content)}\n")
+            self._index[(kind, key)] = (self._segment, offset, len(content))
+
+        return content
+
+    def read(self, kind: str, key: str) -> [bytes, None]:
+        """Gets the raw body of a record, or `None` if it isn't archived."""
+        location = self._index.get((kind, key))
+        if location is None:
+            return None
+
+        segment, offset, length = location
+        if segment == self._segment:
+            self.flush()
+
+        with open(self._get_segment_path(segment), 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+    def keys(self, kind: str) -> list:
+        """Gets the key of every record of `kind`."""
+        return [key for record_kind, key in self._index if record_kind == kind]
+
+    def flush(self) -> None:
+        """Writes any buffered records and index lines to disk."""
+        with self._lock:
+            self._file.flush()
+            self._index_file.flush()
+
+    def close(self) -> None:
+        """Closes the segment and index files."""
+        with self._lock:
+            self._file.close()
+            self._index_file.close()
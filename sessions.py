@@ -1,15 +1,39 @@
 import requests
 import requests.utils
+import threading
+import time
 from requests.cookies import RequestsCookieJar
 import datetime
 import json
 from dotenv import load_dotenv
+from spoof import UserAgentIndex
+from json_codec import JsonCodec
 import os
 import pickle
 
 
 class UserSession(requests.Session):
 
+    def __init__(self):
+        super().__init__()
+        # When set, every GET uses a random user-agent from this index
+        self.user_agent_index = None
+        # Least amount of seconds between the start of each GET
+        self.request_interval = 0.0
+        self._last_request = 0.0
+        self._rate_limit_lock = threading.Lock()
+
+    def _wait_for_rate_limit(self) -> None:
+        """Sleeps until `request_interval` has passed since the last GET."""
+        if not self.request_interval:
+            return
+
+        with self._rate_limit_lock:
+            wait = self._last_request + self.request_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+
     def _get_csrf_token(self, url: str, *args, **kwargs) -> str:
         """Generates a new csrf token for `url`"""
         # Create error message to display in event of failure
@@ -117,7 +141,18 @@ class UserSession(requests.Session):
         self.cookies.clear()
 
     def get(self, *args, **kwargs):
-        """Set a default timeout for all get requests."""
+        """
+        Set a default timeout for all get requests.
+
+        Also sets a random user-agent from `user_agent_index`, if there
+        is one, and waits for `request_interval` between requests.
+        """
+        self._wait_for_rate_limit()
+        if self.user_agent_index:
+            kwargs['headers'] = {
+                **(kwargs.get('headers') or {}),
+                "user-agent": self.user_agent_index.sample() or UserAgentIndex.DEFAULT,
+            }
         return super().get(*args, **kwargs, timeout=10)
 
     @staticmethod
@@ -129,7 +164,7 @@ class UserSession(requests.Session):
 
 class InstagramSession(UserSession):
 
-    def __init__(self):
+    def __init__(self, rotate_user_agent: bool = False, mock_url: str = None):
         # Load .env file
         load_dotenv()
 
@@ -138,13 +173,23 @@ class InstagramSession(UserSession):
             self.URLS = json.load(file)["instagram"]
 
         super().__init__()
+        if rotate_user_agent:
+            # Send a different user-agent with every GET
+            self.user_agent_index = UserAgentIndex.load()
+
+        # Send everything to a `MockInstagramServer` instead, if one is set
+        mock_url = mock_url or os.getenv('INSTAGRAM_MOCK_URL')
+        if mock_url:
+            # Only needed for load tests, so it isn't imported otherwise
+            from mock_instagram import MockInstagramAdapter
+            MockInstagramAdapter.mount(self, mock_url)
 
         # Get your user-agent from:
         # https://www.whatismybrowser.com/detect/what-http-headers-is-my-browser-sending
         # Create the needed _headers without the csrf_token
         self._insta_headers = {
             "referer": self.URLS['home'],
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/103.0.5060.53 Safari/537.36',
+            'user-agent': UserAgentIndex.DEFAULT,
             # "user-agent": os.getenv('USER-AGENT'),
             # "user-agent": "Applebot",
             "x-requested-with": 'XMLHttpRequest',
@@ -252,7 +297,7 @@ class InstagramSession(UserSession):
                                  data=self._insta_payload)
 
             # Check that login was successful
-            json_data = response.json()
+            json_data = JsonCodec.loads(response.content)
             try:
                 authentication_status = json_data["authenticated"]
             except KeyError:
@@ -0,0 +1,240 @@
+from file_manager import FileManager
+from array import array
+import numpy as np
+import os
+
+
+class SocialGraph:
+    """
+    Compact graph of which accounts interact with which other accounts.
+
+    Usernames are stored once and given an integer id. Edges are stored
+    in compressed sparse row (CSR) arrays: the edges leaving account `i`
+    are `targets[offsets[i]:offsets[i + 1]]`. A million edges take about
+    5MB, and saved graphs can be memory-mapped instead of read.
+
+    Edges added after the arrays were built are kept in small buffers,
+    and merged into the arrays the next time the graph is queried. Only
+    the new edges are sorted, but the arrays are still copied on every
+    merge, so add edges in bulk before querying where possible.
+
+    Edge types:
+        LIKE: Liker -> poster.
+        COMMENT: Commenter -> poster.
+        TAG: Poster -> account tagged in the post.
+        MENTION: Account -> account mentioned in its bio.
+
+    Examples:
+        graph = SocialGraph()
+        for post in posts:
+            graph.add_post(post)
+        graph.neighbours("instagram")
+        graph.in_degree("instagram", SocialGraph.LIKE)
+
+    Attributes:
+        usernames (list): Username of each account id.
+        ids (dict): Id of each username.
+        offsets (numpy.ndarray): Where each account's edges start in
+            `targets`.
+        targets (numpy.ndarray): Account id each edge points to.
+        types (numpy.ndarray): Edge type of each edge in `targets`.
+        _sources (array): Sources of edges not yet in the arrays.
+        _targets (array): Targets of edges not yet in the arrays.
+        _types (array): Types of edges not yet in the arrays.
+        _reverse (tuple): CSR arrays of the edges pointing into each
+            account, built when first needed.
+    """
+
+    LIKE = 0
+    COMMENT = 1
+    TAG = 2
+    MENTION = 3
+
+    def __init__(self):
+        self.usernames = []
+        self.ids = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.targets = np.zeros(0, dtype=np.int32)
+        self.types = np.zeros(0, dtype=np.uint8)
+        self._sources = array('i')
+        self._targets = array('i')
+        self._types = array('B')
+        self._reverse = None
+
+    def __len__(self):
+        """Total amount of edges."""
+        return len(self.targets) + len(self._targets)
+
+    def get_id(self, username: str) -> int:
+        """Gets the id of `username`, giving it a new one if needed."""
+        account_id = self.ids.get(username)
+        if account_id is None:
+            account_id = len(self.usernames)
+            self.ids[username] = account_id
+            self.usernames.append(username)
+
+        return account_id
+
+    def add_edge(self, source: str, target: str, edge_type: int) -> None:
+        """Adds an edge of `edge_type` from `source` to `target`."""
+        self._sources.append(self.get_id(source))
+        self._targets.append(self.get_id(target))
+        self._types.append(edge_type)
+
+    def add_post(self, post) -> None:
+        """Adds the likes, comments and tags of a `Post`."""
+        for username in post.likes:
+            self.add_edge(username, post.username, self.LIKE)
+
+        for comment in post.comments.values():
+            self.add_edge(comment.username, post.username, self.COMMENT)
+
+        for username in post.users_tagged:
+            self.add_edge(post.username, username, self.TAG)
+
+    def add_user(self, user) -> None:
+        """Adds the accounts mentioned in the bio of a `User`."""
+        for entity in user.bio_entities or []:
+            mentioned = entity.get('user')
+            if mentioned:
+                self.add_edge(user.username, mentioned['username'], self.MENTION)
+
+    def _build(self) -> None:
+        """Merges any new edges into the CSR arrays."""
+        account_count = len(self.usernames)
+        if len(self.offsets) <= account_count:
+            # New accounts start with empty rows
+            self.offsets = np.concatenate([
+                self.offsets,
+                np.full(account_count + 1 - len(self.offsets),
+                        self.offsets[-1], dtype=np.int64)
+            ])
+            self._reverse = None
+        if not self._targets:
+            return
+
+        # Only the new edges are sorted. Each is then inserted at the end
+        # of its source's row, after the edges that were already there,
+        # so edges keep the order they were added in.
+        sources = np.frombuffer(self._sources, dtype=np.int32)
+        order = np.argsort(sources, kind='stable')
+        sources = sources[order]
+        positions = self.offsets[sources + 1]
+        self.targets = np.insert(self.targets, positions,
+                                 np.frombuffer(self._targets, dtype=np.int32)[order])
+        self.types = np.insert(self.types, positions,
+                               np.frombuffer(self._types, dtype=np.uint8)[order])
+        # A new array, as loaded graphs may be memory-mapped read-only
+        offsets = self.offsets.copy()
+        offsets[1:] += np.cumsum(np.bincount(sources, minlength=account_count))
+        self.offsets = offsets
+
+        self._sources = array('i')
+        self._targets = array('i')
+        self._types = array('B')
+        self._reverse = None
+
+    def _build_reverse(self) -> tuple:
+        """Gets the CSR arrays of edges pointing into each account."""
+        self._build()
+        if self._reverse is None:
+            account_count = len(self.usernames)
+            sources = np.repeat(np.arange(account_count, dtype=np.int32),
+                                np.diff(self.offsets))
+            order = np.argsort(self.targets, kind='stable')
+            offsets = np.zeros(account_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=account_count), out=offsets[1:])
+            self._reverse = (offsets, sources[order], self.types[order])
+
+        return self._reverse
+
+    @staticmethod
+    def _get_row(offsets, targets, types, account_id, edge_type) -> np.ndarray:
+        """Gets the ids in a single CSR row, optionally of one type."""
+        start, end = offsets[account_id], offsets[account_id + 1]
+        row = targets[start:end]
+        if edge_type is not None:
+            row = row[types[start:end] == edge_type]
+        return row
+
+    def out_degree(self, username: str, edge_type: int = None) -> int:
+        """Counts the edges leaving `username`, optionally of one type."""
+        self._build()
+        account_id = self.ids.get(username)
+        if account_id is None:
+            return 0
+        return len(self._get_row(self.offsets, self.targets, self.types,
+                                 account_id, edge_type))
+
+    def in_degree(self, username: str, edge_type: int = None) -> int:
+        """Counts the edges pointing to `username`, optionally of one type."""
+        account_id = self.ids.get(username)
+        if account_id is None:
+            return 0
+        return len(self._get_row(*self._build_reverse(), account_id, edge_type))
+
+    def neighbours(self,
+                   username: str,
+                   edge_type: int = None,
+                   incoming: bool = False,
+                   ) -> list:
+        """
+        Gets the accounts `username` has edges to.
+
+        Args:
+            username: Account to get the neighbours of.
+            edge_type: Only follow edges of this type, if given.
+            incoming: Set to `True` to get the accounts with edges to
+                `username` instead, such as the accounts that liked
+                its posts.
+
+        Returns:
+            `list` of unique usernames.
+        """
+        account_id = self.ids.get(username)
+        if account_id is None:
+            return []
+
+        if incoming:
+            row = self._get_row(*self._build_reverse(), account_id, edge_type)
+        else:
+            self._build()
+            row = self._get_row(self.offsets, self.targets, self.types,
+                                account_id, edge_type)
+
+        return [self.usernames[neighbour] for neighbour in np.unique(row)]
+
+    def save(self, directory: str = "json/graph") -> None:
+        """Saves the graph as `.npy` arrays and a username list."""
+        self._build()
+        FileManager.create_dir(directory)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "targets.npy"), self.targets)
+        np.save(os.path.join(directory, "types.npy"), self.types)
+        with open(os.path.join(directory, "usernames.txt"), 'w', encoding='utf-8') as file:
+            file.write("\n".join(self.usernames))
+
+    @staticmethod
+    def load(directory: str = "json/graph", memory_map: bool = True) -> "SocialGraph":
+        """
+        Loads a graph saved with `save` from `directory`.
+
+        Args:
+            directory: Directory the graph was saved to.
+            memory_map: Set to `True` to map the arrays from disk
+                instead of reading them into memory. Adding edges
+                afterwards reads them into memory.
+
+        Returns:
+            The loaded `SocialGraph`.
+        """
+        mode = 'r' if memory_map else None
+        graph = SocialGraph()
+        graph.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode=mode)
+        graph.targets = np.load(os.path.join(directory, "targets.npy"), mmap_mode=mode)
+        graph.types = np.load(os.path.join(directory, "types.npy"), mmap_mode=mode)
+        with open(os.path.join(directory, "usernames.txt"), encoding='utf-8') as file:
+            graph.usernames = file.read().split("\n") if len(graph.offsets) > 1 else []
+        graph.ids = {username: account_id
+                     for account_id, username in enumerate(graph.usernames)}
+        return graph
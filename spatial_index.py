@@ -0,0 +1,223 @@
+from geography import Location
+from file_manager import FileManager
+from array import array
+import pickle
+import heapq
+import math
+
+
+class SpatialIndex:
+    """
+    In-memory grid index of `Location` objects for nearby searches.
+
+    The world is split into square cells of `cell_size` degrees, and each
+    location is stored in the cell its coordinates fall into. Searches
+    only measure the distance to locations in cells that could be in
+    range, instead of every location in the index. All distances are in
+    meters, the same as `Location.distance`.
+
+    Examples:
+        index = SpatialIndex()
+        index.build(locations)
+        index.within_radius(40.7, -74.0, 5000)
+        index.nearest(40.7, -74.0, 10)
+
+    Attributes:
+        cell_size (float): Width and height of each cell in degrees.
+        locations (list): All `Location` objects in the index.
+        _latitudes (array): Latitude of each location in `locations`.
+        _longitudes (array): Longitude of each location in `locations`.
+        _cells (dict): Maps `(row, column)` cells to the positions of
+            their locations in `locations`.
+    """
+
+    # Meters in a single degree of latitude
+    DEGREE_LENGTH = 111195.0
+
+    def __init__(self, cell_size: float = 0.05):
+        self.cell_size = cell_size
+        self._rows = math.ceil(180 / cell_size)
+        self._columns = math.ceil(360 / cell_size)
+        self.locations = []
+        self._latitudes = array('d')
+        self._longitudes = array('d')
+        self._cells = {}
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _get_cell(self, latitude: float, longitude: float) -> tuple:
+        """Gets the `(row, column)` cell that the coordinates fall into."""
+        row = min(int((latitude + 90) / self.cell_size), self._rows - 1)
+        column = int((longitude + 180) / self.cell_size) % self._columns
+        return row, column
+
+    def build(self, locations: list) -> None:
+        """Replaces everything in the index with `locations`."""
+        self.locations = []
+        self._latitudes = array('d')
+        self._longitudes = array('d')
+        self._cells = {}
+        for location in locations:
+            self.add(location)
+
+    def add(self, location: Location) -> bool:
+        """
+        Adds a single `location` to the index.
+
+        Returns:
+            `True` if it was added, or `False` if it has no coordinates.
+        """
+        if location.latitude is None or location.longitude is None:
+            return False
+
+        latitude = float(location.latitude)
+        longitude = float(location.longitude)
+        self._cells.setdefault(self._get_cell(latitude, longitude), []) \
+            .append(len(self.locations))
+        self.locations.append(location)
+        self._latitudes.append(latitude)
+        self._longitudes.append(longitude)
+        return True
+
+    def _get_cells(self, latitude: float, longitude: float, radius: float) -> list:
+        """
+        Gets the populated `(row, column)` cells that could have locations
+        within `radius` meters of the coordinates.
+        """
+        # Size of the search area in degrees
+        latitude_span = radius / self.DEGREE_LENGTH
+        # Longitude degrees get shorter towards the poles, so use the
+        # shortest one inside the search area.
+        furthest_latitude = min(abs(latitude) + latitude_span, 90.0)
+        longitude_length = self.DEGREE_LENGTH * math.cos(math.radians(furthest_latitude))
+
+        first_row, first_column = self._get_cell(max(latitude - latitude_span, -90.0),
+                                                 longitude)
+        last_row, _ = self._get_cell(min(latitude + latitude_span, 90.0), longitude)
+        rows = range(first_row, last_row + 1)
+        if longitude_length <= 0 or radius / longitude_length >= 180:
+            # The search area wraps all the way around the world
+            columns = range(self._columns)
+        else:
+            column_span = math.ceil(radius / longitude_length / self.cell_size)
+            columns = {(first_column + offset) % self._columns
+                       for offset in range(-column_span, column_span + 1)}
+
+        if len(rows) * len(columns) > len(self._cells):
+            # Fewer cells have locations than are in the search area, so
+            # only check those instead of every empty cell.
+            return [cell for cell in self._cells if cell[0] in rows and cell[1] in columns]
+        return [(row, column) for row in rows for column in columns
+                if (row, column) in self._cells]
+
+    def within_radius(self,
+                      latitude: float,
+                      longitude: float,
+                      radius: float,
+                      ) -> list:
+        """
+        Gets every location within `radius` meters of the coordinates.
+
+        Args:
+            latitude: Latitude to search around.
+            longitude: Longitude to search around.
+            radius: Furthest distance away in meters.
+
+        Returns:
+            `list` of `(Location, distance)` pairs, closest first.
+        """
+        latitude = float(latitude)
+        longitude = float(longitude)
+        results = []
+        for cell in self._get_cells(latitude, longitude, radius):
+            for position in self._cells[cell]:
+                distance = Location.haversine(latitude, longitude,
+                                              self._latitudes[position],
+                                              self._longitudes[position])
+                if distance <= radius:
+                    results.append((distance, position))
+
+        results.sort()
+        return [(self.locations[position], distance)
+                for distance, position in results]
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1) -> list:
+        """
+        Gets the `k` locations closest to the coordinates.
+
+        Searches the cells within a small radius first, then doubles it,
+        only measuring the locations in cells that weren't searched yet.
+        Stops once `k` locations are found that are no further away than
+        the radius, as nothing outside of it can be closer.
+
+        Args:
+            latitude: Latitude to search around.
+            longitude: Longitude to search around.
+            k: Amount of locations to return.
+
+        Returns:
+            `list` of up to `k` `(Location, distance)` pairs, closest
+            first.
+        """
+        if not self.locations or k < 1:
+            return []
+
+        latitude = float(latitude)
+        longitude = float(longitude)
+        radius = self.cell_size * self.DEGREE_LENGTH
+        # Half the circumference of the earth covers every location
+        furthest = self.DEGREE_LENGTH * 180
+        searched = set()
+        candidates = []
+        while True:
+            for cell in self._get_cells(latitude, longitude, radius):
+                if cell in searched:
+                    continue
+                searched.add(cell)
+                for position in self._cells[cell]:
+                    candidates.append((Location.haversine(latitude, longitude,
+                                                          self._latitudes[position],
+                                                          self._longitudes[position]),
+                                       position))
+
+            if len(candidates) >= k:
+                candidates = heapq.nsmallest(k, candidates)
+                if candidates[-1][0] <= radius:
+                    break
+            if radius >= furthest or len(searched) == len(self._cells):
+                candidates.sort()
+                break
+
+            radius *= 2
+
+        return [(self.locations[position], distance)
+                for distance, position in candidates[:k]]
+
+    def save(self, filename: str = "json/spatial_index.pickle") -> None:
+        """Saves the index to `filename`, so it can be loaded quickly."""
+        directory = filename.rpartition('/')[0]
+        if directory:
+            FileManager.create_dir(directory)
+
+        with open(filename, 'wb') as file:
+            pickle.dump({
+                "cell_size": self.cell_size,
+                "locations": self.locations,
+                "latitudes": self._latitudes.tobytes(),
+                "longitudes": self._longitudes.tobytes(),
+                "cells": self._cells,
+            }, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename: str = "json/spatial_index.pickle") -> "SpatialIndex":
+        """Loads an index saved with `save` from `filename`."""
+        with open(filename, 'rb') as file:
+            data = pickle.load(file)
+
+        index = SpatialIndex(cell_size=data['cell_size'])
+        index.locations = data['locations']
+        index._latitudes.frombytes(data['latitudes'])
+        index._longitudes.frombytes(data['longitudes'])
+        index._cells = data['cells']
+        return index
@@ -2,15 +2,26 @@ from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 from user_input import UserInput
 from file_manager import FileManager
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+import requests.adapters
+import lxml.html
+import threading
 import csv
 import requests
 import os
 import json
 import random
+import bisect
+import time
+import re
 
 
 class UserAgents:
 
+    # Seconds before query-type files are pulled again
+    QUERY_OPTIONS_MAX_AGE = 60 * 60 * 24 * 30
+
     def __init__(self):
         load_dotenv()
         self._API_KEY = os.getenv('USER_AGENT_API_KEY')
@@ -24,8 +35,8 @@ class UserAgents:
         self._params = {}
         self.filename = "user_agents"
 
-        if not os.path.isdir(self.filename):
-            self.get_query_options_data()
+        # Only pulls the query-type files that are missing or out of date
+        self.get_query_options_data(max_age=self.QUERY_OPTIONS_MAX_AGE)
 
     def _get_user_agents(self, *args, **kwargs):
         """Returns specified user-agents from whatismybrowser database."""
@@ -49,28 +60,88 @@ class UserAgents:
         )
         return self._get_user_agents()
 
-    def _get_query_options_data(self, category_name: str, link: str) -> None:
+    def get_user_agents_data(self, limit: int = 500, **kwargs) -> None:
+        """
+        Pulls the most common user-agents and saves them for the index.
+
+        The user-agents are saved with their software, operating system,
+        hardware type and how often they have been seen, so that
+        `UserAgentIndex` can load them.
+
+        Examples:
+            get_user_agents_data(software_type="Web Browser")
+
+        Args:
+            limit: Most user-agents to pull.
+            **kwargs: Search parameters for the whatismybrowser
+                database, such as `software_name`.
+        """
+        FileManager.create_dir(self.filename)
+        params = {
+            "limit": str(limit),
+            "order_by": "times_seen desc",
+            **kwargs,
+        }
+        response = requests.get(self._URLS["base"] + self._URLS["data-search"],
+                                headers=self._headers,
+                                params=params,
+                                timeout=30)
+        if response.status_code != 200:
+            print("Failed to retrieve user-agents.")
+            print(f"Error: {response.text}")
+            return
+
+        user_agents = response.json()['search_results']['user_agents']
+        with open(UserAgentIndex.FILENAME, "w", encoding='utf-8', newline='') as csv_file:
+            csv_file.write("User Agent|Software|Operating System|Hardware Type|Times Seen\n")
+            for user_agent in user_agents:
+                parse = user_agent.get('parse', {})
+                times_seen = user_agent.get('user_agent_meta_data', {}).get('times_seen', 1)
+                csv_file.write(f"{user_agent['user_agent'].replace('|', '')}|"
+                               f"{parse.get('software_name') or ''}|"
+                               f"{parse.get('operating_system_name') or ''}|"
+                               f"{parse.get('hardware_type') or ''}|"
+                               f"{times_seen}\n")
+
+        print(f"File successfully created in:\n{os.path.realpath(UserAgentIndex.FILENAME)}")
+
+    def _get_query_options_filepath(self, category_name: str) -> str:
+        """Gets the path of the csv file for `category_name`."""
+        return f"{self.filename}/{self.filename}_{category_name}_query_params.csv"
+
+    def _get_query_options_data(self,
+                                category_name: str,
+                                link: str,
+                                session: requests.Session,
+                                ) -> str:
         """
         Pulls and stores all query-type information from `link`.
 
         Will pull all info and related agents in `link`,
-        and store it using `category_name` in the filename.
+        and store it using `category_name` in the filename. The file is
+        written under a temporary name first, so it's never left half
+        written.
 
         Args:
             category_name: Filename to specify the category for the
                 info being pulled.
             link: https://developers.whatismybrowser.com/useragents/explore/ url
                 to pull info from.
+            session: Session to send the request with.
+
+        Returns:
+            Path of the file that was created.
         """
         # Retrieve info and convert to soup
-        response = requests.get(link, timeout=10)
+        response = session.get(link, timeout=10)
         soup = BeautifulSoup(response.text, features='lxml')
 
         # Find all entries using css selectors
         table = soup.select("table tbody tr")
 
         # Cycle through all entries and append to csv file
-        with open(f"{self.filename}/{self.filename}_{category_name}_query_params.csv",
+        filepath = self._get_query_options_filepath(category_name)
+        with open(f"{filepath}.tmp",
                   "w",
                   encoding='utf-8',
                   newline='') as csv_file:
@@ -80,17 +151,28 @@ class UserAgents:
                 name, user_agents = tag.stripped_strings
                 csv_file.write(f"{name}|{user_agents}\n")
 
-    def get_query_options_data(self, selection: str = "") -> None:
+        os.replace(f"{filepath}.tmp", filepath)
+        return filepath
+
+    def get_query_options_data(self,
+                               selection: str = "",
+                               max_age: int = 0,
+                               max_workers: int = 6,
+                               ) -> None:
         """
         Pulls all whatismybrowser query-type info, or a specific one.
 
         By default, all info will be pulled and saved into csv files. If
         `selection` is specified, then only that one set of data will be
-        pulled.
+        pulled. All sets are pulled at the same time, sharing one
+        session.
 
         Args:
             selection: Set of data to pull. Do not specify if you want
                 to pull all data.
+            max_age: Only pull sets whose files are missing or older
+                than this many seconds. `0` pulls every set.
+            max_workers: Most sets to pull at the same time.
         """
         # Create directory if it doesn't already exist
         FileManager.create_dir(self.filename)
@@ -98,25 +180,40 @@ class UserAgents:
         # If only one type is being requested to be pulled
         if selection:
             try:
-                link = self._URLS["query-types"][selection]
+                categories = {selection: self._URLS["query-types"][selection]}
             except KeyError:
                 print("Invalid category name selection for query-type urls.")
                 print(f"Selected type: {selection}")
-            else:
-                # Retrieve the requested type
-                print(f"Attempting to retrieve info for: {selection}")
-                self._get_query_options_data(selection, link)
-                filepath = os.path.realpath(f"{self.filename}/{self.filename}_"
-                                            f"{selection}_query_params.csv")
-                print(f"File successfully created in:\n{filepath}")
+                return
         else:
-            # Cycle through each link
-            for category_name, link in self._URLS["query-types"].items():
-                print(f"Attempting to retrieve info for: {category_name}")
-                self._get_query_options_data(category_name, link)
-                filepath = os.path.realpath(f"{self.filename}/{self.filename}_"
-                                            f"{category_name}_query_params.csv")
-                print(f"File successfully created in:\n{filepath}")
+            categories = self._URLS["query-types"]
+
+        if max_age:
+            now = time.time()
+            categories = {
+                category_name: link
+                for category_name, link in categories.items()
+                if not os.path.exists(self._get_query_options_filepath(category_name))
+                or now - os.path.getmtime(self._get_query_options_filepath(category_name)) > max_age
+            }
+
+        if not categories:
+            return
+
+        for category_name in categories:
+            print(f"Attempting to retrieve info for: {category_name}")
+
+        with requests.Session() as session:
+            # Allow a connection per worker, instead of the default pool
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                filepaths = executor.map(
+                    lambda category: self._get_query_options_data(*category, session),
+                    categories.items()
+                )
+                for filepath in filepaths:
+                    print(f"File successfully created in:\n{os.path.realpath(filepath)}")
 
         print("All files have been created successfully")
 
@@ -124,53 +221,195 @@ class UserAgents:
         """
         Lists valid query parameters for whatismybrowser database.
 
-        `selection` is used for recursion and should be left blank at all
-        times.
-
         Prints out a menu of available search query categories to list.
-        If one is not available, it will be retrieved.
+        If one is not available, only that one will be retrieved.
 
         Args:
-            selection: Used for recursion. When a selected option is not
-                found, the file will be created and this method will be
-                run again with `category` being the user choice.
+            selection: Category to list. Prints a menu to choose one if
+                it is not given.
         """
         # Create a choice menu of the different query types
         urls = self._URLS["query-types"]
 
         if selection:
-            # Method was run via recursion, so no input is required
             choice = selection
         else:
             choice = UserInput.create_menu(urls)
 
-        # Check that the choice is valid
+        filepath = self._get_query_options_filepath(choice)
+        if not os.path.exists(filepath):
+            # If file is not found, pull only that file
+            print("File not found. Creating required files...")
+            self.get_query_options_data(selection=choice)
+
         try:
-            filepath = f"{self.filename}/{self.filename}_{choice}_query_params.csv"
-        except KeyError:
-            print("Invalid number selection")
-        else:
-            # File was found
+            # Open file selected and list all lines in it
+            with open(filepath, encoding='utf-8') as file:
+                print()  # Spacer for text
+                print("Retrieving info:")
+                # Display category and format
+                print("*" * 20, choice, "*" * 20)
+                print("Format: Valid Param | Related User-Agents")
+                # Skip Headers
+                file.readline()
+                for line in file:
+                    # Strip the '\n' off each line, so it prints correctly.
+                    name, user_agents = line.rstrip('\n').split('|')
+                    print(f"{name}: {user_agents}")
+
+        except FileNotFoundError:
+            print(f"Failed to retrieve info for: {choice}")
+
+
+class UserAgentIndex:
+    """
+    In-memory index of user-agents for picking random ones quickly.
+
+    User-agents are loaded once from `FILENAME`, which is created by
+    `UserAgents.get_user_agents_data`. They are grouped by software,
+    operating system and hardware type, and picked at random weighted
+    by how often they have been seen. Each group gets an alias table
+    the first time it's sampled, so every later pick takes the same
+    time no matter how many user-agents are in the group.
+
+    Examples:
+        index = UserAgentIndex.load()
+        index.sample()
+        index.sample(software="chrome", operating_system="windows")
+
+    Attributes:
+        FILENAME (str): File the user-agents are loaded from.
+        DEFAULT (str): User-agent used when there are none to load.
+        user_agents (list): All user-agent strings.
+        weights (array): How often each user-agent has been seen.
+        groups (dict): Maps `(software, operating system, hardware)`
+            keys to the positions of their user-agents.
+        _tables (dict): Alias tables for each searched group.
+    """
+
+    FILENAME = "user_agents/user_agents_index.csv"
+    DEFAULT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 ' \
+              '(KHTML, like Gecko) Chrome/103.0.5060.53 Safari/537.36'
+    # Indexes that have already been loaded, by filename
+    _loaded = {}
+    _loaded_lock = threading.Lock()
+
+    def __init__(self, records: list = None):
+        self.user_agents = []
+        self.weights = array('d')
+        self.groups = {}
+        self._tables = {}
+        for user_agent, software, operating_system, hardware, weight in records or []:
+            key = (software.casefold(), operating_system.casefold(), hardware.casefold())
+            self.groups.setdefault(key, array('I')).append(len(self.user_agents))
+            self.user_agents.append(user_agent)
+            self.weights.append(max(float(weight), 0.0))
+
+    def __len__(self):
+        return len(self.user_agents)
+
+    @staticmethod
+    def load(filename: str = FILENAME) -> "UserAgentIndex":
+        """
+        Loads the index from `filename`, only reading the file once.
+
+        Returns:
+            The shared `UserAgentIndex` for `filename`. It only contains
+            `DEFAULT` if the file does not exist.
+        """
+        with UserAgentIndex._loaded_lock:
+            if filename in UserAgentIndex._loaded:
+                return UserAgentIndex._loaded[filename]
+
             try:
-                # Open file selected and list all lines in it
-                with open(filepath, encoding='utf-8') as file:
-                    print()  # Spacer for text
-                    print("Retrieving info:")
-                    # Display category and format
-                    print("*" * 20, choice, "*" * 20)
-                    print("Format: Valid Param | Related User-Agents")
+                with open(filename, encoding='utf-8') as file:
                     # Skip Headers
                     file.readline()
-                    for line in file:
-                        # Strip the '\n' off each line, so it prints correctly.
-                        name, user_agents = line.rstrip('\n').split('|')
-                        print(f"{name}: {user_agents}")
-
+                    records = [line.rstrip('\n').split('|') for line in file]
             except FileNotFoundError:
-                # If file is not found, pull only that file
-                print("File not found. Creating required files...")
-                self.get_query_options_data(selection=choice)
-                self.list_query_options(selection=choice)
+                print(f'"{filename}" file was not found! Using the default user-agent.')
+                records = [[UserAgentIndex.DEFAULT, "Chrome", "Windows", "Computer", 1]]
+
+            index = UserAgentIndex(records)
+            UserAgentIndex._loaded[filename] = index
+            return index
+
+    def sample(self,
+               software: str = "",
+               operating_system: str = "",
+               hardware_type: str = "",
+               ) -> [str, None]:
+        """
+        Picks a random user-agent, weighted by how often it's been seen.
+
+        Any of the arguments can be left empty to allow every value.
+
+        Args:
+            software: Software name such as `Chrome`.
+            operating_system: Operating system name such as `Windows`.
+            hardware_type: Hardware type such as `Computer`.
+
+        Returns:
+            A random user-agent `str` matching the arguments, or `None`
+            if none match.
+        """
+        search = (software.casefold(), operating_system.casefold(), hardware_type.casefold())
+        table = self._tables.get(search)
+        if table is None:
+            table = self._create_alias_table(search)
+
+        positions, probabilities, aliases = table
+        if not positions:
+            return None
+
+        column = random.randrange(len(positions))
+        if random.random() >= probabilities[column]:
+            column = aliases[column]
+
+        return self.user_agents[positions[column]]
+
+    def _create_alias_table(self, search: tuple) -> tuple:
+        """
+        Creates and stores the alias table for the groups in `search`.
+
+        Uses Vose's alias method. Every column of the table holds up to
+        two user-agents, and the chance of keeping the first one, so a
+        pick only needs one random column and one random number.
+
+        Returns:
+            `(positions, probabilities, aliases)` for the table.
+        """
+        positions = array('I')
+        for key, group in self.groups.items():
+            if all(not wanted or wanted == value for wanted, value in zip(search, key)):
+                positions.extend(group)
+
+        count = len(positions)
+        total = sum(self.weights[position] for position in positions)
+        probabilities = array('d', [0.0] * count)
+        aliases = array('I', range(count))
+        if count and total:
+            # Scale weights so the average column is exactly 1
+            scaled = [self.weights[position] * count / total for position in positions]
+            small = [column for column, weight in enumerate(scaled) if weight < 1]
+            large = [column for column, weight in enumerate(scaled) if weight >= 1]
+            while small and large:
+                less, more = small.pop(), large.pop()
+                probabilities[less] = scaled[less]
+                aliases[less] = more
+                # Give the rest of the column to the larger weight
+                scaled[more] -= 1 - scaled[less]
+                (small if scaled[more] < 1 else large).append(more)
+
+            for column in small + large:
+                probabilities[column] = 1.0
+        elif count:
+            # No weights known, so every user-agent is equally likely
+            probabilities = array('d', [1.0] * count)
+
+        table = (positions, probabilities, aliases)
+        self._tables[search] = table
+        return table
 
 
 class Proxies:
@@ -179,16 +418,42 @@ class Proxies:
 
     To retrieve a fresh set of proxies, Call `get_proxies` method.
 
+    The downloaded list is kept in memory for `ttl` seconds. Once it's
+    older than that, `get_proxies` keeps returning the old list while a
+    background thread downloads a new one, so callers never wait on the
+    download after the first one.
+
     Attributes:
         filename (str): Name of file to save proxies to.
+        ttl (int): Seconds before the proxy list is refreshed.
         _URLS (dict): Contains all urls to retrieve proxies from
+        _proxies (list): Detailed `Proxy` objects from the last download.
+        _simple_proxies (list): `ip:port` strings from the last
+            download.
+        _index (ProxyIndex): Index of `_proxies` for filtering them.
+        _updated (float): Timestamp of the last download.
+        _lock (threading.Lock): Lock around the cached lists.
+        _refresh_thread (threading.Thread): Thread running the current
+            background download, if there is one.
     """
 
-    def __init__(self):
+    # Matches each amount and unit in text such as "1 hour 5 mins ago"
+    LAST_CHECKED = re.compile(r'(\d+)\s*(hour|min|sec)')
+    SECONDS = {"hour": 60 * 60, "min": 60, "sec": 1}
+
+    def __init__(self, ttl: int = 600):
         self.filename = "proxies.csv"
+        self.ttl = ttl
         with open("urls.json", encoding='utf-8') as f:
             self._URLS = json.load(f)["proxies"]
 
+        self._proxies = []
+        self._simple_proxies = []
+        self._index = ProxyIndex([])
+        self._updated = 0.0
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
         FileManager.create_dir("proxies")
 
     def _generate_simple_proxies_file(self, proxy_list: list) -> None:
@@ -202,7 +467,7 @@ class Proxies:
         """Saves a csv file of the most recent proxies and their info."""
         with open(f"proxies/{self.filename}", "w", encoding='utf-8', newline='') as file:
             # Create field names for csv file
-            field_names = ["IP Address", "Port", "Code",
+            field_names = ["IP Address", "Port", "Proxy", "Code",
                            "Country", "Anonymity", "Google",
                            "Https", "Last Checked"]
             writer = csv.writer(file)
@@ -210,7 +475,80 @@ class Proxies:
             writer.writerow(field_names)
             for proxy in proxy_list:
                 # Get list of info about each proxy and write it to csv
-                writer.writerow(proxy.__dict__.values())
+                writer.writerow([getattr(proxy, field) for field in Proxy.FIELDS])
+
+    @staticmethod
+    def parse_last_checked(last_checked: str) -> int:
+        """Converts text such as `1 hour 5 mins ago` into seconds."""
+        return sum(int(amount) * Proxies.SECONDS[unit]
+                   for amount, unit in Proxies.LAST_CHECKED.findall(last_checked))
+
+    def refresh(self) -> None:
+        """
+        Downloads and parses the newest proxies into the cache.
+
+        The page is parsed with lxml directly, as only the proxy table
+        and the `ip:port` text area are needed from it.
+        """
+        response = requests.get(self._URLS["base"], timeout=10)
+        tree = lxml.html.fromstring(response.content)
+
+        simple_proxies = []
+        text_area = tree.xpath('//textarea[contains(@class, "form-control")]/text()')
+        if text_area:
+            # Skip the lines of text before the proxies
+            simple_proxies = text_area[0].split("\n")[3:-1]
+
+        proxies = []
+        for row in tree.xpath('//*[@id="list"]//tbody/tr'):
+            cells = [cell.text_content() for cell in row.iterfind('td')]
+            if len(cells) != 8:
+                continue
+
+            ip, port, code, country, anonymity, google, https, last_checked = cells
+            proxies.append(Proxy(
+                ip=ip,
+                port=port,
+                code=code,
+                country=country,
+                anonymity=anonymity,
+                google=google,
+                https=https,
+                last_checked=str(self.parse_last_checked(last_checked))
+            ))
+
+        # Keep the health of proxies that are still listed, so proxies
+        # that were failing don't get a clean slate on every refresh.
+        with self._lock:
+            health = {proxy.proxy: proxy.health for proxy in self._proxies}
+        for proxy in proxies:
+            proxy.health = health.get(proxy.proxy, proxy.health)
+
+        # Build the index before taking the lock, so readers aren't blocked
+        index = ProxyIndex(proxies)
+        with self._lock:
+            self._proxies = proxies
+            self._simple_proxies = simple_proxies
+            self._index = index
+            self._updated = time.time()
+
+    def _refresh_in_background(self) -> None:
+        """Starts a background refresh, unless one is already running."""
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+
+            self._refresh_thread = threading.Thread(target=self._refresh_quietly,
+                                                    daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_quietly(self) -> None:
+        """Runs `refresh`, keeping the old proxies if it fails."""
+        try:
+            self.refresh()
+        except (requests.exceptions.RequestException, lxml.etree.ParserError) as error:
+            print("Failed to refresh proxies. The previous proxies will be used.")
+            print(f"Error: {error}")
 
     def get_proxies(self,
                     simple: bool = False,
@@ -223,6 +561,10 @@ class Proxies:
         Will generate the newest list from https://free-proxy-list.net/
         and will return a `list` object.
 
+        The first call downloads the list. Later calls return the cached
+        list right away, and refresh it in the background once it's
+        older than `ttl` seconds.
+
         Is capable of saving the proxies generated into a file if `save`
         is set to `True`.
 
@@ -234,22 +576,30 @@ class Proxies:
             save: `bool` that determines whether to save the proxies
                 into a file.
             single: `bool` that determines if a single random proxy is
-                returned, or a list of them.
+                returned, or a list of them. The proxy is picked from
+                every healthy proxy, not only the first `limit`.
 
         Returns:
-            If `single` is set to `True`, returns only a single proxy.
-                Otherwise, returns a `list`.
+            If `single` is set to `True`, returns only a single healthy
+                proxy, or `None` if none are healthy. Otherwise, returns
+                a `list`.
             If `simple` is set to `True`, `Proxy` objects with only the
             `ip` and `port` attributes.
             If `simple` is set to `False`, `Proxy` objects with all
             attributes filled in.
         """
-        response = requests.get(self._URLS["base"])
-        soup = BeautifulSoup(response.text, features="lxml")
+        if not self._updated:
+            # Nothing to serve yet, so wait for the first download
+            self.refresh()
+        elif time.time() - self._updated > self.ttl:
+            self._refresh_in_background()
+
+        with self._lock:
+            proxies_raw = self._simple_proxies
+            detailed_proxies = self._proxies
+
         # If only proxies and their ports are being used
         if simple:
-            # Parse list of proxies/ports
-            proxies_raw = soup.select_one("textarea.form-control").string.split("\n")[3:-1]
             proxies = []
             for proxy in proxies_raw:
                 ip, port = proxy.split(':')
@@ -258,57 +608,27 @@ class Proxies:
             if save:
                 self._generate_simple_proxies_file(proxies_raw)
         else:
-            # Set hours and minutes to seconds
-            hour = 60 * 60
-            minute = 60
-            # If more detailed info is desired about each proxy
-            proxies = []
-            table = soup.select("#list tbody tr")
-            # Create list of proxies
-            for (ip, port, code, country, anonymity, google, https, last_checked) in table:
-                # Convert last_checked to seconds
-                time_to_add = 0
-                time = last_checked.string.split()
-                if "hour" in time or "hours" in time:
-                    time_to_add += hour * int(time.pop(0))
-                    time.pop(0)
-
-                if "min" in time or "mins" in time:
-                    time_to_add += minute * int(time.pop(0))
-                    time.pop(0)
-
-                if "sec" in time or "secs" in time:
-                    time_to_add += int(time.pop(0))
-
-                proxy = Proxy(
-                    ip=ip.string,
-                    port=port.string,
-                    code=code.string,
-                    country=country.string,
-                    anonymity=anonymity.string,
-                    google=google.string,
-                    https=https.string,
-                    last_checked=str(time_to_add)
-                )
-                # Add to country and code dicts so that proxies can be
-                # looked up by either their country or country code.
-                proxies.append(proxy)
-                if len(proxies) == limit:
-                    break
+            # Copy the first `limit` proxies so the cache can't be changed
+            proxies = detailed_proxies[:limit]
 
             # Save proxies into a file if it's enabled
             if save:
                 self._generate_proxies_file(proxies)
 
         if single:
-            return random.choice(proxies)
+            # Health is checked before `limit`, so healthy proxies further
+            # down the list are still picked once the first ones trip.
+            proxy = ProxyHealth.pick(proxies if simple else detailed_proxies)
+            if proxy is None:
+                print("No healthy proxies are available right now.")
+            return proxy
         else:
             return proxies
 
     def get_usr_proxy_settings(self):
         """Gets proxy settings for `extract_by_type` from user."""
         # Create empty Proxy class for the attributes
-        menu = list(Proxy("", "").__dict__.keys())
+        menu = list(Proxy.FIELDS)
         values = {}
         while True:
             print("Options for proxy filter:")
@@ -356,100 +676,55 @@ class Proxies:
         compared to the proxy value in seconds. If the proxy value is
         older than the pair value, it will not be added.
 
-        For the `anonymity` proxy attribute, any of the following can be
-        provided in any case:
+        For the `google` and `https` proxy attributes, any of the
+        following can be provided in any case:
         `yes`
         `no`
         `true`
         `false`
 
+        Builds a `ProxyIndex` for `proxy_list`. When filtering the same
+        proxies more than once, build a `ProxyIndex` once and use it
+        directly, or use `get_proxies_by_type`.
+
         Args:
             proxy_list: `list` of `Proxy` objects
             attributes: `dict` of pairs of valid `Proxy` attributes,
                 and their desired value.
             single: When set to `True`, will return a single random
-                proxy from the generated list.
+                healthy proxy from the generated list, or `None` if
+                none of them are healthy.
 
         Returns:
             `list` containing only `Proxy` objects that have attributes
             specified by `attributes` keys, matching the paired value.
         """
-        proxies = []
-        for proxy in proxy_list:
-            try:
-                append = True
-                for attribute, desired_type in attributes.items():
-                    attr = proxy.__getattribute__(attribute)
-                    if attribute == "last_checked":
-                        # valid_math = ['+', '-', '/', '*']
-                        # # Check to see if it's math by looking for an operator.
-                        # joined_var = "".join(desired_type.split())
-                        # for value in joined_var:
-                        #     # Iterate through each piece, before running an eval.
-                        #     if not value.isnumeric():
-                        #         # First check for non-math-equations
-                        #         if value not in valid_math:
-                        #             # If any piece is anything other than math
-                        #             print()  # Spacer for text
-                        #             print("Please enter a valid math equation.")
-                        #             return
-                        #
-                        # try:
-                        #     # If everything is valid math, evaluate it.
-                        #     result = eval(desired_type)
-                        # except SyntaxError:
-                        #     # If only numbers were given
-                        #     result = int(joined_var)
-                        #
-                        if int(attr) > int(desired_type):
-                            # If it's been longer than the given amount (desired_type)
-                            # in seconds.
-                            append = False
-
-                    elif attribute == "anonymity" and desired_type == "elite":
-                        # allow for 'elite' to be typed instead of just 'elite proxy'
-                        if not len(attr.split()) == 2:
-                            # If attribute does not match desired type, don't append.
-                            append = False
-
-                    elif attribute == "google":
-                        # Allow for true or false to be used.
-                        if desired_type.casefold() == "true":
-                            desired_type = "yes"
-
-                        elif desired_type.casefold() == "false":
-                            desired_type = "false"
-
-                        if not attr.casefold() == desired_type.casefold():
-                            append = False
-
-                    else:
-                        # Default handling
-                        if not "".join(attr.casefold().split()) \
-                               == "".join(desired_type.casefold().split()):
-                            # If attribute does not match desired type, don't append.
-                            append = False
-
-                # If all attributes matched all desired types
-                if append:
-                    proxies.append(proxy)
-
-            except AttributeError:
-                # If the dict is empty, or the attribute does not exist
-                continue
+        return ProxyIndex(proxy_list).extract_by_type(attributes, single)
 
-        if single and proxies:
-            return random.choice(proxies)
+    def get_proxies_by_type(self, attributes: dict, single: bool = False):
+        """
+        Runs `extract_by_type` on every cached proxy, using their index.
 
-        elif not proxies:
-            # If no proxies have all the `attributes`, an index error is raised.
-            print("No proxies match the given _parameters:")
-            for attr_name, proxy_value in attributes.items():
-                print(f"{attr_name}: {proxy_value}")
+        The cache is handled the same way as `get_proxies`.
 
-        else:
-            # If any proxies had all specified attributes
-            return proxies
+        Args:
+            attributes: `dict` of pairs of valid `Proxy` attributes,
+                and their desired value.
+            single: When set to `True`, will return a single random
+                proxy from the generated list.
+
+        Returns:
+            Same as `extract_by_type`.
+        """
+        if not self._updated:
+            self.refresh()
+        elif time.time() - self._updated > self.ttl:
+            self._refresh_in_background()
+
+        with self._lock:
+            index = self._index
+
+        return index.extract_by_type(attributes, single)
 
 
 class Proxy:
@@ -457,6 +732,7 @@ class Proxy:
     Class to contain, display, and provide info about a proxy.
 
     Attributes:
+        FIELDS (tuple): Names of the attributes describing the proxy.
         ip (str): IP address of proxy
         port (str): Port of proxy
         code (str): Country code where proxy is located
@@ -466,8 +742,13 @@ class Proxy:
         https (str): Whether it's HTTP(S) or HTTP
         last_checked (str): The last time proxy was checked for if it's
             still working.
+        health (ProxyHealth): Results of the requests sent through the
+            proxy.
     """
 
+    FIELDS = ("ip", "port", "proxy", "code", "country",
+              "anonymity", "google", "https", "last_checked")
+
     def __init__(self,
                  ip: str,
                  port: str,
@@ -487,6 +768,7 @@ class Proxy:
         self.google = google
         self.https = https
         self.last_checked = last_checked
+        self.health = ProxyHealth()
 
     def __str__(self):
         """View all attributes of the proxy object"""
@@ -498,7 +780,339 @@ class Proxy:
                f"Anonymity: {self.anonymity}\n" \
                f"Google: {self.google}\n" \
                f"Https: {self.https}\n" \
-               f"Last Checked: {self.last_checked}"
+               f"Last Checked: {self.last_checked}\n" \
+               f"Health: {self.health}"
+
+
+class ProxyHealth:
+    """
+    Tracks how well a proxy is working, and stops it being picked if not.
+
+    Acts as a circuit breaker with three states:
+        closed: The proxy is working, and can be picked.
+        open: The proxy failed too often, and will not be picked until
+            `COOLDOWN` seconds have passed.
+        half-open: The cooldown passed and the proxy was picked for a
+            single trial request. It isn't picked again until that
+            result closes or reopens it, or until `COOLDOWN` seconds
+            pass without a result.
+
+    Checking `is_available` never changes the state. Only `acquire`,
+    called when a proxy is actually picked, moves an open proxy to
+    half-open.
+
+    The breaker opens after `FAILURE_THRESHOLD` failures in a row, or
+    when `error_rate` reaches `ERROR_RATE_THRESHOLD`.
+
+    Attributes:
+        latency (float): Weighted average of recent request times in
+            seconds, or `None` before the first success.
+        error_rate (float): Weighted average of recent failures, from
+            `0` (none failed) to `1` (all failed).
+        consecutive_failures (int): Failures since the last success.
+        requests (int): Total requests recorded.
+        state (str): `closed`, `open` or `half-open`.
+        opened (float): Timestamp of when the breaker last opened.
+        probed (float): Timestamp of when the trial request was handed
+            out while half-open.
+        _lock (threading.Lock): Lock so threads can share the proxy.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    # Weight of the newest result in the averages
+    SMOOTHING = 0.2
+    FAILURE_THRESHOLD = 3
+    ERROR_RATE_THRESHOLD = 0.5
+    # Requests needed before `error_rate` can open the breaker
+    MINIMUM_REQUESTS = 5
+    COOLDOWN = 120
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.state = self.CLOSED
+        self.opened = 0.0
+        self.probed = 0.0
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        latency = f"{self.latency:.2f}s" if self.latency is not None else "unknown"
+        return f"{self.state} | Latency: {latency} | " \
+               f"Error Rate: {self.error_rate:.0%} | " \
+               f"Failures In A Row: {self.consecutive_failures}"
+
+    def _can_pick(self, now: float) -> bool:
+        if self.state == self.OPEN:
+            return now - self.opened >= self.COOLDOWN
+        if self.state == self.HALF_OPEN:
+            # The trial request never reported back
+            return now - self.probed >= self.COOLDOWN
+        return True
+
+    def is_available(self) -> bool:
+        """Whether the proxy could be picked for a request right now."""
+        with self._lock:
+            return self._can_pick(time.time())
+
+    def acquire(self) -> bool:
+        """
+        Picks the proxy for a request, if it's available.
+
+        An open proxy whose cooldown has passed becomes half-open, and
+        this request is its single trial.
+
+        Returns:
+            `True` if the proxy was picked, or `False` if it can't be
+            used right now.
+        """
+        with self._lock:
+            now = time.time()
+            if not self._can_pick(now):
+                return False
+            if self.state != self.CLOSED:
+                # Give the proxy another chance, with a single request
+                self.state = self.HALF_OPEN
+                self.probed = now
+            return True
+
+    @staticmethod
+    def pick(proxies: list):
+        """
+        Picks a random available proxy from `proxies`.
+
+        Returns:
+            The picked `Proxy`, or `None` if none of them are available.
+        """
+        candidates = [proxy for proxy in proxies if proxy.health.is_available()]
+        random.shuffle(candidates)
+        for proxy in candidates:
+            # Another thread may have picked it in the meantime
+            if proxy.health.acquire():
+                return proxy
+
+        return None
+
+    def record_success(self, latency: float) -> None:
+        """Records a request that finished in `latency` seconds."""
+        with self._lock:
+            self.requests += 1
+            self.consecutive_failures = 0
+            self.error_rate *= 1 - self.SMOOTHING
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.SMOOTHING * (latency - self.latency)
+
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        """Records a failed request, opening the breaker if needed."""
+        with self._lock:
+            self.requests += 1
+            self.consecutive_failures += 1
+            self.error_rate += self.SMOOTHING * (1 - self.error_rate)
+
+            if self.state == self.HALF_OPEN \
+                    or self.consecutive_failures >= self.FAILURE_THRESHOLD \
+                    or (self.requests >= self.MINIMUM_REQUESTS
+                        and self.error_rate >= self.ERROR_RATE_THRESHOLD):
+                self.state = self.OPEN
+                self.opened = time.time()
+
+
+class ProxyIndex:
+    """
+    Index of `Proxy` objects for quickly filtering them by attribute.
+
+    Each proxy's attributes are normalised once, when the index is
+    built: casefolded with all spaces removed, `true`/`false` turned
+    into `yes`/`no`, and `elite` turned into `elite proxy`. Indexed
+    attributes map each normalised value to the set of proxies that
+    have it, so a filter is a set intersection rather than a check of
+    every proxy. `last_checked` is kept as a sorted array of seconds, so
+    a filter on it alone is a binary search. The result of each filter
+    is cached until the index is rebuilt, so picking a random proxy for
+    the same attributes again is a single `random.choice`.
+
+    Examples:
+        index = ProxyIndex(proxies)
+        index.filter({"country": "united states", "https": "yes"})
+        index.choice({"anonymity": "elite", "last_checked": "600"})
+
+    Attributes:
+        proxies (list): `Proxy` objects in the index.
+        _indexes (dict): Maps each attribute in `INDEXED` to a `dict` of
+            normalised values and the positions of the proxies in
+            `proxies` that have them.
+        _seconds (list): `last_checked` seconds of each proxy in
+            `proxies`.
+        _last_checked (list): Sorted `last_checked` seconds.
+        _last_checked_positions (list): Positions in `proxies` in the
+            same order as `_last_checked`.
+        _cache (dict): Proxies matching each filter, keyed by its
+            normalised attributes.
+    """
+
+    INDEXED = ("ip", "port", "proxy", "code", "country",
+               "anonymity", "google", "https")
+    # Alternate values that mean the same thing
+    ALIASES = {
+        "true": "yes",
+        "false": "no",
+        "elite": "eliteproxy",
+    }
+    # Most filters to keep the results of
+    CACHE_SIZE = 256
+    # Random picks to try before checking every match for a healthy one
+    CHOICE_ATTEMPTS = 8
+
+    def __init__(self, proxies: list):
+        self.proxies = list(proxies)
+        self._indexes = {attribute: {} for attribute in self.INDEXED}
+        for position, proxy in enumerate(self.proxies):
+            for attribute in self.INDEXED:
+                value = self.normalise(getattr(proxy, attribute))
+                self._indexes[attribute].setdefault(value, set()).add(position)
+
+        self._seconds = [self._get_seconds(proxy) for proxy in self.proxies]
+        order = sorted(range(len(self.proxies)), key=self._seconds.__getitem__)
+        self._last_checked = [self._seconds[position] for position in order]
+        self._last_checked_positions = order
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.proxies)
+
+    @staticmethod
+    def normalise(value: str) -> str:
+        """Normalises a proxy attribute value for comparison."""
+        value = "".join(str(value).casefold().split())
+        return ProxyIndex.ALIASES.get(value, value)
+
+    @staticmethod
+    def _get_seconds(proxy) -> int:
+        """Gets `last_checked` of `proxy` as an `int`."""
+        try:
+            return int(proxy.last_checked)
+        except ValueError:
+            # Simple proxies don't know when they were last checked
+            return 0
+
+    def _match(self, attributes: dict) -> list:
+        """
+        Gets the cached proxies matching every attribute in `attributes`,
+        filtering and caching them first if needed.
+        """
+        key = []
+        for attribute, desired_type in attributes.items():
+            if attribute == "last_checked":
+                key.append((attribute, int(desired_type)))
+            elif attribute in self._indexes:
+                key.append((attribute, self.normalise(desired_type)))
+            else:
+                # If the attribute does not exist
+                return []
+        key = tuple(sorted(key))
+
+        proxies = self._cache.get(key)
+        if proxies is not None:
+            return proxies
+
+        matches = []
+        most_seconds = None
+        for attribute, value in key:
+            if attribute == "last_checked":
+                most_seconds = value if most_seconds is None else min(most_seconds, value)
+            else:
+                matches.append(self._indexes[attribute].get(value, set()))
+
+        if matches:
+            # Intersect starting from the smallest set, to do the least work
+            matches.sort(key=len)
+            positions = matches[0].intersection(*matches[1:])
+            if most_seconds is not None:
+                seconds = self._seconds
+                positions = [position for position in positions
+                             if seconds[position] <= most_seconds]
+            positions = sorted(positions)
+        elif most_seconds is not None:
+            end = bisect.bisect_right(self._last_checked, most_seconds)
+            positions = sorted(self._last_checked_positions[:end])
+        else:
+            positions = range(len(self.proxies))
+
+        proxies = [self.proxies[position] for position in positions]
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = proxies
+        return proxies
+
+    def filter(self, attributes: dict, healthy: bool = False) -> list:
+        """
+        Gets all proxies that match every attribute in `attributes`.
+
+        Args:
+            attributes: `dict` of pairs of valid `Proxy` attributes,
+                and their desired value. `last_checked` is the most
+                seconds since the proxy was last checked.
+            healthy: Set to `True` to leave out proxies whose
+                `ProxyHealth` is not available.
+
+        Returns:
+            `list` of matching `Proxy` objects, in their original order.
+            Empty if any attribute is not a valid `Proxy` attribute.
+        """
+        proxies = self._match(attributes)
+        if healthy:
+            return [proxy for proxy in proxies if proxy.health.is_available()]
+
+        return list(proxies)
+
+    def choice(self, attributes: dict):
+        """Gets a random healthy proxy matching `attributes`, or `None`."""
+        proxies = self._match(attributes)
+        if not proxies:
+            return None
+
+        # Health changes over time, so it is checked on the picked proxy
+        # instead of being cached with the matches.
+        for _ in range(self.CHOICE_ATTEMPTS):
+            proxy = random.choice(proxies)
+            if proxy.health.acquire():
+                return proxy
+
+        return ProxyHealth.pick(proxies)
+
+    def extract_by_type(self, attributes: dict, single: bool = False):
+        """
+        Filters the index the same way as `Proxies.extract_by_type`.
+
+        Prints the `attributes` and returns `None` if no proxies match.
+        A single proxy is only picked from the healthy ones, and `None`
+        is returned if none of them are.
+        """
+        proxies = self.filter(attributes)
+
+        if single and proxies:
+            proxy = self.choice(attributes)
+            if proxy is None:
+                print("Every proxy matching the given _parameters is failing.")
+            return proxy
+
+        elif not proxies:
+            # If no proxies have all the `attributes`, an index error is raised.
+            print("No proxies match the given _parameters:")
+            for attr_name, proxy_value in attributes.items():
+                print(f"{attr_name}: {proxy_value}")
+
+        else:
+            # If any proxies had all specified attributes
+            return proxies
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+from json_codec import JsonCodec
+import argparse
+import tracemalloc
+import glob
+import sys
+import os
+
+
+class UserRegistry:
+    """
+    Identity map that keeps a single `User` object for each account.
+
+    The same accounts show up in the likes, comments and tags of many
+    posts. Registering every `User` here means each account is only
+    looked up and held in memory once, however many posts it appears
+    in. Usernames are interned as well, so every post refers to the
+    same string for an account instead of its own copy.
+
+    Examples:
+        registry = UserRegistry()
+        user = registry.add(user)
+        registry.get_by_username("instagram")
+        registry.intern_post(post)
+
+    Attributes:
+        _by_id (dict): `User` of each account id.
+        _by_username (dict): `User` of each username.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_username = {}
+
+    def __len__(self):
+        return len(self._by_username)
+
+    def __contains__(self, username: str):
+        return username in self._by_username
+
+    @staticmethod
+    def intern(username: str) -> str:
+        """Gets the shared copy of `username`."""
+        return sys.intern(username) if username else username
+
+    def add(self, user):
+        """
+        Registers a `User`, and gets the single instance of its account.
+
+        If the account is already registered, that instance is updated
+        with the attributes of `user` and returned instead, so anything
+        already holding it sees the newer data.
+
+        Args:
+            user: `User` to register.
+
+        Returns:
+            The registered `User` of the account.
+        """
+        user.username = self.intern(user.username)
+        existing = self._by_id.get(user.id) if user.id is not None else None
+        if existing is None:
+            existing = self._by_username.get(user.username)
+
+        if existing is None:
+            existing = user
+        elif existing is not user:
+            if existing.username != user.username:
+                # The account was renamed
+                self._by_username.pop(existing.username, None)
+            existing.__dict__.update(user.__dict__)
+
+        if existing.id is not None:
+            self._by_id[existing.id] = existing
+        self._by_username[existing.username] = existing
+        return existing
+
+    def get(self, account_id: str):
+        """Gets the `User` of an account id, or `None` if it isn't registered."""
+        return self._by_id.get(account_id)
+
+    def get_by_username(self, username: str):
+        """Gets the `User` of a username, or `None` if it isn't registered."""
+        return self._by_username.get(username)
+
+    def intern_post(self, post) -> None:
+        """
+        Swaps the usernames in a `Post` for their shared copies, and any
+        `User` objects in it for the registered ones.
+        """
+        if getattr(post, "pk", None) is None:
+            # Invalid posts are left without any attributes
+            return
+
+        post.username = self.intern(post.username)
+        post.caption.username = self.intern(post.caption.username)
+        post.users_tagged = [self.intern(username) for username in post.users_tagged]
+        post.likes = {self.intern(username): (self.add(user) if user else
+                                              self._by_username.get(username))
+                      for username, user in post.likes.items()}
+
+        comments = {}
+        for username, comment in post.comments.items():
+            comment.username = self.intern(comment.username)
+            if comment.user:
+                comment.user = self.add(comment.user)
+            else:
+                comment.user = self._by_username.get(comment.username)
+            comments[self.intern(username)] = comment
+        post.comments = comments
+
+
+def measure_posts(filepaths: list, users_dir: str, registry: UserRegistry = None) -> tuple:
+    """
+    Measures the memory taken by saved posts and the users in them.
+
+    Each like and comment gets a `User` from `users_dir`, read once per
+    occurrence, the same as when every post looks up its own users.
+
+    Args:
+        filepaths: Post json files to load.
+        users_dir: Directory of user json files.
+        registry: `UserRegistry` to share users and usernames through.
+
+    Returns:
+        `tuple` of the loaded `Post` objects, and the bytes allocated
+        while loading them.
+    """
+    from instagram_data import Post, User
+
+    def load_user(username):
+        filepath = os.path.join(users_dir, f"{username}.json")
+        if not os.path.exists(filepath):
+            return None
+        if registry is not None and username in registry:
+            return registry.get_by_username(username)
+        with open(filepath, 'rb') as file:
+            return User(username, JsonCodec.load(file), save=False)
+
+    tracemalloc.start()
+    posts = []
+    for filepath in filepaths:
+        with open(filepath, 'rb') as file:
+            post = Post(JsonCodec.load(file), save=False)
+        if getattr(post, "pk", None) is None:
+            continue
+
+        for username in post.likes:
+            post.likes[username] = load_user(username)
+        for comment in post.comments.values():
+            comment.user = post.likes.get(comment.username) or load_user(comment.username)
+        if registry is not None:
+            registry.intern_post(post)
+        posts.append(post)
+
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return posts, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the memory of saved posts with and without a UserRegistry."
+    )
+    parser.add_argument("--posts", default="json/posts")
+    parser.add_argument("--users", default="json/users")
+    arguments = parser.parse_args()
+
+    post_files = sorted(glob.glob(f"{arguments.posts}/*.json"))
+    if not post_files:
+        print(f"No posts found in '{arguments.posts}'.")
+    else:
+        posts, before = measure_posts(post_files, arguments.users)
+        user_count = len({id(user) for post in posts for user in post.likes.values() if user}
+                         | {id(comment.user) for post in posts
+                            for comment in post.comments.values() if comment.user})
+        del posts
+
+        user_registry = UserRegistry()
+        posts, after = measure_posts(post_files, arguments.users, user_registry)
+        print(f"{len(posts)} posts")
+        print(f"Without registry: {before / 1024 / 1024:.1f}MB, {user_count} User objects")
+        print(f"With registry:    {after / 1024 / 1024:.1f}MB, {len(user_registry)} User objects")
@@ -0,0 +1,598 @@
+from abc import ABC, abstractmethod
+import socketserver
+import argparse
+import threading
+import socket
+import fnmatch
+import time
+
+
+class WorkQueue(ABC):
+    """
+    Interface for queues of usernames and shortcodes to crawl.
+
+    `UserManager` and `PostManager` only use these methods, so any
+    backend can feed them. Workers claim a batch of items, which leases
+    them for `lease_timeout` seconds. While working, they call
+    `heartbeat` to keep the lease, and then report each item with
+    `complete` or `fail`. Items whose lease runs out are handed to
+    another worker.
+
+    Backends:
+        CrawlFrontier: SQLite file, for workers on a single machine.
+        RedisWorkQueue: Redis server, for workers on many machines.
+
+    Attributes:
+        lease_timeout (int): Seconds before a claimed item can be
+            claimed again.
+        max_attempts (int): Most times an item is claimed before it's
+            marked as failed.
+    """
+
+    USERNAME = "username"
+    SHORTCODE = "shortcode"
+
+    PENDING = "pending"
+    IN_FLIGHT = "in-flight"
+    DONE = "done"
+    FAILED = "failed"
+
+    lease_timeout = 300
+    max_attempts = 3
+
+    @abstractmethod
+    def add(self, kind: str, items: list, priority: int = 0) -> int:
+        """Adds new `items`, returning how many were not already added."""
+        pass
+
+    @abstractmethod
+    def claim(self, kind: str, limit: int = 10) -> list:
+        """Leases up to `limit` items, highest priority first."""
+        pass
+
+    @abstractmethod
+    def heartbeat(self, kind: str, items: list) -> None:
+        """Renews the lease on claimed `items`."""
+        pass
+
+    @abstractmethod
+    def complete(self, kind: str, item: str) -> None:
+        """Marks `item` as successfully crawled."""
+        pass
+
+    @abstractmethod
+    def fail(self, kind: str, item: str, error: str = "", retry: bool = True) -> None:
+        """Records a failed attempt, requeueing `item` if `retry` is `True`."""
+        pass
+
+    @abstractmethod
+    def counts(self, kind: str) -> dict:
+        """Gets how many items of `kind` are in each state."""
+        pass
+
+
+class RedisError(Exception):
+    """Error reply sent back by a Redis server."""
+
+
+class RedisConnection:
+    """
+    Minimal client for the Redis protocol.
+
+    Only sends commands and reads their replies, which is all
+    `RedisWorkQueue` needs. Works with a real Redis server, or with
+    `LocalRedisServer`.
+
+    Attributes:
+        host (str): Host of the Redis server.
+        port (int): Port of the Redis server.
+        _socket (socket.socket): Connection to the server.
+        _file (io.BufferedReader): Buffered reader over `_socket`.
+        lock (threading.RLock): Lock so a connection can be shared
+            between threads. Hold it to send several commands, such as
+            a transaction, without commands from other threads between
+            them.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, timeout: int = 30):
+        self.host = host
+        self.port = port
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._socket.makefile('rb')
+        self.lock = threading.RLock()
+
+    def execute(self, *command) -> any:
+        """
+        Sends a single command and returns its reply.
+
+        Examples:
+            execute("ZADD", "queue", 1, "item")
+
+        Raises:
+            RedisError: If the server replied with an error.
+        """
+        with self.lock:
+            self._socket.sendall(self.encode(command))
+            return self.read_reply(self._file)
+
+    @staticmethod
+    def encode(command: tuple) -> bytes:
+        """Encodes `command` as a Redis protocol array of strings."""
+        parts = [f"*{len(command)}\r\n".encode()]
+        for argument in command:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode()
+            parts.append(f"${len(argument)}\r\n".encode())
+            parts.append(argument + b"\r\n")
+
+        return b"".join(parts)
+
+    @staticmethod
+    def read_reply(file) -> any:
+        """Reads a single Redis protocol reply from `file`."""
+        line = file.readline()
+        if not line:
+            raise ConnectionError("Redis server closed the connection.")
+
+        prefix, data = line[:1], line[1:-2]
+        if prefix == b"+":
+            return data.decode()
+        elif prefix == b"-":
+            raise RedisError(data.decode())
+        elif prefix == b":":
+            return int(data)
+        elif prefix == b"$":
+            length = int(data)
+            if length == -1:
+                return None
+            return file.read(length + 2)[:-2].decode()
+        elif prefix == b"*":
+            length = int(data)
+            if length == -1:
+                return None
+            return [RedisConnection.read_reply(file) for _ in range(length)]
+
+        raise RedisError(f"Unknown reply: {line!r}")
+
+    def close(self) -> None:
+        """Closes the connection to the server."""
+        self._file.close()
+        self._socket.close()
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    `WorkQueue` stored on a Redis server, shared by workers on any node.
+
+    Each kind of item uses these keys, under `prefix`:
+        pending: Sorted set of items waiting to be claimed.
+        leases: Sorted set of claimed items, scored by when their lease
+            runs out.
+        seen: Set of every item ever added, so items are only added
+            once.
+        done / failed: Sets of finished items.
+        attempts / errors: Hashes of claim counts and failure reasons.
+        priorities: Hash of the priority each item was added with, so
+            requeued items keep it.
+
+    Claims, requeues, completions and failures each run in a single
+    `MULTI`/`EXEC` transaction, with `WATCH` on the keys they read, so
+    an item is never left out of both `pending` and `leases`, and two
+    workers can't both requeue the same expired lease.
+
+    Run a local stand-in server with:
+        python work_queue.py serve --port 6379
+
+    Attributes:
+        prefix (str): Prefix for every key used by the queue.
+        _redis (RedisConnection): Connection to the server.
+    """
+
+    def __init__(self,
+                 host: str = "localhost",
+                 port: int = 6379,
+                 prefix: str = "instagram",
+                 lease_timeout: int = 300,
+                 max_attempts: int = 3,
+                 ):
+        self.prefix = prefix
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._redis = RedisConnection(host, port)
+
+    def _key(self, kind: str, name: str) -> str:
+        """Creates the key for the `name` structure of `kind` items."""
+        return f"{self.prefix}:{kind}:{name}"
+
+    def _get_score(self, priority: int) -> float:
+        """Scores an item, so higher priorities and older items pop first."""
+        order = self._redis.execute("INCR", f"{self.prefix}:order")
+        return priority * 1e12 - order
+
+    def _transaction(self, watched: list, prepare) -> [list, None]:
+        """
+        Runs commands atomically, trying again whenever another client
+        changes one of the `watched` keys first.
+
+        Args:
+            watched: Keys that `prepare` reads from.
+            prepare: Function that reads what it needs and returns the
+                commands to run, or `None` to run nothing.
+
+        Returns:
+            `list` of the replies to the commands, or `None` if nothing
+            was run.
+        """
+        with self._redis.lock:
+            while True:
+                if watched:
+                    self._redis.execute("WATCH", *watched)
+                commands = prepare()
+                if not commands:
+                    if watched:
+                        self._redis.execute("UNWATCH")
+                    return None
+
+                self._redis.execute("MULTI")
+                for command in commands:
+                    self._redis.execute(*command)
+                replies = self._redis.execute("EXEC")
+                if replies is not None:
+                    return replies
+
+    def _get_requeue(self, kind: str, item: str) -> tuple:
+        """Gets the command that puts `item` back in pending, with its priority."""
+        priority = int(self._redis.execute("HGET", self._key(kind, "priorities"), item) or 0)
+        return "ZADD", self._key(kind, "pending"), self._get_score(priority), item
+
+    def _get_attempts(self, kind: str, item: str) -> int:
+        return int(self._redis.execute("HGET", self._key(kind, "attempts"), item) or 0)
+
+    def add(self, kind: str, items: list, priority: int = 0) -> int:
+        added = 0
+        for item in items:
+            if self._redis.execute("SADD", self._key(kind, "seen"), item):
+                self._redis.execute("HSET", self._key(kind, "priorities"), item, priority)
+                self._redis.execute("ZADD", self._key(kind, "pending"),
+                                    self._get_score(priority), item)
+                added += 1
+
+        return added
+
+    def _expire(self, kind: str, item: str, now: float) -> None:
+        """
+        Requeues an item whose worker stopped sending heartbeats, or
+        fails it if it has been claimed too many times already.
+        """
+        leases = self._key(kind, "leases")
+
+        def prepare():
+            expiry = self._redis.execute("ZSCORE", leases, item)
+            if expiry is None or float(expiry) > now:
+                # Already handled by another worker, or renewed
+                return None
+            if self._get_attempts(kind, item) < self.max_attempts:
+                return [("ZREM", leases, item), self._get_requeue(kind, item)]
+            return [("ZREM", leases, item),
+                    ("HSETNX", self._key(kind, "errors"), item, "Lease expired"),
+                    ("SADD", self._key(kind, "failed"), item)]
+
+        self._transaction([leases], prepare)
+
+    def claim(self, kind: str, limit: int = 10) -> list:
+        now = time.time()
+        for item in self._redis.execute("ZRANGEBYSCORE", self._key(kind, "leases"),
+                                        "-inf", now):
+            self._expire(kind, item, now)
+
+        pending = self._key(kind, "pending")
+        items = []
+
+        def prepare():
+            items[:] = self._redis.execute("ZREVRANGE", pending, 0, limit - 1)
+            if not items:
+                return None
+            # Popped, leased and counted together, so a worker that dies
+            # part way through can't lose any of them
+            commands = [("ZREM", pending, *items)]
+            commands.append(("ZADD", self._key(kind, "leases"),
+                             *[value for item in items
+                               for value in (now + self.lease_timeout, item)]))
+            commands.extend(("HINCRBY", self._key(kind, "attempts"), item, 1)
+                            for item in items)
+            return commands
+
+        self._transaction([pending], prepare)
+        return items
+
+    def heartbeat(self, kind: str, items: list) -> None:
+        expiry = time.time() + self.lease_timeout
+        for item in items:
+            # XX only renews leases that still exist
+            self._redis.execute("ZADD", self._key(kind, "leases"), "XX", expiry, item)
+
+    def complete(self, kind: str, item: str) -> None:
+        # Also removed from pending, in case its lease expired and it was
+        # requeued while this worker was still crawling it
+        self._transaction([], lambda: [("ZREM", self._key(kind, "leases"), item),
+                                       ("ZREM", self._key(kind, "pending"), item),
+                                       ("SADD", self._key(kind, "done"), item)])
+
+    def fail(self, kind: str, item: str, error: str = "", retry: bool = True) -> None:
+        leases = self._key(kind, "leases")
+
+        def prepare():
+            commands = [("ZREM", leases, item),
+                        ("HSET", self._key(kind, "errors"), item, error)]
+            if retry and self._get_attempts(kind, item) < self.max_attempts:
+                commands.append(self._get_requeue(kind, item))
+            else:
+                commands.append(("ZREM", self._key(kind, "pending"), item))
+                commands.append(("SADD", self._key(kind, "failed"), item))
+            return commands
+
+        self._transaction([leases, self._key(kind, "attempts")], prepare)
+
+    def counts(self, kind: str) -> dict:
+        return {
+            self.PENDING: self._redis.execute("ZCARD", self._key(kind, "pending")),
+            self.IN_FLIGHT: self._redis.execute("ZCARD", self._key(kind, "leases")),
+            self.DONE: self._redis.execute("SCARD", self._key(kind, "done")),
+            self.FAILED: self._redis.execute("SCARD", self._key(kind, "failed")),
+        }
+
+    def close(self) -> None:
+        """Closes the connection to the server."""
+        self._redis.close()
+
+
+class LocalRedisServer(socketserver.ThreadingTCPServer):
+    """
+    In-memory stand-in for a Redis server, for development and testing.
+
+    Only supports the commands used by `RedisWorkQueue`, and does not
+    save anything to disk. Use a real Redis server for actual crawls
+    across several nodes.
+
+    Examples:
+        server = LocalRedisServer(("localhost", 6379))
+        server.start()
+        ...
+        server.shutdown()
+
+    Attributes:
+        data (dict): Every key and its value.
+        versions (dict): How many times each key has been written to,
+            so transactions can tell if a watched key changed.
+        data_lock (threading.Lock): Lock so every command is atomic.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple = ("localhost", 6379)):
+        super().__init__(address, LocalRedisHandler)
+        self.data = {}
+        self.versions = {}
+        self.data_lock = threading.Lock()
+
+    def start(self) -> threading.Thread:
+        """Serves requests from a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class LocalRedisHandler(socketserver.StreamRequestHandler):
+    """
+    Runs the commands sent over a single `LocalRedisServer` connection.
+
+    Attributes:
+        queued (list): Commands sent since `MULTI`, or `None` outside of
+            a transaction.
+        watched (dict): Version of each key being watched.
+    """
+
+    # Commands that change the key they are given
+    WRITES = {"INCR", "SADD", "HSET", "HSETNX", "HINCRBY", "ZADD", "ZREM", "ZPOPMAX"}
+    # Commands that are run straight away inside a transaction
+    TRANSACTION = {"MULTI", "EXEC", "DISCARD", "WATCH", "UNWATCH"}
+
+    def setup(self):
+        super().setup()
+        self.queued = None
+        self.watched = {}
+
+    def handle(self):
+        while True:
+            try:
+                command = RedisConnection.read_reply(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+
+            name, arguments = command[0].upper(), command[1:]
+            if not hasattr(self, f"command_{name.lower()}"):
+                self.wfile.write(f"-ERR unknown command '{name}'\r\n".encode())
+                continue
+            if self.queued is not None and name not in self.TRANSACTION:
+                self.queued.append((name, arguments))
+                self.wfile.write(b"+QUEUED\r\n")
+                continue
+
+            try:
+                with self.server.data_lock:
+                    reply = self.run(name, arguments)
+            except (TypeError, ValueError) as error:
+                self.wfile.write(f"-ERR {error}\r\n".encode())
+            else:
+                self.wfile.write(self.encode_reply(reply))
+
+    def run(self, name: str, arguments: list) -> any:
+        """Runs a single command, noting which key it changed."""
+        reply = getattr(self, f"command_{name.lower()}")(*arguments)
+        if name in self.WRITES:
+            key = arguments[0]
+            self.server.versions[key] = self.server.versions.get(key, 0) + 1
+        return reply
+
+    @staticmethod
+    def encode_reply(reply: any) -> bytes:
+        """Encodes `reply` in the Redis protocol."""
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, bool) or isinstance(reply, int):
+            return f":{int(reply)}\r\n".encode()
+        if isinstance(reply, list):
+            return f"*{len(reply)}\r\n".encode() \
+                + b"".join(LocalRedisHandler.encode_reply(item) for item in reply)
+        reply = str(reply).encode()
+        return f"${len(reply)}\r\n".encode() + reply + b"\r\n"
+
+    def _get(self, key: str, default_type: type) -> any:
+        """Gets the value of `key`, creating an empty one if needed."""
+        return self.server.data.setdefault(key, default_type())
+
+    def command_ping(self):
+        return "PONG"
+
+    def command_watch(self, *keys):
+        for key in keys:
+            self.watched[key] = self.server.versions.get(key, 0)
+        return "OK"
+
+    def command_unwatch(self):
+        self.watched = {}
+        return "OK"
+
+    def command_multi(self):
+        if self.queued is not None:
+            raise ValueError("MULTI calls can not be nested")
+        self.queued = []
+        return "OK"
+
+    def command_discard(self):
+        if self.queued is None:
+            raise ValueError("DISCARD without MULTI")
+        self.queued = None
+        self.watched = {}
+        return "OK"
+
+    def command_exec(self):
+        if self.queued is None:
+            raise ValueError("EXEC without MULTI")
+        queued, self.queued = self.queued, None
+        watched, self.watched = self.watched, {}
+        if any(self.server.versions.get(key, 0) != version
+               for key, version in watched.items()):
+            # A watched key changed, so nothing is run
+            return None
+        return [self.run(name, arguments) for name, arguments in queued]
+
+    def command_incr(self, key):
+        self.server.data[key] = int(self.server.data.get(key, 0)) + 1
+        return self.server.data[key]
+
+    def command_sadd(self, key, *members):
+        values = self._get(key, set)
+        added = len(set(members) - values)
+        values.update(members)
+        return added
+
+    def command_scard(self, key):
+        return len(self.server.data.get(key, ()))
+
+    def command_hset(self, key, field, value):
+        values = self._get(key, dict)
+        added = field not in values
+        values[field] = value
+        return added
+
+    def command_hget(self, key, field):
+        return self.server.data.get(key, {}).get(field)
+
+    def command_hsetnx(self, key, field, value):
+        values = self._get(key, dict)
+        if field in values:
+            return 0
+        values[field] = value
+        return 1
+
+    def command_hincrby(self, key, field, amount):
+        values = self._get(key, dict)
+        values[field] = int(values.get(field, 0)) + int(amount)
+        return values[field]
+
+    def command_zadd(self, key, *arguments):
+        values = self._get(key, dict)
+        only_existing = arguments[0].upper() == "XX"
+        if only_existing:
+            arguments = arguments[1:]
+
+        added = 0
+        for score, member in zip(arguments[::2], arguments[1::2]):
+            if only_existing and member not in values:
+                continue
+            added += member not in values
+            values[member] = float(score)
+
+        return added
+
+    def command_zrem(self, key, *members):
+        values = self._get(key, dict)
+        return sum(values.pop(member, None) is not None for member in members)
+
+    def command_zscore(self, key, member):
+        score = self.server.data.get(key, {}).get(member)
+        return None if score is None else repr(score)
+
+    def command_zrevrange(self, key, start, stop):
+        values = self.server.data.get(key, {})
+        members = [member for member, _ in sorted(values.items(),
+                                                  key=lambda pair: (pair[1], pair[0]),
+                                                  reverse=True)]
+        stop = int(stop)
+        return members[int(start):None if stop == -1 else stop + 1]
+
+    def command_zcard(self, key):
+        return len(self.server.data.get(key, ()))
+
+    def command_zrangebyscore(self, key, minimum, maximum):
+        values = self.server.data.get(key, {})
+        return [member for member, score in sorted(values.items(), key=lambda pair: pair[1])
+                if float(minimum) <= score <= float(maximum)]
+
+    def command_zpopmax(self, key, count="1"):
+        values = self.server.data.get(key, {})
+        popped = sorted(values.items(), key=lambda pair: pair[1], reverse=True)[:int(count)]
+        reply = []
+        for member, score in popped:
+            del values[member]
+            reply.extend([member, repr(score)])
+        return reply
+
+    def command_keys(self, pattern):
+        return [key for key in self.server.data if fnmatch.fnmatchcase(key, pattern)]
+
+    def command_flushall(self):
+        for key in self.server.data:
+            self.server.versions[key] = self.server.versions.get(key, 0) + 1
+        self.server.data.clear()
+        return "OK"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run an in-memory stand-in for a Redis server."
+    )
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+        server = LocalRedisServer((arguments.host, arguments.port))
+        print(f"Serving on {arguments.host}:{arguments.port}. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()